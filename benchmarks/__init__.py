@@ -0,0 +1,10 @@
+"""
+Набор программ для сравнения скорости сборки EmuChunk, размера образа и оценочной стоимости между ревизиями.
+
+programs.PROGRAMS - представительные программы: вывод текста, арифметические циклы, несколько ядер,
+отрисовка сопрограммами и синтетические программы разного размера. harness измеряет их и сохраняет JSON.
+
+Запуск: python -m benchmarks [-o результат.json] [--compare старый.json] [программа ...]
+"""
+from benchmarks.harness import compare, measure, run
+from benchmarks.programs import PROGRAMS
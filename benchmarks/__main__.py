@@ -0,0 +1,17 @@
+import argparse
+
+from benchmarks.harness import compare, load, report, run, save
+
+parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Измерение программ benchmarks.PROGRAMS")
+parser.add_argument("programs", nargs="*", help="имена программ, по умолчанию все")
+parser.add_argument("-o", "--output", help="файл JSON для сохранения результатов")
+parser.add_argument("--compare", help="файл JSON предыдущих результатов для сравнения")
+parser.add_argument("--repeat", type=int, default=3, help="сборок для измерения времени")
+args = parser.parse_args()
+
+results = run(args.programs, args.repeat)
+print(report(results))
+if args.output:
+    save(results, args.output)
+if args.compare:
+    print(compare(load(args.compare), results))
@@ -0,0 +1,118 @@
+"""
+Измерение программ PROGRAMS: время сборки (построение программы и compile()), пиковая память сборки,
+размеры образа, сегмента данных и загрузчиков, оценка стоимости одного прохода точек входа ядер
+в инструкциях логики (estimator.CostEstimator). Результаты сохраняются в JSON для сравнения ревизий.
+"""
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+import loader
+from benchmarks.programs import PROGRAMS
+from emulator import EmuMachine
+from mindvm import EmuChunk
+
+# Метрики, по которым сравниваются результаты, и лучшее направление изменения: все - чем меньше, тем лучше
+METRICS = ("build_seconds", "peak_memory", "image_words", "data_words", "code_words", "far_words",
+           "plain_loader_lines", "packed_loader_lines", "packed_boot_instructions", "estimated_instructions")
+
+
+def measure(build: Callable[[], EmuChunk], repeat: int = 3) -> dict:
+    """Метрики одной программы, время - лучшее из repeat сборок, память - отдельной сборкой под tracemalloc."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build().compile()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        chunk = build()
+        artifact = chunk.compile()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    loaders = loader.stats(artifact.words)
+    return {
+        "build_seconds": min(times),
+        "peak_memory": peak,
+        "image_words": len(artifact),
+        "data_words": len(chunk.data),
+        "code_words": len(chunk.code),
+        "far_words": sum(map(len, artifact.far)),
+        "plain_loader_lines": loaders["plain"]["lines"],
+        "packed_loader_lines": loaders["packed"]["lines"],
+        "packed_boot_instructions": loaders["packed"]["instructions"],
+        "estimated_instructions": sum(chunk.estimate().entries.values()),
+        "optimizations": {name: count for name, count in chunk.optimizations.items() if count},
+    }
+
+
+def revision() -> str | None:
+    """Текущая ревизия git, None вне репозитория."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names=None, repeat: int = 3) -> dict:
+    """Измерение программ names (по умолчанию всех PROGRAMS)."""
+    names = list(names or PROGRAMS)
+    unknown = [name for name in names if name not in PROGRAMS]
+    if unknown:
+        raise ValueError(f"Unknown benchmarks {unknown}")
+    programs = {}
+    for name in names:
+        programs[name] = measure(PROGRAMS[name], repeat)
+        # Синтетические generated измеряют только сборку, остальные программы должны выполняться в bank1
+        # без клавиатуры и почтового ящика дисплея
+        words = programs[name]["image_words"]
+        if not name.startswith("generated") and words > EmuMachine.KEYBOARD:
+            raise ValueError(f"Benchmark {name} image of {words} words overlaps the keyboard at {EmuMachine.KEYBOARD}")
+    return {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "programs": programs,
+    }
+
+
+def save(results: dict, path: Path | str):
+    Path(path).write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+
+
+def load(path: Path | str) -> dict:
+    return json.loads(Path(path).read_text())
+
+
+def compare(old: dict, new: dict) -> str:
+    """Таблица изменений метрик программ, измеренных в обоих результатах."""
+    lines = [f"{old.get('revision')} -> {new.get('revision')}"]
+    for name, metrics in new["programs"].items():
+        before = old["programs"].get(name)
+        if before is None:
+            continue
+        lines.append(f"  {name}")
+        for metric in METRICS:
+            a, b = before.get(metric), metrics.get(metric)
+            if a is None or b is None:
+                continue
+            change = f"{(b - a) / a * 100:+.1f}%" if a else ("=" if a == b else "new")
+            lines.append(f"    {metric:26} {a:>14.6g} -> {b:<14.6g} {change}")
+    return "\n".join(lines)
+
+
+def report(results: dict) -> str:
+    """Таблица метрик результатов."""
+    lines = [f"revision {results.get('revision')}, python {results.get('python')}"]
+    for name, metrics in results["programs"].items():
+        lines.append(f"  {name}")
+        for metric in METRICS:
+            lines.append(f"    {metric:26} {metrics[metric]:g}")
+    return "\n".join(lines)
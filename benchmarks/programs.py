@@ -0,0 +1,174 @@
+"""
+Представительные программы EmuChunk. Каждая функция собирает новую программу и возвращает EmuChunk
+без компиляции: компиляцию выполняет и измеряет harness.
+"""
+from mindvm import EmuChunk, EmuDisplay, cprint
+
+
+def text() -> EmuChunk:
+    """Вывод текста: заставки и таблицы cprint/fprint со строками и числами."""
+    c = EmuChunk()
+    score = c.var()
+    for level in range(1, 13):
+        cprint(c, f"LEVEL {level}\nPLAYER ONE, SCORE {level * 100}")
+        c.fprint("HIGH SCORE = ", score, ", LIVES ", 3, "\n")
+        cprint(c, "PRESS ANY KEY TO CONTINUE.")
+        c.add_const(score, 10)
+    c.exit()
+    return c
+
+
+def arithmetic() -> EmuChunk:
+    """Вложенные арифметические циклы: сумма, произведение и остатки."""
+    c = EmuChunk()
+    i, j, total, product, temp = c.var(), c.var(), c.var(), c.var(1), c.var()
+    outer = c.label()
+    c[j] = 0
+    inner = c.label()
+    c.math(c.store_int(c.OPERATION_MUL), i, j, temp)
+    c.math(c.store_int(c.OPERATION_ADD), total, temp, total)
+    c.math(c.store_int(c.OPERATION_MOD), total, c.store_int(97), temp)
+    c.math(c.store_int(c.OPERATION_ADD), product, temp, product)
+    c.add_const(j, 1)
+    c.jump_neq_const(inner, j, 20)
+    c.add_const(i, 1)
+    c.jump_neq_const(outer, i, 20)
+    c.fprint("TOTAL ", total, " PRODUCT ", product)
+    c.exit()
+    return c
+
+
+def expressions() -> EmuChunk:
+    """Цикл обновления на выражениях: движение, столкновения и счет с общими подвыражениями."""
+    c = EmuChunk()
+    x, y, speed, player, points, hit = c.var(47), c.var(226), c.var(2), c.var(101), c.var(), c.var()
+    X, Y, speed_, player_ = c.expr(x), c.expr(y), c.expr(speed), c.expr(player)
+    frame = c.label()
+    moved = Y - speed_
+    c.assign_all([
+        (hit, (X == player_) * (moved < 55)),
+        (points, c.expr(points) + (moved < 0) * 10),
+        (y, moved),
+    ])
+    spawn = c.label(reassign=True)
+    c.jump_if(spawn, Y > -44)
+    c[y] = 226
+    c[x] = player_
+    c[speed] = speed_ + 1
+    c.label(spawn)
+    c.jump_if(frame, c.expr(hit) == 0)
+    c.fprint("GAME OVER ", points)
+    c.exit()
+    return c
+
+
+def threads() -> EmuChunk:
+    """Все ядра: параллельный цикл с барьером и ядра, запущенные goto_thread со счетчиками."""
+    c = EmuChunk()
+    acc = {thread: c.var() for thread in range(c.MAIN_THREAD, c.MAIN_THREAD + c.CORES)}
+
+    def body(index, thread):
+        c.math(c.store_int(c.OPERATION_ADD), acc[thread], index, acc[thread])
+
+    c.parallel_for(400, body)
+    counter = c.var()
+    worker = c.label(reassign=True)
+    c.goto_thread(3, worker)
+    c.wait_eq(counter, 100)
+    c.fprint("SUM ", acc[2], " COUNTER ", counter)
+    c.exit()
+    c.label(worker, inc_thread=True)
+    loop = c.label()
+    c.add_const(counter, 1)
+    c.jump_neq_const(loop, counter, 100)
+    c.exit()
+    return c
+
+
+def shaders() -> EmuChunk:
+    """
+    Отрисовка: сопрограммы с общими окончаниями в дополнительных банках, команды дисплея и очередь видеоядра.
+    """
+    c = EmuChunk(banks=3)
+    d = EmuDisplay(c)
+    x, y = c.var(), c.var(20)
+    skip = c.label()
+    c.jump(skip, c.NON_ZERO)
+    scenes = []
+    for n in range(6):
+        scenes.append(d.shader(
+            ("clear", 10 * n, 0, 40),
+            ("color", 255, 255 - 20 * n, 0, 255),
+            ("rect", x, y, 20 + n, 30),
+            ("stroke", 4),
+            ("line", 0, 0, x, y),
+            ("color", 0, 130, 0, 230),
+            ("poly", 88, 88, 6, 40, 0),
+            ("color", 255, 255, 255, 255),
+            ("rect", 84, y, 8, 70),
+            ("flush",),
+            bank=2 + n % 2,
+        ))
+    queue = d.alloc_queue()
+    c.label(skip)
+    for n, scene in enumerate(scenes):
+        d.shader_map(n, scene)
+    frame = c.label()
+    for n in range(len(scenes)):
+        d.shader_exec(n)
+    c.add_const(x, 3)
+    d.color(255, 0, 0)
+    d.rect(x, 10, 20, 20)
+    d.flush()
+    done = c.label(reassign=True)
+    c.jump_gt_const(done, x, 150)
+    c.jump(frame, c.NON_ZERO)
+    c.label(done)
+    d.start_queue(queue)
+    for n in range(10):
+        d.rect(x, n * 10, 5, 5)
+    d.flush()
+    c.exit()
+    return c
+
+
+def generated(size: int) -> EmuChunk:
+    """
+    Синтетическая программа примерно из size инструкций: переменные, константы, ветвления и вывод
+    в повторяющемся порядке, детерминированно для сравнения между ревизиями.
+    """
+    c = EmuChunk()
+    variables = [c.var(n) for n in range(32)]
+    labels = []
+    for n in range(size):
+        a, b = variables[n % 32], variables[n * 7 % 32]
+        kind = n % 8
+        if kind == 0:
+            labels.append(c.label())
+            c.add_const(a, n % 13 + 1)
+        elif kind == 1:
+            c.math(c.store_int(c.OPERATION_ADD), a, c.store_int(n % 50), b)
+        elif kind == 2:
+            c.math(c.store_int(c.OPERATION_MUL), a, b, a)
+        elif kind == 3:
+            c.jump_neq_const(labels[n * 3 % len(labels)], a, n % 5)
+        elif kind == 4:
+            c[b] = n % 100
+        elif kind == 5:
+            c.copy(a, b)
+        elif kind == 6:
+            c.jump_gt_const(labels[-1], b, n % 200)
+        else:
+            c.fprint("N", n % 10, " ", a)
+    c.exit()
+    return c
+
+
+PROGRAMS = {
+    "text": text,
+    "arithmetic": arithmetic,
+    "expressions": expressions,
+    "threads": threads,
+    "shaders": shaders,
+    **{f"generated_{size}": lambda size=size: generated(size) for size in (100, 1000, 10000)},
+}
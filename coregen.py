@@ -0,0 +1,654 @@
+"""
+Генератор программы ядра buildings/core.masm и таблицы переходов buildings/core_commands.masm
+по таблице кодов операций EmuChunk, а также контроллера ядер buildings/threads.masm.
+
+Каждому коду операции OP_* соответствует обработчик в HANDLERS, его строка записывается в таблицу переходов
+ячейки команд, поэтому нумерация кодов в EmuChunk и в программе ядра всегда совпадает.
+Математические операции и символы выбираются переходом по таблице через @counter, а не цепочкой сравнений.
+
+Запуск: python coregen.py - перезаписывает файлы в buildings.
+"""
+import re
+from pathlib import Path
+
+from mindvm import EmuChunk, EmuDisplay
+
+BUILDINGS = Path(__file__).parent / "buildings"
+
+IDLE_LINE = 6  # read configuring threads 0, начало цикла ожидания ядра
+FETCH_LINE = 10  # read i threads thread, чтение счетчика команд ядра
+DISPATCH_LINE = 13  # read @counter commands c
+PROLOGUE = DISPATCH_LINE - FETCH_LINE  # Инструкций от FETCH_LINE до диспетчеризации
+CELL_SIZE = 64  # Слов в ячейке памяти счетчиков команд ядер
+
+# Команды op логики для кодов математических операций EmuChunk, IRAND вычисляется отдельно
+MATH = {
+    "ADD": "add",
+    "SUB": "sub",
+    "MUL": "mul",
+    "DIV": "div",
+    "EQ": "equal",
+    "GT": "greaterThan",
+    "LT": "lessThan",
+    "NEQ": "notEqual",
+    "MOD": "mod",
+}
+
+
+class CoreProgram:
+    """Программа логики с символьными метками строк: {name} в тексте строки заменяется номером строки."""
+
+    def __init__(self):
+        self.lines = []
+        self.labels = {}
+
+    def label(self, name: str):
+        if name in self.labels:
+            raise ValueError(f"Label {name} already defined")
+        self.labels[name] = len(self.lines)
+
+    def emit(self, *lines: str):
+        self.lines.extend(lines)
+
+    def operand(self, name: str):
+        """Чтение следующего слова инструкции VM в переменную name."""
+        self.emit("op add i i 1", f"read {name} core i")
+
+    def tail(self):
+        """
+        Переход к следующему слову и проверка настройки ядра из IDLE_LINE, встроенные в обработчик
+        вместо перехода на общий конец.
+        """
+        self.emit(
+            "op add i i 1",
+            "write i threads thread",
+            "read configuring threads 0",
+            "jump {fetch} notEqual configuring thread",
+            "jump {idle} always 0 0",
+        )
+
+    def text(self) -> str:
+        return "\n".join(line.format(**self.labels) for line in self.lines)
+
+
+def _set(p: CoreProgram):
+    p.operand("j")
+    p.operand("d")
+    p.emit("write d core j")
+    p.tail()
+
+
+def _copy(p: CoreProgram):
+    p.operand("j")
+    p.operand("j2")
+    p.emit("read d core j2", "write d core j")
+    p.tail()
+
+
+def _echo(p: CoreProgram):
+    p.operand("j")
+    p.emit("read d core j", "print d")
+    p.tail()
+
+
+def _flush(p: CoreProgram):
+    p.emit("printflush message")
+    p.tail()
+
+
+def _math(p: CoreProgram):
+    for name in ("o", "a", "b", "r"):
+        p.operand(name)
+    operations = {value: name[len("OPERATION_"):] for name, value in vars(EmuChunk).items()
+                  if name.startswith("OPERATION_")}
+    count = max(operations) + 1
+    unknown = [name for name in operations.values() if name not in MATH and name != "IRAND"]
+    if unknown:
+        raise ValueError(f"No core implementation for math operations {unknown}")
+    p.emit(
+        "read o1 core o",
+        "read a1 core a",
+        "read b1 core b",
+        # Неизвестная операция оставляет предыдущий результат
+        "jump {math_write} lessThan o1 0",
+        f"jump {{math_write}} greaterThan o1 {count - 1}",
+        # Дробная часть номера операции отбрасывается при записи в @counter
+        "op add @counter o1 {math_table}",
+    )
+    p.label("math_table")
+    p.emit(*(f"jump {{math_{value}}} always 0 0" if value in operations else "jump {math_write} always 0 0"
+             for value in range(count)))
+    for value, name in sorted(operations.items()):
+        p.label(f"math_{value}")
+        if name == "IRAND":
+            p.emit("op sub rr1 b1 a1", "op rand r1 rr1 0", "op add r1 r1 a1", "op idiv r1 r1 1",
+                   "jump {math_write} always 0 0")
+        else:
+            p.emit(f"op {MATH[name]} r1 a1 b1", "write r1 core r")
+            p.tail()
+    p.label("math_write")
+    p.emit("write r1 core r")
+    p.tail()
+
+
+def _jump(p: CoreProgram):
+    p.operand("p")
+    p.operand("j")
+    p.emit("read v core j", "jump {next} equal v 0", "set i p")
+    p.tail()
+
+
+def _char(p: CoreProgram):
+    last = len(EmuChunk.CHARS) - 1
+    p.label("char_loop")
+    p.operand("j")
+    p.emit(
+        "read h core j",
+        "jump {next} equal h -1",
+        # Неизвестные символы пропускаются
+        "jump {char_loop} lessThan h 0",
+        f"jump {{char_loop}} greaterThan h {last}",
+        "op add @counter h {char_table}",
+    )
+    p.label("char_table")
+    p.emit(*(f"jump {{char_{n}}} always 0 0" for n in range(len(EmuChunk.CHARS))))
+    for n, char in enumerate(EmuChunk.CHARS):
+        if char == '"':
+            raise ValueError("Character \" can not be printed by logic")
+        p.label(f"char_{n}")
+        p.emit(f'print "{char}"'.replace("\n", "\\n"), "jump {char_loop} always 0 0")
+
+
+def _print(p: CoreProgram):
+    # Символы слова извлекаются с младших битов до нулевой группы, отрицательное слово - последнее в строке
+    p.label("print_word")
+    p.operand("w")
+    p.emit("op lessThan last w 0", "op abs w w")
+    p.label("print_char")
+    p.emit(
+        f"op and h w {(1 << EmuChunk.PRINT_BITS) - 1}",
+        f"op shr w w {EmuChunk.PRINT_BITS}",
+        "op add @counter h {print_table}",
+    )
+    p.label("print_table")
+    p.emit("jump {print_end} always 0 0", *(f"jump {{print_{n}}} always 0 0" for n in range(len(EmuChunk.CHARS))))
+    for n, char in enumerate(EmuChunk.CHARS):
+        p.label(f"print_{n}")
+        p.emit(f'print "{char}"'.replace("\n", "\\n"), "jump {print_char} always 0 0")
+    p.label("print_end")
+    p.emit("jump {print_word} equal last 0")
+    p.tail()
+
+
+def _control_thread(p: CoreProgram):
+    p.operand("j")
+    p.emit("read t core j")
+    p.operand("j")
+    p.emit("op add j j 1", "write j threads t")
+    p.tail()
+
+
+def _const(operation: str):
+    def handler(p: CoreProgram):
+        p.operand("aa")
+        p.emit("read aav core aa")
+        p.operand("vv")
+        p.emit(f"op {operation} ra aav vv", "write ra core aa")
+        p.tail()
+
+    return handler
+
+
+def _jump_const(skip: str):
+    def handler(p: CoreProgram):
+        p.operand("p")
+        p.operand("jj")
+        p.emit("read jv core jj")
+        p.operand("js")
+        p.emit(f"jump {{next}} {skip} jv js", "set i p")
+        p.tail()
+
+    return handler
+
+
+def _set_4(p: CoreProgram):
+    for name in ("j", "q1", "q2", "q3", "q4"):
+        p.operand(name)
+    p.emit(
+        "write q1 core j",
+        "op add j j 1",
+        "write q2 core j",
+        "op add j j 1",
+        "write q3 core j",
+        "op add j j 1",
+        "write q4 core j",
+    )
+    p.tail()
+
+
+def _const_rand(p: CoreProgram):
+    p.operand("ar")
+    p.operand("qr")
+    p.emit("op rand rr ar 0", "write rr core qr")
+    p.tail()
+
+
+def _goto_thread(p: CoreProgram):
+    p.operand("tri")
+    p.operand("trl")
+    p.label("goto_lock")
+    # Рукопожатие через ячейку ядер: целевое ядро меняет счетчик между инструкциями
+    p.emit("read curconf threads 0", "jump {goto_lock} notEqual curconf -1", "write tri threads 0",
+           "write 1234 threads 1")
+    p.label("goto_wait")
+    p.emit("read trw threads 1", "jump {goto_wait} notEqual trw 1", "write trl threads tri", "write -1 threads 0")
+    p.tail()
+
+
+def _wait_eq(p: CoreProgram):
+    p.emit("set ws i")
+    p.operand("wj")
+    p.operand("wv")
+    p.label("wait_loop")
+    # Ожидание внутри обработчика, пока ядро не настраивают и его счетчик не изменили
+    p.emit(
+        "read wr core wj",
+        "jump {next} equal wr wv",
+        "read configuring threads 0",
+        "jump {idle} equal configuring thread",
+        "read wi threads thread",
+        "jump {wait_loop} equal wi ws",
+        "jump {fetch} always 0 0",
+    )
+
+
+def _jump_neq_set(p: CoreProgram):
+    p.operand("p")
+    p.operand("jj")
+    p.emit("read jv core jj")
+    p.operand("js")
+    p.operand("jn")
+    p.emit("jump {jump_neq_set_write} equal jv js", "set i p")
+    p.tail()
+    p.label("jump_neq_set_write")
+    p.emit("write jn core jj")
+    p.tail()
+
+
+def _add_jump_gt(p: CoreProgram):
+    p.operand("aa")
+    p.emit("read aav core aa")
+    p.operand("vv")
+    p.emit("op add ra aav vv", "write ra core aa")
+    p.operand("p")
+    p.operand("js")
+    p.emit("jump {next} lessThanEq ra js", "set i p")
+    p.tail()
+
+
+def _draw(p: CoreProgram):
+    p.emit("set ds i")
+    p.operand("dq")
+    p.operand("dc")
+    p.operand("dn")
+    p.emit(
+        "read dt core dq",
+        "op add da dq 2",
+        "read dsz core da",
+        "op add dnx dt 1",
+        "op mod dnx dnx dsz",
+        "op sub da da 1",
+        "read dh core da",
+        # Очередь заполнена: инструкция выполнится снова при следующей выборке
+        "jump {draw_full} equal dnx dh",
+        f"op mul da dt {EmuDisplay.QUEUE_SLOT}",
+        "op add da da dq",
+        f"op add da da {EmuDisplay.QUEUE_HEADER}",
+        "write dc core da",
+        # Переход внутрь развернутого цикла копирования, чтобы скопировать dn последних аргументов
+        "op mul dd dn -5",
+        "op add @counter dd {draw_end}",
+    )
+    for _ in range(EmuDisplay.QUEUE_SLOT - 1):
+        p.emit("op add i i 1", "read dr core i", "read dv core dr", "op add da da 1", "write dv core da")
+    p.label("draw_end")
+    p.emit("write dnx core dq")
+    p.tail()
+    p.label("draw_full")
+    p.emit("set i ds", "jump {store} always 0 0")
+
+
+def _stack(p: CoreProgram):
+    """
+    Адрес области стека возвратов ядра в ca: глубина и STACK_DEPTH адресов возврата. Стек из областей
+    EmuChunk(cores=...) ядер начиная с MAIN_THREAD выделяется при сборке, запуск других ядер там же запрещен.
+    """
+    p.operand("cb")
+    p.emit(
+        f"op sub ca thread {EmuChunk.MAIN_THREAD}",
+        f"op mul ca ca {EmuChunk.STACK_DEPTH + 1}",
+        "op add ca ca cb",
+        "read cs core ca",
+    )
+
+
+def _call(p: CoreProgram):
+    _stack(p)
+    p.operand("cp")
+    # Сохраняется адрес последнего слова инструкции, возврат продолжает выполнение с шага после него
+    p.emit("op add cs cs 1", "write cs core ca", "op add cw ca cs", "write i core cw", "set i cp")
+    p.tail()
+
+
+def _ret(p: CoreProgram):
+    _stack(p)
+    p.emit("op add cw ca cs", "read i core cw", "op sub cs cs 1", "write cs core ca")
+    p.tail()
+
+
+def _far(p: CoreProgram, name: str, line: str):
+    """
+    Выбор банка по адресу карты памяти fa переходом по таблице, line - чтение или запись слова fo банка {bank}.
+    Адреса вне карты памяти пропускаются.
+    """
+    p.emit(
+        f"op idiv fb fa {EmuChunk.BANK_SIZE}",
+        f"op mod fo fa {EmuChunk.BANK_SIZE}",
+        "jump {next} lessThan fa 0",
+        f"jump {{next}} greaterThanEq fb {EmuChunk.MAX_BANKS}",
+        "op mul fb fb 2",
+        f"op add @counter fb {{{name}_table}}",
+    )
+    p.label(f"{name}_table")
+    for bank in range(1, EmuChunk.MAX_BANKS + 1):
+        p.emit(line.format(bank=f"bank{bank}"), f"jump {{{name}_end}} always 0 0")
+    p.label(f"{name}_end")
+
+
+def _load_far(p: CoreProgram):
+    p.operand("j")
+    p.operand("fa")
+    _far(p, "load_far", "read fv {bank} fo")
+    p.emit("write fv core j")
+    p.tail()
+
+
+def _store_far(p: CoreProgram):
+    p.operand("fa")
+    p.operand("j")
+    p.emit("read fv core j")
+    _far(p, "store_far", "write fv {bank} fo")
+    p.tail()
+
+
+def _load_indirect(p: CoreProgram):
+    p.operand("j")
+    p.operand("b")
+    p.operand("x")
+    p.emit("read x1 core x", "op add b b x1", "read d core b", "write d core j")
+    p.tail()
+
+
+def _store_indirect(p: CoreProgram):
+    p.operand("b")
+    p.operand("x")
+    p.operand("j")
+    p.emit("read x1 core x", "op add b b x1", "read d core j", "write d core b")
+    p.tail()
+
+
+def _memcpy(p: CoreProgram):
+    """Копирование n слов из j в b циклом внутри обработчика, при b > j - с конца, как memmove."""
+    p.operand("b")
+    p.operand("j")
+    p.operand("n")
+    p.emit(
+        "jump {next} lessThanEq n 0",
+        "jump {memcpy_back} greaterThan b j",
+        "op add n n j",
+    )
+    p.label("memcpy_loop")
+    p.emit(
+        "read d core j",
+        "write d core b",
+        "op add j j 1",
+        "op add b b 1",
+        "jump {memcpy_loop} lessThan j n",
+    )
+    p.tail()
+    p.label("memcpy_back")
+    p.emit("set e j", "op sub n n 1", "op add j j n", "op add b b n")
+    p.label("memcpy_back_loop")
+    p.emit(
+        "read d core j",
+        "write d core b",
+        "op sub j j 1",
+        "op sub b b 1",
+        "jump {memcpy_back_loop} greaterThanEq j e",
+    )
+    p.tail()
+
+
+def _memset(p: CoreProgram):
+    p.operand("b")
+    p.operand("j")
+    p.operand("n")
+    p.emit("read d core j", "jump {next} lessThanEq n 0", "op add n n b")
+    p.label("memset_loop")
+    p.emit("write d core b", "op add b b 1", "jump {memset_loop} lessThan b n")
+    p.tail()
+
+
+# Обработчики кодов операций, OP_EXIT - сохранение счетчика без перехода к следующему слову
+HANDLERS = {
+    "OP_EXIT": None,
+    "OP_SET": _set,
+    "OP_COPY": _copy,
+    "OP_ECHO": _echo,
+    "OP_FLUSH": _flush,
+    "OP_MATH": _math,
+    "OP_JUMP": _jump,
+    "OP_CHAR": _char,
+    "OP_CONTROL_THREAD": _control_thread,
+    "OP_ADD_CONST": _const("add"),
+    "OP_SUB_CONST": _const("sub"),
+    "OP_MUL_CONST": _const("mul"),
+    "OP_JUMP_NEQ_CONST": _jump_const("equal"),
+    "OP_JUMP_GT_CONST": _jump_const("lessThanEq"),
+    "OP_SET_4": _set_4,
+    "OP_CONST_RAND": _const_rand,
+    "OP_GOTO_THREAD": _goto_thread,
+    "OP_WAIT_EQ": _wait_eq,
+    "OP_JUMP_NEQ_SET": _jump_neq_set,
+    "OP_ADD_JUMP_GT": _add_jump_gt,
+    "OP_DRAW": _draw,
+    "OP_CALL": _call,
+    "OP_RET": _ret,
+    "OP_LOAD_FAR": _load_far,
+    "OP_STORE_FAR": _store_far,
+    "OP_PRINT": _print,
+    "OP_LOAD_INDIRECT": _load_indirect,
+    "OP_STORE_INDIRECT": _store_indirect,
+    "OP_MEMCPY": _memcpy,
+    "OP_MEMSET": _memset,
+}
+
+
+# Стоимость обработчиков в инструкциях логики от строки после диспетчеризации до перехода на FETCH_LINE,
+# должна совпадать с текстом обработчиков. Для переходов VM: (переход не выполняется, выполняется)
+OPERAND = 2  # op add i i 1, read
+TAIL = 4  # Шаг, запись счетчика, проверка настройки ядра, переход к выборке
+DISPATCH = PROLOGUE + 1  # Выборка кода операции и read @counter
+COSTS = {
+    "OP_EXIT": TAIL - 1,
+    "OP_SET": 2 * OPERAND + 1 + TAIL,
+    "OP_COPY": 2 * OPERAND + 2 + TAIL,
+    "OP_ECHO": OPERAND + 2 + TAIL,
+    "OP_FLUSH": 1 + TAIL,
+    "OP_JUMP": (2 * OPERAND + 2 + TAIL, 2 * OPERAND + 3 + TAIL),
+    "OP_CONTROL_THREAD": 2 * OPERAND + 3 + TAIL,
+    "OP_ADD_CONST": 2 * OPERAND + 3 + TAIL,
+    "OP_SUB_CONST": 2 * OPERAND + 3 + TAIL,
+    "OP_MUL_CONST": 2 * OPERAND + 3 + TAIL,
+    "OP_JUMP_NEQ_CONST": (3 * OPERAND + 2 + TAIL, 3 * OPERAND + 3 + TAIL),
+    "OP_JUMP_GT_CONST": (3 * OPERAND + 2 + TAIL, 3 * OPERAND + 3 + TAIL),
+    "OP_SET_4": 5 * OPERAND + 7 + TAIL,
+    "OP_CONST_RAND": 2 * OPERAND + 2 + TAIL,
+    "OP_GOTO_THREAD": 2 * OPERAND + 8 + TAIL,  # Без ожидания в рукопожатии
+    "OP_WAIT_EQ": 2 * OPERAND + 3 + TAIL,  # Условие уже выполнено
+    "OP_JUMP_NEQ_SET": (4 * OPERAND + 3 + TAIL, 4 * OPERAND + 3 + TAIL),
+    "OP_ADD_JUMP_GT": (4 * OPERAND + 4 + TAIL, 4 * OPERAND + 5 + TAIL),
+    "OP_CALL": 2 * OPERAND + 4 + 5 + TAIL,
+    "OP_RET": OPERAND + 4 + 4 + TAIL,
+    "OP_LOAD_FAR": 2 * OPERAND + 6 + 2 + 1 + TAIL,  # Адрес в карте памяти
+    "OP_STORE_FAR": 2 * OPERAND + 1 + 6 + 2 + TAIL,
+    "OP_LOAD_INDIRECT": 3 * OPERAND + 4 + TAIL,
+    "OP_STORE_INDIRECT": 3 * OPERAND + 4 + TAIL,
+}
+MATH_COST = 4 * OPERAND + 3 + 2 + 2 + 2 + TAIL  # Чтение, проверки номера, переход по таблице, операция и запись
+IRAND_COST = MATH_COST + 4
+CHAR_COST = OPERAND + 8  # На каждый символ: чтение, проверки, переход по таблице, print, возврат в цикл
+CHAR_END = OPERAND + 2 + TAIL  # Чтение ссылки на -1 и переход к следующей инструкции
+PRINT_CHAR = 6  # На каждый символ OP_PRINT: выделение, сдвиг, переход по таблице, print, возврат в цикл
+PRINT_WORD = OPERAND + 2 + 5  # На каждое слово: чтение, знак, выделение нулевой группы и переход по ней
+DRAW_COST = 1 + 3 * OPERAND + 8 + 4 + 2 + 1 + TAIL  # Очередь не заполнена
+DRAW_ARG = 5
+WAIT_SPIN = 6  # Одна итерация ожидания OP_WAIT_EQ
+MEMCPY_COST = (3 * OPERAND + 3 + TAIL, 3 * OPERAND + 6 + TAIL)  # Копирование вперед и с конца, без слов
+MEMCPY_WORD = 5  # На каждое слово OP_MEMCPY: чтение, запись, два сдвига и проверка
+MEMSET_COST = 3 * OPERAND + 3 + TAIL
+MEMSET_WORD = 3
+
+
+def cost(chunk: EmuChunk, item) -> tuple[int, int]:
+    """
+    Инструкции логики на выполнение инструкции VM вместе с диспетчеризацией: (наименьшее, наибольшее).
+    Ожидание OP_WAIT_EQ, OP_GOTO_THREAD и заполненной очереди OP_DRAW не учитывается.
+    """
+    opcode = item.opcode
+    if opcode == EmuChunk.OP_MATH:
+        operation = chunk.constant(item.words[1])
+        if operation is None:
+            low, high = MATH_COST, IRAND_COST
+        else:
+            low = high = IRAND_COST if operation == EmuChunk.OPERATION_IRAND else MATH_COST
+    elif opcode == EmuChunk.OP_CHAR:
+        low = high = CHAR_COST * (len(item.words) - 2) + CHAR_END
+    elif opcode == EmuChunk.OP_PRINT:
+        words = item.words[1:]
+        low = high = PRINT_CHAR * len(EmuChunk.unpack_text(words)) + PRINT_WORD * len(words) + TAIL
+    elif opcode == EmuChunk.OP_DRAW:
+        low = high = DRAW_COST + DRAW_ARG * (len(item.words) - 4)
+    elif opcode in (EmuChunk.OP_MEMCPY, EmuChunk.OP_MEMSET):
+        count = item.words[3] if isinstance(item.words[3], int) and item.words[3] > 0 else 0
+        if opcode == EmuChunk.OP_MEMCPY:
+            low, high = (cost + MEMCPY_WORD * count for cost in MEMCPY_COST)
+        else:
+            low = high = MEMSET_COST + MEMSET_WORD * count
+    else:
+        name = next(name for name, value in opcodes().items() if value == opcode)
+        low = high = COSTS[name]
+        if isinstance(low, tuple):
+            low, high = low
+    return DISPATCH + low, DISPATCH + high
+
+
+def opcodes() -> dict[str, int]:
+    """Коды операций EmuChunk по именам, проверка наличия обработчика для каждого."""
+    table = {name: value for name, value in vars(EmuChunk).items() if name.startswith("OP_")}
+    missing = sorted(set(table) - set(HANDLERS))
+    if missing:
+        raise ValueError(f"No core handler for {missing}")
+    extra = sorted(set(HANDLERS) - set(table))
+    if extra:
+        raise ValueError(f"Core handlers for unknown opcodes {extra}")
+    return table
+
+
+def generate() -> tuple[str, str]:
+    """Текст программы ядра и программы, заполняющей таблицу переходов ячейки команд."""
+    table = opcodes()
+    p = CoreProgram()
+    p.emit(
+        "set threads cell1",
+        "set commands cell2",
+        "set message message1",
+        "set core bank1",
+        "set thread 2",
+        "write -1 threads thread",
+    )
+    p.label("idle")
+    p.emit(
+        "read configuring threads 0",
+        "jump {fetch} notEqual configuring thread",
+        "write 1 threads 1",
+        "jump {idle} always 0 0",
+    )
+    p.label("fetch")
+    p.emit("read i threads thread", "jump {idle} equal i -1", "read c core i")
+    p.label("dispatch")
+    p.emit("read @counter commands c")
+    if (p.labels["idle"], p.labels["fetch"], p.labels["dispatch"]) != (IDLE_LINE, FETCH_LINE, DISPATCH_LINE):
+        raise ValueError("Core prologue does not match IDLE_LINE, FETCH_LINE and DISPATCH_LINE")
+
+    entries = {}
+    for name, value in sorted(table.items(), key=lambda item: item[1]):
+        handler = HANDLERS[name]
+        if handler is None:
+            continue
+        p.label(name)
+        entries[value] = name
+        handler(p)
+    p.label("next")
+    p.tail()
+    p.labels["store"] = p.labels["next"] + 1  # write i threads thread
+
+    commands = [f"write {p.labels[name]} cell1 {value}" for value, name in entries.items()]
+    commands.append(f"write {p.labels['store']} cell1 {EmuChunk.OP_EXIT}")
+    commands.append("wait 5")
+    return p.text(), "\n".join(commands)
+
+
+def for_thread(core: str, thread: int) -> str:
+    """Программа ядра для процессора ядра thread: номер ядра задается строкой set thread."""
+    return re.sub(r"^set thread \d+$", f"set thread {thread}", core, flags=re.MULTILINE)
+
+
+def threads(cores: int = EmuChunk.CORES) -> str:
+    """
+    Контроллер ядер: ячейка cell1 - счетчики команд ядер начиная с MAIN_THREAD, switch1 - кнопка запуска.
+    При нажатии по очереди настраивает все ядра и запускает главное ядро с адреса 0.
+    """
+    if not 1 <= cores <= CELL_SIZE - EmuChunk.MAIN_THREAD:
+        raise ValueError(f"Threads cell supports 1 to {CELL_SIZE - EmuChunk.MAIN_THREAD} cores")
+    last = EmuChunk.MAIN_THREAD + cores
+    p = CoreProgram()
+    p.emit(*(f"write -1 cell1 {thread}" for thread in range(EmuChunk.MAIN_THREAD, last)))
+    p.label("start")
+    p.emit("sensor switch switch1 @enabled", "jump {start} notEqual switch true", f"set target {EmuChunk.MAIN_THREAD}")
+    p.label("configure")
+    p.emit("write target cell1 0", "write 0 cell1 1")
+    p.label("wait")
+    p.emit(
+        "read result cell1 1",
+        "jump {wait} notEqual result 1",
+        "write -1 cell1 target",
+        "op add target target 1",
+        f"jump {{configure}} lessThan target {last}",
+        "write -1 cell1 0",
+        f"write 0 cell1 {EmuChunk.MAIN_THREAD}",
+        "control enabled switch1 0 0 0 0",
+        "jump {start} always x false",
+    )
+    return p.text()
+
+
+def write(directory: Path = BUILDINGS):
+    core, commands = generate()
+    (directory / "core.masm").write_text(core + "\n")
+    (directory / "core_commands.masm").write_text(commands + "\n")
+    (directory / "threads.masm").write_text(threads() + "\n")
+
+
+if __name__ == "__main__":
+    write()
@@ -0,0 +1,485 @@
+import math
+from random import Random
+from typing import Callable
+
+from mindvm import EmuChunk, EmuDisplay
+
+
+class EmuVideo:
+    """Модель видеоядра (buildings/videocore.masm), читающая команды из очереди и почтового ящика дисплея."""
+
+    # Имена команд draw в порядке их номеров и количество используемых аргументов
+    DRAW = {
+        EmuDisplay.CLEAR: ("clear", 3),
+        EmuDisplay.COLOR: ("color", 4),
+        EmuDisplay.STROKE: ("stroke", 1),
+        EmuDisplay.LINE: ("line", 4),
+        EmuDisplay.RECT: ("rect", 4),
+        EmuDisplay.LINE_RECT: ("lineRect", 4),
+        EmuDisplay.POLY: ("poly", 5),
+        EmuDisplay.LINE_POLY: ("linePoly", 5),
+        EmuDisplay.TRIANGLE: ("triangle", 6),
+        EmuDisplay.IMAGE: ("image", 6),
+    }
+
+    SHADERS_SIZE = 64  # Размер ячейки памяти с адресами сопрограмм
+
+    def __init__(self, machine: "EmuMachine", record: bool = False):
+        self.machine = machine
+        self.shaders = [0] * self.SHADERS_SIZE  # Ячейка cell1 видеоядра
+        self.args = [0] * 6  # Регистры аргументов сохраняют значения между командами, как в видеоядре
+        self.commands = []  # Команды draw, ожидающие drawflush
+        self.frame = []  # Команды последнего выведенного на дисплей кадра
+        self.frames = 0  # Количество выведенных кадров
+        self.history = [] if record else None  # Все выведенные кадры, если включена запись
+        self.executed = 0  # Количество выполненных видеоядром команд
+        self.skipped = 0  # Сопрограммы, завершенные SHADER_WATCH без изменений
+        self.force = False  # SHADER_FORCE: следующая SHADER_WATCH не пропускает сопрограмму
+        self.queue = 0  # Адрес очереди команд после QUEUE_START, 0 - очередь не используется
+        self.head = 0  # Голова очереди, видеоядро хранит ее в переменной и записывает в память
+
+    def step(self):
+        """
+        Выполняет команду из очереди, а если она пуста - из почтового ящика и подтверждает прием.
+        Сопрограмма выполняется целиком.
+        """
+        memory = self.machine.memory
+        queue = self.queue
+        if queue and memory[queue] != self.head:
+            self.execute(queue + EmuDisplay.QUEUE_HEADER + self.head * EmuDisplay.QUEUE_SLOT)
+            self.head = (self.head + 1) % memory[queue + 2]
+            memory[queue + 1] = self.head
+        elif memory[EmuDisplay.ADDRESS] != EmuDisplay.NO_COMMAND:
+            self.execute(EmuDisplay.ADDRESS)
+            memory[EmuDisplay.ADDRESS] = EmuDisplay.NO_COMMAND
+
+    def execute(self, index: int):
+        """
+        Выполняет команду по адресу index, включая сопрограмму целиком. Сопрограмма в дополнительном банке
+        читается из него, ссылки оберток - из bank1.
+        """
+        near = memory = self.machine.memory
+        banks = self.machine.banks
+        args = self.args
+        draw = self.DRAW
+        commands = self.commands
+        wrap, wrap_end = EmuDisplay.SHADER_WRAP, EmuDisplay.SHADER_WRAP_END
+        shader_exec = False
+        executed = 0
+        while True:
+            func = memory[index]
+            if func == EmuDisplay.NO_COMMAND and shader_exec:
+                raise RuntimeError(f"Video core stalled on empty command at {index}")
+            if func == wrap:
+                index += 1
+                func = memory[index]
+                for n in range(6):
+                    index += 1
+                    value = memory[index]
+                    if value == wrap_end:
+                        break
+                    args[n] = near[-value] if value < 0 else value
+                index += 1
+            else:
+                args[:] = memory[index + 1:index + 7]
+                index += 7
+            executed += 1
+
+            if func in draw:
+                name, count = draw[func]
+                commands.append((name, *args[:count]))
+            elif func == EmuDisplay.FLUSH:
+                self.frame = commands
+                commands = self.commands = []
+                self.frames += 1
+                if self.history is not None:
+                    self.history.append(self.frame)
+            elif func == EmuDisplay.SHADER_MAP:
+                self.shaders[int(args[0])] = args[1]
+            elif func in (EmuDisplay.SHADER_EXEC, EmuDisplay.SHADER_FORCE):
+                index = int(self.shaders[int(args[0])])
+                bank, index = divmod(index, EmuChunk.BANK_SIZE)
+                if 0 <= bank < len(banks):
+                    self.force |= func == EmuDisplay.SHADER_FORCE
+                    memory = banks[bank]
+                    shader_exec = True
+                    continue
+            elif func == EmuDisplay.SHADER_JUMP:
+                if shader_exec:
+                    index = int(args[0]) % EmuChunk.BANK_SIZE
+                    continue
+            elif func == EmuDisplay.SHADER_END:
+                # SHADER_FORCE действует только на выполняемую сопрограмму, как в videocore.masm
+                self.force = False
+                shader_exec = False
+            elif func == EmuDisplay.SHADER_WATCH:
+                index, changed = self.watch(memory, index)
+                if not changed:
+                    self.skipped += 1
+                    shader_exec = False
+            elif func == EmuDisplay.QUEUE_START:
+                self.queue = int(args[0])
+                self.head = memory[self.queue + 1]
+            # Неизвестные команды пропускаются
+
+            if not shader_exec:
+                break
+        self.executed += executed
+
+    def watch(self, memory: list, index: int) -> tuple[int, bool]:
+        """
+        Блок SHADER_WATCH с адреса index: обновляет снимок переменных и ожидаемый счетчик FLUSH.
+        Возвращает (адрес следующей команды, изменилось ли что-то с прошлого выполнения).
+        """
+        near = self.machine.memory
+        count, flushes, frame = memory[index:index + EmuDisplay.WATCH_HEADER]
+        changed = frame != self.frames or self.force
+        self.force = False
+        header = index + 2
+        index += EmuDisplay.WATCH_HEADER
+        for n in range(index, index + 2 * count, 2):
+            value = near[-memory[n]]
+            if value != memory[n + 1]:
+                memory[n + 1] = value
+                changed = True
+        if changed:
+            # Пропущенная сопрограмма не выводит кадров, ожидаемый счетчик остается прежним
+            memory[header] = self.frames + flushes
+        return index + 2 * count, changed
+
+
+class EmuMachine:
+    """
+    Быстрый интерпретатор байт-кода EmuChunk на стороне хоста.
+
+    Повторяет поведение buildings/core.masm для всех кодов операций. Ядра выполняются по очереди,
+    по одной инструкции за круг, после каждого круга видеоядро обрабатывает почтовый ящик дисплея,
+    поэтому результат выполнения детерминирован при одинаковом seed.
+    """
+
+    MEMORY_SIZE = 512  # Размер bank1
+    THREADS_SIZE = 64  # Размер ячейки cell1 со счетчиками команд ядер
+    KEYBOARD = 497  # Адрес первой клавиши клавиатуры
+    MATH_OPERATIONS = max(value for name, value in vars(EmuChunk).items() if name.startswith("OPERATION_"))
+
+    def __init__(self, image: list | None = None, cores: int | None = None, seed: int | None = 0,
+                 video: bool = True, record: bool = False, far: list[list] = ()):
+        # По умолчанию ядра, для которых собран Artifact, или EmuChunk.CORES
+        cores = cores or getattr(image, "cores", EmuChunk.CORES)
+        # Верхняя половина всегда нулевая: чтение за пределами банка, в том числе по отрицательному адресу, дает 0
+        self.memory = [0] * (self.MEMORY_SIZE * 2)
+        # Банки карты памяти EmuChunk: bank1 и дополнительные
+        self.banks = [self.memory] + [[0] * (self.MEMORY_SIZE * 2) for _ in range(EmuChunk.MAX_BANKS - 1)]
+        self.threads = [EmuChunk.DISABLE_THREAD] * self.THREADS_SIZE
+        self.cores = list(range(EmuChunk.MAIN_THREAD, EmuChunk.MAIN_THREAD + cores))
+        self.executed = [0] * self.THREADS_SIZE  # Выполненные инструкции по номерам ядер
+        self.math_result = [0] * self.THREADS_SIZE  # Регистр r1 обработчика OP_MATH по номерам ядер
+        self.faults = []  # Ядра, остановленные неизвестным кодом операции: (ядро, адрес, код)
+        self.buffer = []  # Текстовый буфер блока сообщения
+        self.messages = []  # Выведенные в блок сообщения тексты
+        self.random = Random(seed)
+        self.video = EmuVideo(self, record) if video else None
+        self.memory[EmuDisplay.ADDRESS] = EmuDisplay.NO_COMMAND
+        if image is not None:
+            self.load(image, far=far)
+
+    def load(self, image: list, start: bool = True, far: list[list] = ()):
+        """
+        Записывает образ в банк памяти и образы дополнительных банков (Artifact.far) и запускает главное ядро
+        с адреса 0, как это делают загрузчики.
+        """
+        for bank, words in zip(self.banks, [image, *far]):
+            if len(words) > self.MEMORY_SIZE:
+                raise ValueError(f"Image of {len(words)} words does not fit into {self.MEMORY_SIZE} words")
+            bank[:len(words)] = words
+        if start:
+            self.threads[EmuChunk.MAIN_THREAD] = 0
+
+    @property
+    def message(self) -> str:
+        """Текст, выведенный в блок сообщения последним."""
+        return self.messages[-1] if self.messages else ""
+
+    @property
+    def halted(self) -> bool:
+        """Все ядра отключены или завершили выполнение."""
+        return all(self.threads[thread] == EmuChunk.DISABLE_THREAD for thread in self.cores)
+
+    def press(self, key: int):
+        """Нажатие клавиши клавиатуры, как это делает процессор переключателей."""
+        self.memory[self.KEYBOARD + key] = 1
+
+    def run(self, steps: int = 1_000_000, until: Callable[["EmuMachine"], bool] | None = None) -> int:
+        """
+        Выполняет не более steps инструкций и возвращает количество выполненных.
+
+        Остановка происходит раньше, если все ядра отключены или until вернул True после очередного круга.
+        """
+        memory = self.memory
+        size = self.MEMORY_SIZE
+        threads = self.threads
+        executed = self.executed
+        buffer = self.buffer
+        random = self.random.random
+        chars = EmuChunk.CHARS
+        video = self.video
+        mailbox = EmuDisplay.ADDRESS
+        cores = self.cores
+        done = 0
+
+        # Коды операций в локальных переменных, поиск атрибутов класса в цикле заметно медленнее
+        op_exit, op_set, op_copy, op_echo, op_flush, op_math, op_jump, op_char = (
+            EmuChunk.OP_EXIT, EmuChunk.OP_SET, EmuChunk.OP_COPY, EmuChunk.OP_ECHO,
+            EmuChunk.OP_FLUSH, EmuChunk.OP_MATH, EmuChunk.OP_JUMP, EmuChunk.OP_CHAR
+        )
+        op_control_thread, op_add_const, op_sub_const, op_mul_const, op_jump_neq_const = (
+            EmuChunk.OP_CONTROL_THREAD, EmuChunk.OP_ADD_CONST, EmuChunk.OP_SUB_CONST,
+            EmuChunk.OP_MUL_CONST, EmuChunk.OP_JUMP_NEQ_CONST
+        )
+        op_jump_gt_const, op_set_4, op_const_rand, op_goto_thread = (
+            EmuChunk.OP_JUMP_GT_CONST, EmuChunk.OP_SET_4, EmuChunk.OP_CONST_RAND, EmuChunk.OP_GOTO_THREAD
+        )
+        op_wait_eq, op_jump_neq_set, op_add_jump_gt, op_draw = (
+            EmuChunk.OP_WAIT_EQ, EmuChunk.OP_JUMP_NEQ_SET, EmuChunk.OP_ADD_JUMP_GT, EmuChunk.OP_DRAW
+        )
+        op_call, op_ret, op_load_far, op_store_far, op_print = (
+            EmuChunk.OP_CALL, EmuChunk.OP_RET, EmuChunk.OP_LOAD_FAR, EmuChunk.OP_STORE_FAR, EmuChunk.OP_PRINT
+        )
+        op_load_indirect, op_store_indirect, op_memcpy, op_memset = (
+            EmuChunk.OP_LOAD_INDIRECT, EmuChunk.OP_STORE_INDIRECT, EmuChunk.OP_MEMCPY, EmuChunk.OP_MEMSET
+        )
+        unpack = EmuChunk.unpack_text
+        banks = self.banks
+        header, slot_size = EmuDisplay.QUEUE_HEADER, EmuDisplay.QUEUE_SLOT
+        frame = EmuChunk.STACK_DEPTH + 1
+
+        while done < steps:
+            idle = True
+            for thread in cores:
+                i = threads[thread]
+                if i < 0:
+                    continue
+                idle = False
+                executed[thread] += 1
+                op = memory[i]
+
+                if op == op_jump_neq_const:
+                    i = memory[i + 1] + 1 if memory[memory[i + 2]] != memory[i + 3] else i + 4
+                elif op == op_wait_eq:
+                    if memory[memory[i + 1]] == memory[i + 2]:
+                        i += 3
+                elif op == op_jump_neq_set:
+                    address = memory[i + 2]
+                    if memory[address] != memory[i + 3]:
+                        i = memory[i + 1] + 1
+                    else:
+                        if 0 <= address < size:
+                            memory[address] = memory[i + 4]
+                        i += 5
+                elif op == op_add_jump_gt:
+                    address = memory[i + 1]
+                    if 0 <= address < size:
+                        memory[address] += memory[i + 2]
+                    i = memory[i + 3] + 1 if memory[address] > memory[i + 4] else i + 5
+                elif op == op_jump:
+                    i = memory[i + 1] + 1 if memory[memory[i + 2]] != 0 else i + 3
+                elif op == op_set:
+                    address = memory[i + 1]
+                    if 0 <= address < size:
+                        memory[address] = memory[i + 2]
+                    i += 3
+                elif op == op_add_const:
+                    address = memory[i + 1]
+                    if 0 <= address < size:
+                        memory[address] += memory[i + 2]
+                    i += 3
+                elif op == op_sub_const:
+                    address = memory[i + 1]
+                    if 0 <= address < size:
+                        memory[address] -= memory[i + 2]
+                    i += 3
+                elif op == op_jump_gt_const:
+                    i = memory[i + 1] + 1 if memory[memory[i + 2]] > memory[i + 3] else i + 4
+                elif op == op_math:
+                    result = self._math(thread, memory[memory[i + 1]], memory[memory[i + 2]], memory[memory[i + 3]])
+                    address = memory[i + 4]
+                    if 0 <= address < size:
+                        memory[address] = result
+                    i += 5
+                elif op == op_copy:
+                    address = memory[i + 1]
+                    if 0 <= address < size:
+                        memory[address] = memory[memory[i + 2]]
+                    i += 3
+                elif op == op_mul_const:
+                    address = memory[i + 1]
+                    if 0 <= address < size:
+                        memory[address] *= memory[i + 2]
+                    i += 3
+                elif op == op_char:
+                    i += 1
+                    h = memory[memory[i]]
+                    while h != -1:
+                        if 0 <= h <= len(chars) - 1:  # Дробная часть отбрасывается, как в core.masm
+                            buffer.append(chars[int(h)])
+                        i += 1
+                        h = memory[memory[i]]
+                    i += 1
+                elif op == op_print:
+                    # Слова строки до отрицательного последнего, как в core.masm
+                    while True:
+                        i += 1
+                        buffer.append(unpack((memory[i],)))
+                        if memory[i] < 0:
+                            break
+                    i += 1
+                elif op == op_echo:
+                    buffer.append(self._format(memory[memory[i + 1]]))
+                    i += 2
+                elif op == op_flush:
+                    self.messages.append("".join(buffer))
+                    buffer.clear()
+                    i += 1
+                elif op == op_set_4:
+                    address = memory[i + 1]
+                    for n in range(4):
+                        if 0 <= address + n < size:
+                            memory[address + n] = memory[i + 2 + n]
+                    i += 6
+                elif op == op_const_rand:
+                    address = memory[i + 2]
+                    if 0 <= address < size:
+                        memory[address] = random() * memory[i + 1]
+                    i += 3
+                elif op == op_draw:
+                    # Заполненная очередь: инструкция выполнится снова на следующем круге
+                    queue = memory[i + 1]
+                    tail = memory[queue]
+                    following = (tail + 1) % memory[queue + 2]
+                    if following != memory[queue + 1]:
+                        count = memory[i + 3]
+                        slot = queue + header + tail * slot_size
+                        memory[slot] = memory[i + 2]
+                        for n in range(count):
+                            memory[slot + 1 + n] = memory[memory[i + 4 + n]]
+                        memory[queue] = following
+                        i += 4 + count
+                elif op == op_call:
+                    # Область стека ядра: глубина и адреса возврата, как в обработчике core.masm
+                    area = memory[i + 1] + (thread - EmuChunk.MAIN_THREAD) * frame
+                    depth = memory[area] + 1
+                    if 0 <= area < size:
+                        memory[area] = depth
+                    if 0 <= area + depth < size:
+                        memory[area + depth] = i + 2
+                    i = memory[i + 2] + 1
+                elif op == op_ret:
+                    area = memory[i + 1] + (thread - EmuChunk.MAIN_THREAD) * frame
+                    depth = memory[area]
+                    i = memory[area + depth] + 1
+                    if 0 <= area < size:
+                        memory[area] = depth - 1
+                elif op == op_load_far or op == op_store_far:
+                    far = memory[i + 2] if op == op_load_far else memory[i + 1]
+                    bank, offset = divmod(int(far), size)
+                    if 0 <= bank < len(banks):
+                        if op == op_load_far:
+                            address = memory[i + 1]
+                            if 0 <= address < size:
+                                memory[address] = banks[bank][offset]
+                        else:
+                            banks[bank][offset] = memory[memory[i + 2]]
+                    i += 3
+                elif op == op_load_indirect:
+                    # Адрес вне банка читается как 0, как read логики
+                    source = int(memory[i + 2] + memory[memory[i + 3]])
+                    address = memory[i + 1]
+                    if 0 <= address < size:
+                        memory[address] = memory[source] if 0 <= source < size else 0
+                    i += 4
+                elif op == op_store_indirect:
+                    address = int(memory[i + 1] + memory[memory[i + 2]])
+                    if 0 <= address < size:
+                        memory[address] = memory[memory[i + 3]]
+                    i += 4
+                elif op == op_memcpy:
+                    target, source, count = memory[i + 1], memory[i + 2], memory[i + 3]
+                    # Перекрывающиеся области: обработчик копирует с конца, если target > source
+                    words = [memory[n] if 0 <= n < size else 0 for n in range(source, source + count)]
+                    for n, value in enumerate(words, start=target):
+                        if 0 <= n < size:
+                            memory[n] = value
+                    i += 4
+                elif op == op_memset:
+                    value, count = memory[memory[i + 2]], memory[i + 3]
+                    for n in range(memory[i + 1], memory[i + 1] + count):
+                        if 0 <= n < size:
+                            memory[n] = value
+                    i += 4
+                elif op == op_goto_thread:
+                    # Рукопожатие через ячейку ядер атомарно: целевое ядро меняет счетчик между инструкциями
+                    target = int(memory[i + 1])
+                    if target != thread:
+                        threads[target] = memory[i + 2]
+                    i += 3
+                elif op == op_control_thread:
+                    target = int(memory[memory[i + 1]])
+                    if target != thread:
+                        threads[target] = memory[i + 2] + 1
+                    i += 3
+                elif op == op_exit:
+                    threads[thread] = EmuChunk.DISABLE_THREAD
+                    continue
+                else:
+                    # Пустая запись в таблице переходов перезапускает процессор ядра, и оно отключается
+                    self.faults.append((thread, i, op))
+                    threads[thread] = EmuChunk.DISABLE_THREAD
+                    continue
+
+                threads[thread] = i
+                done += 1
+
+            if video is not None and (memory[mailbox] != EmuDisplay.NO_COMMAND
+                                      or video.queue and memory[video.queue] != video.head):
+                video.step()
+            if idle or until is not None and until(self):
+                break
+        return done
+
+    def _math(self, thread, operation, a, b):
+        """Математическая операция OP_MATH, неизвестный код операции возвращает предыдущий результат ядра."""
+        if 0 <= operation <= self.MATH_OPERATIONS:
+            operation = int(operation)  # Дробная часть отбрасывается переходом по таблице в core.masm
+        if operation == EmuChunk.OPERATION_ADD:
+            result = a + b
+        elif operation == EmuChunk.OPERATION_SUB:
+            result = a - b
+        elif operation == EmuChunk.OPERATION_MUL:
+            result = a * b
+        elif operation == EmuChunk.OPERATION_DIV:
+            result = a / b if b != 0 else 0  # Некорректные числа логика Mindustry заменяет нулем
+        elif operation == EmuChunk.OPERATION_EQ:
+            result = int(a == b)
+        elif operation == EmuChunk.OPERATION_GT:
+            result = int(a > b)
+        elif operation == EmuChunk.OPERATION_LT:
+            result = int(a < b)
+        elif operation == EmuChunk.OPERATION_NEQ:
+            result = int(a != b)
+        elif operation == EmuChunk.OPERATION_IRAND:
+            result = math.floor(self.random.random() * (b - a) + a)
+        elif operation == EmuChunk.OPERATION_MOD:
+            result = math.fmod(a, b) if b != 0 else 0  # Остаток со знаком делимого, как в Java
+            if isinstance(a, int) and isinstance(b, int):
+                result = int(result)
+        else:
+            return self.math_result[thread]
+        self.math_result[thread] = result
+        return result
+
+    @staticmethod
+    def _format(value) -> str:
+        """Форматирование числа для print, целые значения выводятся без дробной части."""
+        if value == int(value):
+            return str(int(value))
+        return str(value)
@@ -0,0 +1,112 @@
+"""
+Статическая оценка стоимости программы EmuChunk в инструкциях логики buildings/core.masm.
+
+Стоимость каждой инструкции VM берется из coregen.cost() вместе с диспетчеризацией, для ветвлений
+и математических операций с неизвестным кодом - среднее наименьшей и наибольшей. Стоимость суммируется
+по местам вызова в исходном коде программы, участкам от метки до метки и точкам входа ядер,
+участки, входящие в циклы, отмечаются. Количество повторений циклов статически неизвестно,
+поэтому при ранжировании вес участков в циклах умножается на LOOP_WEIGHT.
+"""
+from dataclasses import dataclass, field
+
+import coregen
+from mindvm import EmuChunk
+from optimizer import ControlFlowGraph
+
+
+@dataclass
+class Region:
+    # Участок кода от метки (цели перехода или точки входа ядра) до следующей метки
+    start: int  # Позиция первой инструкции в коде
+    end: int
+    address: int  # Адрес первой инструкции в образе
+    site: str | None  # Место вызова первой инструкции
+    cost: float = 0  # Инструкций логики за один проход участка
+    loop: bool = False  # Участок входит в цикл
+    waits: bool = False  # Участок содержит ожидание, время которого не учитывается
+    entries: list[int] = field(default_factory=list)  # Адреса точек входа ядер, из которых достижим участок
+
+
+class CostEstimator:
+    LOOP_WEIGHT = 10  # Предполагаемое количество повторений цикла при ранжировании
+    WAITS = (EmuChunk.OP_WAIT_EQ, EmuChunk.OP_GOTO_THREAD, EmuChunk.OP_DRAW)
+
+    def __init__(self, chunk: EmuChunk):
+        self.chunk = chunk
+        self.graph = ControlFlowGraph(chunk)
+        self.base = len(chunk.data) + 3  # Адрес первого слова кода
+        self.costs = {}  # Позиция инструкции -> (наименьшая, наибольшая стоимость)
+        self.loops = set()  # Позиции инструкций в циклах
+        self.regions: list[Region] = []
+        self.sites = {}  # Место вызова -> суммарная средняя стоимость инструкций
+        self.loop_sites = set()  # Места вызова инструкций в циклах
+        self.entries = {}  # Адрес точки входа ядра -> стоимость одного прохода достижимых участков
+        self._estimate()
+
+    def _estimate(self):
+        graph = self.graph
+        for block in graph.blocks.values():
+            if block.data:
+                continue
+            # Блок в цикле, если он достижим из своих последователей
+            loop = block.start in graph.reachable(block.successors)
+            for item in block.items:
+                self.costs[item.start] = coregen.cost(self.chunk, item)
+                if loop:
+                    self.loops.add(item.start)
+
+        boundaries = set(graph.roots)
+        boundaries.update(label.position for label, pointer in graph.uses.values() if not pointer)
+        region = None
+        for item in graph.items:
+            if item.data:
+                region = None
+                continue
+            if region is None or item.start in boundaries:
+                region = Region(item.start, item.end, item.start + self.base, self.chunk.sites.get(item.start))
+                self.regions.append(region)
+            region.end = item.end
+            region.cost += self.average(item.start)
+            region.loop |= item.start in self.loops
+            region.waits |= item.opcode in self.WAITS
+
+            site = self.chunk.sites.get(item.start)
+            self.sites[site] = self.sites.get(site, 0) + self.average(item.start)
+            if item.start in self.loops:
+                self.loop_sites.add(site)
+
+        for root in dict.fromkeys(graph.roots):
+            reachable = graph.reachable([root])
+            address = root + self.base
+            self.entries[address] = 0
+            for region in self.regions:
+                block = graph.block_at(region.start)
+                if block is not None and block.start in reachable:
+                    region.entries.append(address)
+                    self.entries[address] += region.cost
+
+    def average(self, position: int) -> float:
+        low, high = self.costs[position]
+        return (low + high) / 2
+
+    def weight(self, region: Region) -> float:
+        return region.cost * (self.LOOP_WEIGHT if region.loop else 1)
+
+    def hot_spots(self, count: int = 10) -> list[Region]:
+        """Самые дорогие участки: циклы с весом LOOP_WEIGHT."""
+        return sorted(self.regions, key=self.weight, reverse=True)[:count]
+
+    def report(self, count: int = 10) -> str:
+        lines = []
+        for region in self.hot_spots(count):
+            flags = "".join((" loop" if region.loop else "", " wait" if region.waits else ""))
+            lines.append(f"    hot spot: {region.address}-{region.end + self.base - 1} {region.site}{flags}"
+                         f" ~{region.cost:g} instructions, entries {region.entries}")
+        sites = sorted(self.sites, reverse=True,
+                       key=lambda site: self.sites[site] * (self.LOOP_WEIGHT if site in self.loop_sites else 1))
+        for site in sites[:count]:
+            flags = " loop" if site in self.loop_sites else ""
+            lines.append(f"    site: {site}{flags} ~{self.sites[site]:g} instructions")
+        for address, total in self.entries.items():
+            lines.append(f"    entry {address}: ~{total:g} instructions per pass")
+        return "\n".join(lines)
@@ -1,6 +1,6 @@
 from mindvm import EmuChunk, EmuDisplay, level_up
 
-c = EmuChunk()
+c = EmuChunk(verbose=True)
 d = EmuDisplay(c)
 
 road_stroke_y = c.var()
@@ -24,36 +24,35 @@ KEYBOARD = 497
 skip_alloc = c.label()
 c.jump(skip_alloc, c.NON_ZERO)
 
-main_scene_shader = d.alloc_shader(
-    d.SHADER_WRAP, d.CLEAR, points, 170, 0, d.SHADER_WRAP_END,
-    d.COLOR, 0, 0, 0, 255, 0, 0,
-    d.RECT, 38, 0, 100, d.DISPLAY_SIZE, 0, 0,
-    d.COLOR, 255, 255, 255, 255, 0, 0,
-    d.SHADER_WRAP, d.STROKE, 10, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, 84, road_stroke_y, 8, 70, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, 84, road_stroke_y2, 8, 70, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, 84, road_stroke_y3, 8, 70, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.COLOR, 28, 28, 28, 255, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, 0, road_stroke_y, 15, 70, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, 161, road_stroke_y2, 15, 60, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.COLOR, 209, 200, 25, 255, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, player_x, 10, 29, 45, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.COLOR, 0, 130, 0, 230, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.POLY, 0, road_stroke_y3, 8, 50, 0, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.COLOR, 245, 111, 66, 255, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, traffic_x, traffic_y, 29, 45, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.FLUSH, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.SHADER_END, d.SHADER_WRAP_END
+main_scene_shader = d.shader(
+    ("clear", points, 170, 0),
+    ("color", 0, 0, 0, 255),
+    ("rect", 38, 0, 100, d.DISPLAY_SIZE),
+    ("color", 255, 255, 255, 255),
+    ("stroke", 10),
+    ("rect", 84, road_stroke_y, 8, 70),
+    ("rect", 84, road_stroke_y2, 8, 70),
+    ("rect", 84, road_stroke_y3, 8, 70),
+    ("color", 28, 28, 28, 255),
+    ("rect", 0, road_stroke_y, 15, 70),
+    ("rect", 161, road_stroke_y2, 15, 60),
+    ("color", 209, 200, 25, 255),
+    ("rect", player_x, 10, 29, 45),
+    ("color", 0, 130, 0, 230),
+    ("poly", 0, road_stroke_y3, 8, 50, 0),
+    ("color", 245, 111, 66, 255),
+    ("rect", traffic_x, traffic_y, 29, 45),
+    ("flush",),
+    cached=True,
 )
 
-game_over_scene_shader = d.alloc_shader(
-    d.SHADER_WRAP, d.COLOR, 0, 0, 0, 30, d.SHADER_WRAP_END,
-    d.SHADER_WRAP,  d.RECT, 0, 0, d.DISPLAY_SIZE, d.DISPLAY_SIZE, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.COLOR, 255, 0, 0, 255, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, 83, 25, 20, 20, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.RECT, 83, 55, 20, 96, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.FLUSH, d.SHADER_WRAP_END,
-    d.SHADER_WRAP, d.SHADER_END, d.SHADER_WRAP_END
+game_over_scene_shader = d.shader(
+    ("color", 0, 0, 0, 30),
+    ("rect", 0, 0, d.DISPLAY_SIZE, d.DISPLAY_SIZE),
+    ("color", 255, 0, 0, 255),
+    ("rect", 83, 25, 20, 20),
+    ("rect", 83, 55, 20, 96),
+    ("flush",),
 )
 
 c.label(skip_alloc)
@@ -90,36 +89,27 @@ def move_scene():
     c[road_stroke_y2] -= 2
     c[road_stroke_y3] -= 2
 
-    q = c.label(reassign=True)
-    c.jump_gt_const(q, road_stroke_y, -70)
-    c[road_stroke_y] = 200
-    c.label(q)
-
-    q = c.label(reassign=True)
-    c.jump_gt_const(q, road_stroke_y2, -70)
-    c[road_stroke_y2] = 200
-    c.label(q)
-
-    q = c.label(reassign=True)
-    c.jump_gt_const(q, road_stroke_y3, -70)
-    c[road_stroke_y3] = 200
-    c.label(q)
+    for stroke in (road_stroke_y, road_stroke_y2, road_stroke_y3):
+        with c.if_(c.expr(stroke) <= -70):
+            c[stroke] = 200
 
 
 def move_traffic():
     c[traffic_y] -= traffic_speed
 
-    q = c.label(reassign=True)
-    c.jump_gt_const(q, traffic_y, -44)
-    c[traffic_y] = 226
-    c.math(c.store_int(c.OPERATION_IRAND), c.store_int(0), c.store_int(1), temp)
-    c[traffic_x] = CAR_POSITION_1
-    c[points] += 10
-    c[traffic_speed] += 1
-    c.jump(q, temp)
-    c[traffic_x] = CAR_POSITION_2
-    c.label(q)
+    with c.if_(c.expr(traffic_y) <= -44):
+        c[traffic_y] = 226
+        c.math(c.store_int(c.OPERATION_IRAND), c.store_int(0), c.store_int(1), temp)
+        c[traffic_x] = CAR_POSITION_1
+        c[points] += 10
+        c[traffic_speed] += 1
+        with c.if_(c.expr(temp) == 0):
+            c[traffic_x] = CAR_POSITION_2
+
 
+# Каждая функция вызывается один раз, копирование тела в место вызова дешевле OP_CALL
+move_scene = c.function(move_scene, inline=True)
+move_traffic = c.function(move_traffic, inline=True)
 
 collision_loop = c.label()
 
@@ -152,21 +142,16 @@ c.label(controls_thread, inc_thread=True)
 
 @level_up
 def thread_3():
-    controls_loop = c.label()
-    q = c.label(reassign=True)
-    c.jump_neq_const(q, KEYBOARD + 3, 1)
-    c[KEYBOARD + 3] = 0
-    c.jump_neq_const(q, player_x, CAR_POSITION_2)
-    c[player_x] = CAR_POSITION_1
-    c.label(q)
+    with c.while_(1):
+        with c.if_(c.expr(KEYBOARD + 3) == 1):
+            c[KEYBOARD + 3] = 0
+            with c.if_(c.expr(player_x) == CAR_POSITION_2):
+                c[player_x] = CAR_POSITION_1
 
-    q = c.label(reassign=True)
-    c.jump_neq_const(q, KEYBOARD + 5, 1)
-    c[KEYBOARD + 5] = 0
-    c.jump_neq_const(q, player_x, CAR_POSITION_1)
-    c[player_x] = CAR_POSITION_2
-    c.label(q)
-    c.jump(controls_loop, c.NON_ZERO)
+        with c.if_(c.expr(KEYBOARD + 5) == 1):
+            c[KEYBOARD + 5] = 0
+            with c.if_(c.expr(player_x) == CAR_POSITION_1):
+                c[player_x] = CAR_POSITION_2
 
 
 c.label(move_thread, inc_thread=True)
@@ -174,10 +159,9 @@ c.label(move_thread, inc_thread=True)
 
 @level_up
 def thread_4():
-    move_loop = c.label()
-    move_scene()
-    move_traffic()
-    c.jump(move_loop, c.NON_ZERO)
+    with c.while_(1):
+        c.call(move_scene)
+        c.call(move_traffic)
 
 
 c.label(render_thread, inc_thread=True)
@@ -185,9 +169,8 @@ c.label(render_thread, inc_thread=True)
 
 @level_up
 def thread_5():
-    render_loop = c.label()
-    d.shader_exec(0)
-    c.jump(render_loop, c.NON_ZERO)
+    with c.while_(1):
+        d.shader_exec(0)
 
 
-c.compile()
+print(c.compile().text)
@@ -0,0 +1,390 @@
+"""
+Выражения EmuChunk: дерево из переменных, констант и операций, собираемое перегрузкой операторов Python,
+и его сборка в OP_MATH, OP_ADD_CONST, OP_SUB_CONST, OP_MUL_CONST, OP_COPY и OP_SET.
+
+x = c.expr(player_x)
+c.assign(temp, (x + 4) * 2 - c.expr(traffic_x))
+
+При сборке константы сворачиваются (в том числе цепочки (x + 1) + 2 и (x * 2) * 3), удаляются операции
+с нейтральным элементом, одинаковые подвыражения вычисляются один раз, а промежуточные значения
+записываются во временные переменные, общие для выражений одного ядра. Операция с константой над
+значением, уже находящимся в месте назначения, собирается в ADD_CONST/SUB_CONST/MUL_CONST.
+"""
+import math
+import operator
+
+from mindvm import EmuChunk, Label
+
+# Свертка констант, как операции в core.masm и EmuMachine: деление на 0 не сворачивается
+FOLD = {
+    EmuChunk.OPERATION_ADD: operator.add,
+    EmuChunk.OPERATION_SUB: operator.sub,
+    EmuChunk.OPERATION_MUL: operator.mul,
+    EmuChunk.OPERATION_DIV: operator.truediv,
+    EmuChunk.OPERATION_EQ: lambda a, b: int(a == b),
+    EmuChunk.OPERATION_GT: lambda a, b: int(a > b),
+    EmuChunk.OPERATION_LT: lambda a, b: int(a < b),
+    EmuChunk.OPERATION_NEQ: lambda a, b: int(a != b),
+    EmuChunk.OPERATION_MOD: math.fmod,
+}
+COMMUTATIVE = (EmuChunk.OPERATION_ADD, EmuChunk.OPERATION_MUL, EmuChunk.OPERATION_EQ, EmuChunk.OPERATION_NEQ)
+# Сравнения, результат которых 0 или 1
+COMPARISONS = (EmuChunk.OPERATION_EQ, EmuChunk.OPERATION_GT, EmuChunk.OPERATION_LT, EmuChunk.OPERATION_NEQ)
+# Операции с константой, выполняемые над переменной на месте
+IN_PLACE = {
+    EmuChunk.OPERATION_ADD: EmuChunk.add_const,
+    EmuChunk.OPERATION_SUB: EmuChunk.sub_const,
+    EmuChunk.OPERATION_MUL: EmuChunk.mul_const,
+}
+
+
+class Expr:
+    """Узел дерева выражения. Сравнения строят операции, поэтому выражения нельзя хешировать и проверять в if."""
+
+    def __add__(self, other):
+        return Operation(EmuChunk.OPERATION_ADD, self, wrap(other))
+
+    def __radd__(self, other):
+        return Operation(EmuChunk.OPERATION_ADD, wrap(other), self)
+
+    def __sub__(self, other):
+        return Operation(EmuChunk.OPERATION_SUB, self, wrap(other))
+
+    def __rsub__(self, other):
+        return Operation(EmuChunk.OPERATION_SUB, wrap(other), self)
+
+    def __mul__(self, other):
+        return Operation(EmuChunk.OPERATION_MUL, self, wrap(other))
+
+    def __rmul__(self, other):
+        return Operation(EmuChunk.OPERATION_MUL, wrap(other), self)
+
+    def __truediv__(self, other):
+        return Operation(EmuChunk.OPERATION_DIV, self, wrap(other))
+
+    def __rtruediv__(self, other):
+        return Operation(EmuChunk.OPERATION_DIV, wrap(other), self)
+
+    def __mod__(self, other):
+        return Operation(EmuChunk.OPERATION_MOD, self, wrap(other))
+
+    def __rmod__(self, other):
+        return Operation(EmuChunk.OPERATION_MOD, wrap(other), self)
+
+    def __eq__(self, other):
+        return Operation(EmuChunk.OPERATION_EQ, self, wrap(other))
+
+    def __ne__(self, other):
+        return Operation(EmuChunk.OPERATION_NEQ, self, wrap(other))
+
+    def __gt__(self, other):
+        return Operation(EmuChunk.OPERATION_GT, self, wrap(other))
+
+    def __lt__(self, other):
+        return Operation(EmuChunk.OPERATION_LT, self, wrap(other))
+
+    def __ge__(self, other):
+        return Operation(EmuChunk.OPERATION_EQ, Operation(EmuChunk.OPERATION_LT, self, wrap(other)), Const(0))
+
+    def __le__(self, other):
+        return Operation(EmuChunk.OPERATION_EQ, Operation(EmuChunk.OPERATION_GT, self, wrap(other)), Const(0))
+
+    def __neg__(self):
+        return Operation(EmuChunk.OPERATION_SUB, Const(0), self)
+
+    def __bool__(self):
+        raise TypeError("Expressions are compiled into VM code, use EmuChunk.jump_if for conditions")
+
+    __hash__ = None
+
+    def key(self) -> tuple:
+        """Структурный ключ для поиска одинаковых подвыражений."""
+        raise NotImplementedError
+
+    def reads(self) -> set:
+        """Адреса переменных, читаемых выражением."""
+        return set()
+
+    @property
+    def pure(self) -> bool:
+        return True
+
+
+class Var(Expr):
+    def __init__(self, ref):
+        self.ref = ref  # Ссылка EmuChunk.var() или абсолютный адрес в списке, как EmuChunk.NON_ZERO
+
+    def key(self) -> tuple:
+        return "var", self.ref[0]
+
+    def reads(self) -> set:
+        return {self.ref[0]}
+
+
+class Const(Expr):
+    def __init__(self, value):
+        self.value = value
+
+    def key(self) -> tuple:
+        return "const", self.value
+
+
+class Operation(Expr):
+    def __init__(self, code: int, left: Expr, right: Expr):
+        self.code = code
+        self.left = left
+        self.right = right
+
+    def key(self) -> tuple:
+        if not self.pure:
+            return "irand", id(self)
+        left, right = self.left.key(), self.right.key()
+        if self.code in COMMUTATIVE and repr(right) < repr(left):
+            left, right = right, left
+        return self.code, left, right
+
+    def reads(self) -> set:
+        return self.left.reads() | self.right.reads()
+
+    @property
+    def pure(self) -> bool:
+        return self.code != EmuChunk.OPERATION_IRAND and self.left.pure and self.right.pure
+
+
+def wrap(value) -> Expr:
+    """Число - константа, ссылка на переменную - переменная."""
+    if isinstance(value, Expr):
+        return value
+    if EmuChunk.is_var(value):
+        return Var(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return Const(value)
+    raise TypeError(f"Can not use {value!r} in an expression")
+
+
+def irand(low, high) -> Operation:
+    """Случайное целое от low до high - 1, каждое вхождение вычисляется отдельно."""
+    return Operation(EmuChunk.OPERATION_IRAND, wrap(low), wrap(high))
+
+
+def _number(value):
+    """Целые результаты свертки хранятся как int, чтобы совпадать с константами пула."""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def simplify(node: Expr) -> Expr:
+    """Свертка констант и удаление операций с нейтральным элементом."""
+    if not isinstance(node, Operation):
+        return node
+    code = node.code
+    left, right = simplify(node.left), simplify(node.right)
+    if isinstance(left, Const) and isinstance(right, Const) and code in FOLD:
+        if code in (EmuChunk.OPERATION_DIV, EmuChunk.OPERATION_MOD) and right.value == 0:
+            return Operation(code, left, right)
+        return Const(_number(FOLD[code](left.value, right.value)))
+    if code in COMMUTATIVE and isinstance(left, Const) and not isinstance(right, Const):
+        left, right = right, left
+    if isinstance(right, Const):
+        value = right.value
+        if code == EmuChunk.OPERATION_SUB:
+            code, value = EmuChunk.OPERATION_ADD, -value
+        if code == EmuChunk.OPERATION_ADD and value == 0 or code in (EmuChunk.OPERATION_MUL,
+                                                                       EmuChunk.OPERATION_DIV) and value == 1:
+            return left
+        if code == EmuChunk.OPERATION_MUL and value == 0 and left.pure:
+            return Const(0)
+        # (x + a) + b = x + (a + b), (x * a) * b = x * (a * b)
+        if (isinstance(left, Operation) and isinstance(left.right, Const)
+                and code in (EmuChunk.OPERATION_ADD, EmuChunk.OPERATION_MUL)):
+            inner = left.right.value
+            if left.code == EmuChunk.OPERATION_SUB and code == EmuChunk.OPERATION_ADD:
+                inner = -inner
+            if left.code == code or left.code == EmuChunk.OPERATION_SUB and code == EmuChunk.OPERATION_ADD:
+                return simplify(Operation(code, left.left, Const(_number(FOLD[code](inner, value)))))
+        if code == EmuChunk.OPERATION_ADD and value < 0:
+            code, value = EmuChunk.OPERATION_SUB, -value
+        right = Const(value)
+    return Operation(code, left, right)
+
+
+def negate(expr) -> Expr:
+    """Условие, истинное, когда expr равно 0: == и != меняются местами, отрицание сравнения снимается."""
+    node = simplify(wrap(expr))
+    if isinstance(node, Const):
+        return Const(int(node.value == 0))
+    if isinstance(node, Operation):
+        if node.code == EmuChunk.OPERATION_EQ and isinstance(node.right, Const) and node.right.value == 0 and \
+                isinstance(node.left, Operation) and node.left.code in COMPARISONS:
+            return node.left
+        if node.code == EmuChunk.OPERATION_EQ:
+            return Operation(EmuChunk.OPERATION_NEQ, node.left, node.right)
+        if node.code == EmuChunk.OPERATION_NEQ:
+            return Operation(EmuChunk.OPERATION_EQ, node.left, node.right)
+    return Operation(EmuChunk.OPERATION_EQ, node, Const(0))
+
+
+class ExpressionCompiler:
+    """
+    Сборка последовательности присваиваний, выполняемых подряд без переходов внутрь: значения подвыражений,
+    вычисленные в одном присваивании, используются в следующих, пока не изменятся читаемые ими переменные.
+    """
+
+    def __init__(self, chunk: EmuChunk, thread: int = EmuChunk.MAIN_THREAD):
+        self.chunk = chunk
+        self.temps = chunk.temporaries.setdefault(thread, [])  # Временные переменные ядра
+        self.used = 0  # Занятые временные переменные
+        self.known = {}  # Ключ подвыражения -> ссылка на переменную с его значением
+        self.stats = {"folded": 0, "reused": 0, "in_place": 0, "temporaries": 0}
+
+    def temp(self) -> list[int]:
+        if self.used == len(self.temps):
+            self.temps.append(self.chunk.var())
+        self.used += 1
+        self.stats["temporaries"] = max(self.stats["temporaries"], self.used)
+        return self.temps[self.used - 1]
+
+    def _count(self, node: Expr, counts: dict):
+        if isinstance(node, Operation):
+            key = node.key()
+            counts[key] = counts.get(key, 0) + 1
+            if counts[key] == 1:
+                self._count(node.left, counts)
+                self._count(node.right, counts)
+
+    def _store(self, key: tuple, ref):
+        if key[0] != "irand":
+            self.known[key] = ref
+
+    def _invalidate(self, address: int):
+        """Забывает значения, читающие переменную address или хранящиеся в ней."""
+        for key, ref in list(self.known.items()):
+            if ref[0] == address or address in self._reads(key):
+                del self.known[key]
+
+    @staticmethod
+    def _reads(key: tuple) -> set:
+        if key[0] == "var":
+            return {key[1]}
+        if key[0] in ("const", "irand"):
+            return set()
+        return ExpressionCompiler._reads(key[1]) | ExpressionCompiler._reads(key[2])
+
+    def _ref(self, node: Expr, shared: set):
+        """Ссылка на значение узла: переменная, константа пула или временная переменная, в которую узел вычислен."""
+        if isinstance(node, Var):
+            return node.ref
+        if isinstance(node, Const):
+            return self.chunk.store_int(node.value)
+        key = node.key()
+        if key in self.known:
+            self.stats["reused"] += 1
+            return self.known[key]
+        # Временные переменные не перезаписываются до конца последовательности присваиваний
+        target = self.temp()
+        self._compute(node, shared, target)
+        self._store(key, target)
+        return target
+
+    def _compute(self, node: Operation, shared: set, target):
+        """Вычисляет операцию в переменную target."""
+        chunk, left, right = self.chunk, node.left, node.right
+        address = target[0]
+        if isinstance(right, Const) and node.code in IN_PLACE:
+            # Левая часть уже в target или будет вычислена прямо в нее: операция с константой на месте
+            in_target = isinstance(left, Var) and left.ref[0] == address
+            computed = isinstance(left, Operation) and left.key() not in shared and left.key() not in self.known
+            if in_target or computed:
+                if not in_target:
+                    self._compute(left, shared, target)
+                IN_PLACE[node.code](chunk, target, right.value)
+                self.stats["in_place"] += 1
+                return
+        # Операнды вычисляются во временные переменные, их значения доступны следующим присваиваниям
+        left_ref = self._ref(left, shared)
+        right_ref = self._ref(right, shared)
+        chunk.math(chunk.store_int(node.code), left_ref, right_ref, target)
+
+    def assign(self, ref, expr):
+        """Присваивание выражения expr переменной ref."""
+        chunk = self.chunk
+        raw = wrap(expr)
+        node = simplify(raw)
+        if self._size(node) < self._size(raw):
+            self.stats["folded"] += 1
+        address = ref[0] if EmuChunk.is_var(ref) else ref
+        target = ref if EmuChunk.is_var(ref) else [ref]
+
+        if isinstance(node, Const):
+            chunk.set(target, node.value)
+        elif isinstance(node, Var):
+            if node.ref[0] != address:
+                chunk.copy(target, node.ref)
+        else:
+            counts = {}
+            self._count(node, counts)
+            shared = {key for key, count in counts.items() if count > 1 and key[0] != "irand"}
+            key = node.key()
+            if key in self.known:
+                self.stats["reused"] += 1
+                if self.known[key][0] != address:
+                    chunk.copy(target, self.known[key])
+            else:
+                # Промежуточные значения пишутся в target, хранившиеся в нем значения больше недоступны
+                for other in [other for other, held in self.known.items() if held[0] == address]:
+                    del self.known[other]
+                self._compute(node, shared - {key}, target)
+        self._invalidate(address)
+        if isinstance(node, Operation) and node.pure and address not in node.reads():
+            self._store(node.key(), target)
+
+    @staticmethod
+    def _size(node: Expr) -> int:
+        if isinstance(node, Operation):
+            return 1 + ExpressionCompiler._size(node.left) + ExpressionCompiler._size(node.right)
+        return 1
+
+    @staticmethod
+    def _direct(node: Expr):
+        """Переход по сравнению с константой одной инструкцией: (метод EmuChunk, аргументы после метки) или None."""
+        if isinstance(node, Operation) and isinstance(node.left, Var) and isinstance(node.right, Const):
+            if node.code == EmuChunk.OPERATION_NEQ and node.right.value == 0:
+                return EmuChunk.jump, node.left.ref
+            if node.code == EmuChunk.OPERATION_NEQ:
+                return EmuChunk.jump_neq_const, node.left.ref, node.right.value
+            if node.code == EmuChunk.OPERATION_GT:
+                return EmuChunk.jump_gt_const, node.left.ref, node.right.value
+        if isinstance(node, Operation) and isinstance(node.left, Const) and isinstance(node.right, Var):
+            if node.code == EmuChunk.OPERATION_LT:
+                return EmuChunk.jump_gt_const, node.right.ref, node.left.value
+        return None
+
+    @staticmethod
+    def direct(expr) -> bool:
+        """Переход по условию собирается condition() не больше чем в одну инструкцию, без вычислений."""
+        node = simplify(wrap(expr))
+        return isinstance(node, (Const, Var)) or ExpressionCompiler._direct(node) is not None
+
+    def condition(self, label: Label, expr):
+        """Переход на label, если выражение не равно 0, с непосредственным операндом, где это возможно."""
+        chunk = self.chunk
+        node = simplify(wrap(expr))
+        if isinstance(node, Const):
+            if node.value != 0:
+                chunk.jump(label, chunk.NON_ZERO)
+            return
+        direct = self._direct(node)
+        if direct is not None:
+            jump, *args = direct
+            return jump(chunk, label, *args)
+        if isinstance(node, Var):
+            return chunk.jump(label, node.ref)
+        counts = {}
+        self._count(node, counts)
+        shared = {key for key, count in counts.items() if count > 1 and key[0] != "irand"}
+        if node.code == EmuChunk.OPERATION_EQ and isinstance(node.right, Const) and node.right.value == 0 and \
+                isinstance(node.left, Operation) and node.left.code in COMPARISONS:
+            # Сравнение равно 0, если оно не равно 1: <= и >= без второй операции
+            return chunk.jump_neq_const(label, self._ref(node.left, shared), 1)
+        chunk.jump(label, self._ref(node, shared))
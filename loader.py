@@ -0,0 +1,262 @@
+"""
+Программы-загрузчики, записывающие образ EmuChunk в банк памяти.
+
+plain - по одной инструкции write на слово, как исторически выводил compile().
+packed - слова упакованы в 53-битные числа по несколько штук или сжаты повторами,
+короткий цикл распаковки записывает их в банк. Размер загрузчика зависит от объема информации,
+а не от количества слов, ценой нескольких инструкций логики на слово при загрузке.
+patch - обновление работающей программы: записываются только слова, отличающиеся от развернутого ранее образа.
+"""
+from difflib import SequenceMatcher
+
+SAFE_BITS = 53  # Целые числа до 2^53 представимы в double без потерь
+
+# Заголовок упакованного числа: количество слов, ширина слова в битах и флаг zigzag-кодирования знака
+COUNT_BITS = 6
+WIDTH_BITS = 5
+SIGN_BITS = 1
+HEADER_BITS = COUNT_BITS + WIDTH_BITS + SIGN_BITS
+PAYLOAD_BITS = SAFE_BITS - HEADER_BITS
+MAX_COUNT = (1 << COUNT_BITS) - 1
+
+# Стоимость частей цикла распаковки в инструкциях логики, должна совпадать с текстом packed()
+COST_PROLOGUE = 3  # wait, set addr, set i
+COST_LITERAL = 2 + 2 + 8 + 2  # Переход по таблице, строка таблицы, заголовок, шаг к следующему числу
+COST_PACKED = 3  # Вычисление маски и выход из цикла
+COST_WORD = 6  # and, shr, jump, write, add, jump
+COST_SIGN = 4  # Декодирование zigzag
+COST_RUN = 4  # Декодирование zigzag значения повтора
+COST_RUN_WORD = 3  # write, add, jump
+COST_EPILOGUE = 2  # wait, jump
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _is_word(value) -> bool:
+    """Слово можно упаковать: целое, укладывающееся в полезную нагрузку."""
+    return float(value).is_integer() and _zigzag(int(value)).bit_length() <= PAYLOAD_BITS
+
+
+def plan(image: list) -> tuple[list, list]:
+    """
+    Разбивает образ на упакованные числа.
+
+    Возвращает список (число, слов, ширина, со знаком) и список (адрес, значение) слов,
+    которые нельзя упаковать и записываются отдельно.
+    """
+    words = [int(value) if _is_word(value) else 0 for value in image]
+    raw = [(n, value) for n, value in enumerate(image) if not _is_word(value)]
+    literals = []
+    n = 0
+    while n < len(words):
+        run = 1
+        while n + run < len(words) and run < MAX_COUNT and words[n + run] == words[n]:
+            run += 1
+
+        count, width, signed = 0, 1, False
+        while n + count < len(words) and count < MAX_COUNT:
+            value = words[n + count]
+            next_signed = signed or value < 0
+            next_width = max(width, max(_zigzag(w) if next_signed else w
+                                        for w in words[n:n + count + 1]).bit_length())
+            if (count + 1) * next_width > PAYLOAD_BITS:
+                break
+            count, width, signed = count + 1, next_width, next_signed
+
+        if run >= count:
+            # Повтор: ширина 0, полезная нагрузка - само значение в zigzag
+            literals.append((_zigzag(words[n]) << HEADER_BITS | run, run, 0, True))
+            n += run
+            continue
+        payload = 0
+        for value in reversed(words[n:n + count]):
+            payload = payload << width | (_zigzag(value) if signed else value)
+        header = (int(signed) << WIDTH_BITS | width) << COUNT_BITS | count
+        literals.append((payload << HEADER_BITS | header, count, width, signed))
+        n += count
+    return literals, raw
+
+
+def plain(image: list, bank: str = "bank1") -> str:
+    """Загрузчик по одной инструкции write на слово."""
+    lines = ["wait 1"]
+    lines.extend(f"write {value} {bank} {n}" for n, value in enumerate(image))
+    lines.append("wait 10")
+    lines.append(f"jump {len(image) + 1} always 0 0")
+    return "\n".join(lines)
+
+
+def packed(image: list, bank: str = "bank1") -> str:
+    """Загрузчик с упакованными словами и циклом распаковки."""
+    literals, raw = plan(image)
+    lines = [
+        "wait 1",
+        "set addr 0",
+        "set i 0",
+        "op mul t i 2",  # 3: переход к строке таблицы с очередным числом
+        "op add @counter t {table}",
+        f"op and k v {MAX_COUNT}",  # 5: заголовок
+        f"op shr v v {COUNT_BITS}",
+        f"op and w v {(1 << WIDTH_BITS) - 1}",
+        f"op shr v v {WIDTH_BITS}",
+        "op and z v 1",
+        f"op shr v v {SIGN_BITS}",
+        "op add end addr k",
+        "jump 26 equal w 0",
+        "op shl m 1 w",  # 13: упакованные слова
+        "op sub m m 1",
+        "op and x v m",
+        "op shr v v w",
+        "jump 22 equal z 0",
+        "op shr s x 1",
+        "op and x x 1",
+        "op sub x 0 x",
+        "op xor x x s",
+        f"write x {bank} addr",  # 22
+        "op add addr addr 1",
+        "jump 15 lessThan addr end",
+        "jump 33 always 0 0",
+        "op shr s v 1",  # 26: повтор значения
+        "op and x v 1",
+        "op sub x 0 x",
+        "op xor x x s",
+        f"write x {bank} addr",  # 30
+        "op add addr addr 1",
+        "jump 30 lessThan addr end",
+        "op add i i 1",  # 33: следующее число
+        f"jump 3 lessThan i {len(literals)}",
+    ]
+    lines.extend(f"write {value} {bank} {n}" for n, value in raw)
+    lines.append("wait 10")
+    lines.append(f"jump {len(lines)} always 0 0")
+    lines[4] = lines[4].format(table=len(lines))
+    for value, *_ in literals:
+        lines.append(f"set v {value}")
+        lines.append("jump 5 always 0 0")
+    return "\n".join(lines)
+
+
+LOADERS = {"plain": plain, "packed": packed}
+
+
+def stats(image: list) -> dict:
+    """Размер загрузчиков в строках и оценка количества инструкций логики, выполняемых при загрузке."""
+    literals, raw = plan(image)
+    instructions = COST_PROLOGUE + len(raw) + COST_EPILOGUE
+    for _, count, width, signed in literals:
+        instructions += COST_LITERAL
+        if width == 0:
+            instructions += COST_RUN + COST_RUN_WORD * count
+        else:
+            instructions += COST_PACKED + (COST_WORD + (COST_SIGN if signed else 0)) * count
+    return {
+        "plain": {"lines": len(image) + 3, "instructions": len(image) + 3},
+        "packed": {"lines": 35 + len(raw) + 2 + len(literals) * 2, "instructions": instructions},
+    }
+
+
+MOVE_MIN = 8  # Сдвинутый совпавший участок короче записывается словами, а не переносится циклом копирования
+
+
+def diff(old: list, new: list) -> tuple[list, list, list]:
+    """
+    Выравнивание развернутого образа old и нового new.
+
+    Возвращает совпавшие участки (начало в old, начало в new, длина): на том же месте любой длины,
+    со сдвигом - от MOVE_MIN слов, список переносов - совпавших участков со сдвигом, и список (адрес, значение)
+    остальных слов new, отличающихся от old.
+    """
+    matcher = SequenceMatcher(None, old, new, autojunk=False)
+    blocks = [block for block in matcher.get_matching_blocks() if block.size and (block.a == block.b
+                                                                                 or block.size >= MOVE_MIN)]
+    covered = set()
+    for a, b, size in blocks:
+        covered.update(range(b, b + size))
+    moves = [(a, b, size) for a, b, size in blocks if a != b]
+    writes = [(n, value) for n, value in enumerate(new)
+              if n not in covered and (n >= len(old) or old[n] != value)]
+    return [tuple(block) for block in blocks], moves, writes
+
+
+def _move(lines: list, source: int, target: int, size: int, bank: str):
+    """
+    Копирование участка банка циклом. Участок, сдвигаемый к большим адресам, копируется с конца,
+    чтобы не затереть еще не прочитанные слова.
+    """
+    if target > source:
+        lines += [f"set s {source + size - 1}", f"set d {target + size - 1}"]
+        loop = len(lines)
+        lines += [f"read x {bank} s", f"write x {bank} d", "op sub s s 1", "op sub d d 1",
+                  f"jump {loop} greaterThanEq d {target}"]
+    else:
+        lines += [f"set s {source}", f"set d {target}"]
+        loop = len(lines)
+        lines += [f"read x {bank} s", f"write x {bank} d", "op add s s 1", "op add d d 1",
+                  f"jump {loop} lessThan d {target + size}"]
+
+
+def patch(old: list, new: list, threads=(), bank: str = "bank1", cell: str = "cell1") -> str:
+    """
+    Загрузчик, превращающий развернутый образ old в new: переносит совпавшие участки со сдвигом
+    и записывает только отличающиеся слова. Время и размер зависят от объема изменений, а не от размера образа.
+
+    Ядра threads останавливаются через ячейку потоков cell, как их настраивает goto_thread: ожидание
+    свободной ячейки (-1 в слове 0), номер ядра в слове 0, ожидание подтверждения в слове 1, сохранение счетчика
+    команд, -1 на его месте и освобождение ячейки. Ядро, запущенное другим ядром до остановки всех, останавливается
+    снова.
+    После записи счетчики переводятся в адреса нового образа по совпавшим участкам. Если счетчик хотя бы
+    одного ядра попал на измененные слова, все ядра, кроме первого, останавливаются, а первое запускается
+    с адреса 0. Видеоядро не останавливается и его таблица сопрограмм не меняется, поэтому сопрограммы и очереди
+    дисплея должны остаться на своих адресах (Artifact.patch проверяет это). Контроллер ядер не должен запускаться
+    во время обновления.
+    Переменные в неизмененных и перенесенных участках сохраняют текущие значения.
+    """
+    blocks, moves, writes = diff(old, new)
+    lines = ["wait 1"]
+    lines += [f"set pc{thread} -1" for thread in threads]
+    claims = {}
+    for thread in threads:
+        # Ячейка захватывается, как в goto_lock ядра: goto_thread и parallel_for другого ядра могут настраивать
+        # ядро одновременно с загрузчиком
+        claims[thread] = len(lines)
+        lines += [f"read c {cell} 0", f"jump {len(lines)} notEqual c -1"]
+        lines += [f"write {thread} {cell} 0", f"write 0 {cell} 1"]
+        lines += [f"read r {cell} 1", f"jump {len(lines)} notEqual r 1"]
+        lines += [f"read pc {cell} {thread}", f"jump {len(lines) + 3} equal pc -1", f"set pc{thread} pc",
+                  f"write -1 {cell} {thread}", f"write -1 {cell} 0"]
+    # Ядро, запущенное goto_thread между захватами, останавливается снова с новым счетчиком
+    for thread in threads:
+        lines += [f"read c {cell} {thread}", f"jump {claims[thread]} notEqual c -1"]
+
+    # Переносы к меньшим адресам по возрастанию, к большим - по убыванию: участки выравнивания упорядочены
+    # в обоих образах, поэтому ни один перенос не затирает источник еще не выполненного
+    for source, target, size in [move for move in moves if move[1] < move[0]]:
+        _move(lines, source, target, size, bank)
+    for source, target, size in reversed([move for move in moves if move[1] > move[0]]):
+        _move(lines, source, target, size, bank)
+    lines.extend(f"write {value} {bank} {n}" for n, value in writes)
+
+    if threads:
+        # Перевод счетчиков подпрограммой map: -1 остается -1, адрес вне совпавших участков - restart
+        lines.append("set restart 0")
+        for thread in threads:
+            lines += [f"set pc pc{thread}", "op add ret @counter 1", "jump {map} always 0 0",
+                      f"set pc{thread} pc"]
+        lines.append(f"jump {len(lines) + 1 + len(threads)} equal restart 0")
+        lines += [f"set pc{thread} -1" for thread in threads[1:]]
+        lines += [f"set pc{threads[0]} 0"]
+        lines += [f"write pc{thread} {cell} {thread}" for thread in threads]
+        lines += ["wait 10", f"jump {len(lines)} always 0 0"]
+        mapping = len(lines)
+        lines = [line.format(map=mapping) for line in lines]
+        lines.append(f"jump {mapping + 2 + 4 * len(blocks)} lessThan pc 0")
+        for a, b, size in blocks:
+            skip = len(lines) + 4
+            lines += [f"jump {skip} lessThan pc {a}", f"jump {skip} greaterThanEq pc {a + size}",
+                      f"op add pc pc {b - a}", "set @counter ret"]
+        lines += ["set restart 1", "set @counter ret"]
+    else:
+        lines += ["wait 10", f"jump {len(lines)} always 0 0"]
+    return "\n".join(lines)
@@ -0,0 +1,500 @@
+import math
+import re
+from pathlib import Path
+from random import Random
+
+import coregen
+from mindvm import EmuChunk, EmuDisplay
+
+
+class LogicMemory:
+    """Ячейка или банк памяти."""
+
+    CELL = 64  # Размер memory-cell
+    BANK = 512  # Размер memory-bank
+
+    def __init__(self, size: int = CELL):
+        self.memory = [0] * size
+
+
+class LogicMessage:
+    """Блок сообщения."""
+
+    def __init__(self):
+        self.text = ""
+        self.flushes = 0
+
+
+class LogicDisplay:
+    """Логический дисплей, хранит команды последнего выведенного кадра."""
+
+    def __init__(self):
+        self.frame = []
+        self.frames = 0
+
+
+class LogicSwitch:
+    """Переключатель."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+
+
+class LogicProcessor:
+    """
+    Процессор логики Mindustry, выполняющий программу на masm.
+
+    Все переменные и константы хранятся в слотах списка, нулевой слот - @counter,
+    поэтому запись в @counter через read, set или op сразу меняет следующую инструкцию.
+    """
+
+    MICRO = 2  # Инструкций за тик микропроцессора
+    LOGIC = 8  # Инструкций за тик логического процессора
+    HYPER = 25  # Инструкций за тик гиперпроцессора
+
+    MAX_GRAPHICS_BUFFER = 256  # Максимальное количество команд draw до drawflush
+    MAX_TEXT_BUFFER = 400  # Максимальная длина текста до printflush
+
+    TOKEN = re.compile(r'"[^"]*"|\S+')
+
+    # Операции op: (аргументы, функция), деление на ноль дает некорректное число, которое логика заменяет нулем
+    OPERATIONS = {
+        "add": (2, lambda a, b: a + b),
+        "sub": (2, lambda a, b: a - b),
+        "mul": (2, lambda a, b: a * b),
+        "div": (2, lambda a, b: a / b if b != 0 else 0),
+        "idiv": (2, lambda a, b: math.floor(a / b) if b != 0 else 0),
+        "mod": (2, lambda a, b: math.fmod(a, b) if b != 0 else 0),
+        "pow": (2, lambda a, b: a ** b if a >= 0 or b == int(b) else 0),
+        "equal": (2, lambda a, b: int(abs(a - b) < 0.000001)),
+        "notEqual": (2, lambda a, b: int(abs(a - b) >= 0.000001)),
+        "land": (2, lambda a, b: int(a != 0 and b != 0)),
+        "lessThan": (2, lambda a, b: int(a < b)),
+        "lessThanEq": (2, lambda a, b: int(a <= b)),
+        "greaterThan": (2, lambda a, b: int(a > b)),
+        "greaterThanEq": (2, lambda a, b: int(a >= b)),
+        "strictEqual": (2, lambda a, b: int(a == b)),
+        "shl": (2, lambda a, b: int(a) << int(b)),
+        "shr": (2, lambda a, b: int(a) >> int(b)),
+        "or": (2, lambda a, b: int(a) | int(b)),
+        "and": (2, lambda a, b: int(a) & int(b)),
+        "xor": (2, lambda a, b: int(a) ^ int(b)),
+        "not": (1, lambda a, b: ~int(a)),
+        "max": (2, max),
+        "min": (2, min),
+        "abs": (1, lambda a, b: abs(a)),
+        "floor": (1, lambda a, b: math.floor(a)),
+        "ceil": (1, lambda a, b: math.ceil(a)),
+        "sqrt": (1, lambda a, b: math.sqrt(a) if a >= 0 else 0),
+        "sin": (1, lambda a, b: math.sin(math.radians(a))),
+        "cos": (1, lambda a, b: math.cos(math.radians(a))),
+        "len": (2, lambda a, b: math.hypot(a, b)),
+        "rand": (1, None),  # Использует генератор процессора
+    }
+
+    CONDITIONS = {
+        "equal": lambda a, b: abs(a - b) < 0.000001,
+        "notEqual": lambda a, b: abs(a - b) >= 0.000001,
+        "lessThan": lambda a, b: a < b,
+        "lessThanEq": lambda a, b: a <= b,
+        "greaterThan": lambda a, b: a > b,
+        "greaterThanEq": lambda a, b: a >= b,
+        "strictEqual": lambda a, b: a == b,
+        "always": lambda a, b: True,
+    }
+
+    def __init__(self, code: str, links: dict | None = None, ipt: float = HYPER, seed: int | None = 0):
+        self.links = dict(links or {})
+        self.ipt = ipt
+        self.enabled = True
+        self.random = Random(seed)
+        self.accumulator = 0.0
+        self.executed = 0  # Количество выполненных инструкций
+        self.text = []  # Текстовый буфер print
+        self.graphics = []  # Буфер команд draw
+
+        self.slots = {"@counter": 0}
+        self.values = [0]
+        self.instructions = [self._compile(line) for line in code.splitlines() if line.strip()]
+        self.waited = [0.0] * len(self.instructions)  # Прошедшее время каждой инструкции wait
+
+        # Профилирование: при выполнении строки из markers метка текущей стоимости меняется
+        self.markers = {}
+        self.tag = None
+        self.costs = {}  # Инструкции по меткам
+        self.hits = {}  # Количество установок каждой метки
+
+    def __getitem__(self, name: str):
+        """Значение переменной процессора."""
+        return self.values[self.slots[name]] if name in self.slots else None
+
+    def profile(self, line: int, variable: str | None = None):
+        """Начинать новую метку стоимости на строке line: значение variable или None."""
+        self.markers[line] = self._slot(variable) if variable else None
+
+    def _slot(self, token: str) -> int:
+        """Слот переменной или константы для токена программы."""
+        if token in self.slots:
+            return self.slots[token]
+        self.slots[token] = len(self.values)
+        if token.startswith('"'):
+            value = token[1:-1].replace("\\n", "\n")
+        elif token in ("true", "false"):
+            value = int(token == "true")
+        elif token == "null":
+            value = None
+        elif token.startswith("@"):
+            value = token
+        else:
+            try:
+                value = int(token, 0) if re.fullmatch(r"-?(0x[0-9a-fA-F]+|0b[01]+|\d+)", token) else float(token)
+            except ValueError:
+                value = self.links.get(token)  # Ссылки на блоки и переменные, по умолчанию null
+        self.values.append(value)
+        return self.slots[token]
+
+    @staticmethod
+    def _num(value):
+        """Числовое значение переменной: объекты дают 1, null - 0."""
+        if value.__class__ is int or value.__class__ is float:
+            return value
+        return 0 if value is None or value is False else 1
+
+    @staticmethod
+    def _valid(value):
+        """Некорректные числа (NaN, бесконечность) логика заменяет нулем."""
+        if value.__class__ is float and (value != value or value in (math.inf, -math.inf)):
+            return 0
+        return value
+
+    def _compile(self, line: str):
+        """Превращает строку программы в замыкание над списком значений."""
+        tokens = self.TOKEN.findall(line)
+        name, args = tokens[0], tokens[1:] + ["0"] * 8
+        v = self.values
+        num = self._num
+
+        if name == "set":
+            r, a = self._slot(args[0]), self._slot(args[1])
+
+            def run():
+                v[r] = v[a]
+        elif name == "op":
+            count, func = self.OPERATIONS[args[0]]
+            r, a, b = self._slot(args[1]), self._slot(args[2]), self._slot(args[3])
+            valid = self._valid
+            if args[0] == "rand":
+                random = self.random.random
+
+                def run():
+                    v[r] = random() * num(v[a])
+            elif count == 1:
+                def run():
+                    v[r] = valid(func(num(v[a]), 0))
+            else:
+                def run():
+                    v[r] = valid(func(num(v[a]), num(v[b])))
+        elif name == "read":
+            r, block, at = self._slot(args[0]), self._slot(args[1]), self._slot(args[2])
+
+            def run():
+                memory = getattr(v[block], "memory", None)
+                if memory is not None:
+                    address = int(num(v[at]))
+                    v[r] = memory[address] if 0 <= address < len(memory) else 0
+        elif name == "write":
+            a, block, at = self._slot(args[0]), self._slot(args[1]), self._slot(args[2])
+
+            def run():
+                memory = getattr(v[block], "memory", None)
+                if memory is not None:
+                    address = int(num(v[at]))
+                    if 0 <= address < len(memory):
+                        memory[address] = num(v[a])
+        elif name == "jump":
+            target = int(args[0])
+            check = self.CONDITIONS[args[1]]
+            a, b = self._slot(args[2]), self._slot(args[3])
+            if args[1] == "always":
+                def run():
+                    v[0] = target
+            elif args[1] == "strictEqual":
+                def run():
+                    if v[a] == v[b]:
+                        v[0] = target
+            else:
+                def run():
+                    if check(num(v[a]), num(v[b])):
+                        v[0] = target
+        elif name == "print":
+            a = self._slot(args[0])
+
+            def run():
+                value = v[a]
+                if len(self.text) < self.MAX_TEXT_BUFFER:
+                    self.text.append(self._format(value))
+        elif name == "printflush":
+            block = self._slot(args[0])
+
+            def run():
+                message = v[block]
+                if isinstance(message, LogicMessage):
+                    message.text = "".join(self.text)[:self.MAX_TEXT_BUFFER]
+                    message.flushes += 1
+                self.text.clear()
+        elif name == "draw":
+            kind = args[0]
+            slots = [self._slot(arg) for arg in args[1:7]]
+
+            def run():
+                if len(self.graphics) < self.MAX_GRAPHICS_BUFFER:
+                    self.graphics.append((kind, *[num(v[s]) for s in slots]))
+        elif name == "drawflush":
+            block = self._slot(args[0])
+
+            def run():
+                display = v[block]
+                if isinstance(display, LogicDisplay):
+                    display.frame = self.graphics
+                    display.frames += 1
+                self.graphics = []
+        elif name == "wait":
+            a = self._slot(args[0])
+
+            def run():
+                # Ожидание уступает тик и повторяет инструкцию, пока не пройдет нужное время
+                n = v[0] - 1
+                if self.waited[n] >= num(v[a]):
+                    self.waited[n] = 0.0
+                else:
+                    self.waited[n] += 1 / 60
+                    v[0] = n
+                    raise _Yield
+        elif name == "sensor":
+            r, block, prop = self._slot(args[0]), self._slot(args[1]), self._slot(args[2])
+
+            def run():
+                target = v[block]
+                v[r] = int(bool(getattr(target, "enabled", False))) if v[prop] == "@enabled" else None
+        elif name == "control":
+            block, a = self._slot(args[1]), self._slot(args[2])
+
+            def run():
+                target = v[block]
+                if args[0] == "enabled" and target is not None:
+                    target.enabled = bool(num(v[a]))
+        elif name == "getlink":
+            r, a = self._slot(args[0]), self._slot(args[1])
+
+            def run():
+                links = list(self.links.values())
+                index = int(num(v[a]))
+                v[r] = links[index] if 0 <= index < len(links) else None
+        elif name == "end":
+            def run():
+                v[0] = len(self.instructions)
+        elif name == "noop":
+            def run():
+                pass
+        else:
+            raise ValueError(f"Unsupported instruction: {line}")
+        return run
+
+    @staticmethod
+    def _format(value) -> str:
+        if value is None:
+            return "null"
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)):
+            if abs(value - round(value)) < 0.00001:
+                return str(int(round(value)))
+            return str(value)
+        return type(value).__name__
+
+    def run(self, count: int) -> int:
+        """Выполняет до count инструкций, возвращает количество выполненных до уступки тика."""
+        v = self.values
+        num = self._num
+        instructions = self.instructions
+        total = len(instructions)
+        markers = self.markers
+        costs = self.costs
+        done = 0
+        marked = 0  # Выполнено инструкций до начала текущей метки
+        try:
+            while done < count:
+                counter = v[0]
+                if counter.__class__ is not int:
+                    counter = int(num(counter))
+                if counter >= total or counter < 0:
+                    counter = 0
+                v[0] = counter + 1
+                done += 1
+                if counter in markers:
+                    costs[self.tag] = costs.get(self.tag, 0) + done - 1 - marked
+                    marked = done - 1
+                    instructions[counter]()
+                    slot = markers[counter]
+                    self.tag = num(v[slot]) if slot is not None else None
+                    self.hits[self.tag] = self.hits.get(self.tag, 0) + 1
+                else:
+                    instructions[counter]()
+        except _Yield:
+            pass
+        if markers:
+            costs[self.tag] = costs.get(self.tag, 0) + done - marked
+        self.executed += done
+        return done
+
+    def tick(self, delta: float = 1.0):
+        """Один игровой тик: выполнение накопленного бюджета инструкций."""
+        if not self.enabled:
+            return
+        self.accumulator = min(self.accumulator + self.ipt * delta, self.ipt * 2)
+        count = int(self.accumulator)
+        if count > 0:
+            self.accumulator -= self.run(count)
+
+
+class _Yield(Exception):
+    """Процессор уступает остаток тика (wait)."""
+
+
+class LogicWorld:
+    """Набор процессоров, выполняемых по тикам в порядке добавления."""
+
+    TICKS_PER_SECOND = 60
+
+    def __init__(self):
+        self.processors = []
+        self.ticks = 0
+
+    def add(self, processor: LogicProcessor) -> LogicProcessor:
+        self.processors.append(processor)
+        return processor
+
+    def run(self, ticks: int):
+        for _ in range(ticks):
+            for processor in self.processors:
+                processor.tick()
+            self.ticks += 1
+
+
+class LogicBuild(LogicWorld):
+    """
+    Схема MindVM из процессоров логики: ядра core.masm, видеоядро videocore.masm, процессоры таблиц
+    переходов и контроллер ядер, повторяющая связи scheme.msch.
+
+    Профилирование ядер относит инструкции к коду операции VM, прочитанному строкой диспетчеризации,
+    а чтение счетчика команд ядра до диспетчеризации и цикл ожидания - к метке None.
+    """
+
+    BUILDINGS = Path(__file__).parent / "buildings"
+
+    def __init__(self, image: list | None = None, cores: int | None = None, core_ipt: float = LogicProcessor.HYPER,
+                 video_ipt: float = LogicProcessor.HYPER, seed: int | None = 0, far: list[list] = ()):
+        super().__init__()
+        # По умолчанию ядра, для которых собран Artifact, или EmuChunk.CORES
+        cores = cores or getattr(image, "cores", EmuChunk.CORES)
+        self.bank = LogicMemory(LogicMemory.BANK)
+        # Дополнительные банки карты памяти EmuChunk, связанные с ядрами и видеоядром как bank2, bank3...
+        self.banks = [self.bank] + [LogicMemory(LogicMemory.BANK) for _ in range(len(far))]
+        banks = {f"bank{n}": bank for n, bank in enumerate(self.banks, start=1)}
+        self.threads = LogicMemory()
+        self.message = LogicMessage()
+        self.display = LogicDisplay()
+        self.reset = LogicSwitch(True)  # Кнопка запуска главного ядра
+        core_commands, video_shaders, video_commands = LogicMemory(), LogicMemory(), LogicMemory()
+
+        tables = [
+            self.add(LogicProcessor(self._read("core_commands.masm"), {"cell1": core_commands}, LogicProcessor.MICRO)),
+            self.add(LogicProcessor(self._read("videocore_commands.masm"), {"cell1": video_commands},
+                                    LogicProcessor.MICRO)),
+        ]
+        # В игре таблицы переходов заполнены до нажатия кнопки запуска. Ядро, запущенное раньше, по нулевой
+        # записи таблицы перешло бы на начало core.masm и отключилось
+        for table in tables:
+            table.run(len(table.instructions) - 1)
+
+        self.cores = []
+        core = self._read("core.masm")
+        for thread in range(EmuChunk.MAIN_THREAD, EmuChunk.MAIN_THREAD + cores):
+            processor = self.add(LogicProcessor(
+                coregen.for_thread(core, thread),
+                {"cell1": self.threads, "cell2": core_commands, "message1": self.message, **banks},
+                core_ipt, seed=None if seed is None else seed + thread
+            ))
+            processor.profile(coregen.FETCH_LINE)
+            processor.profile(coregen.DISPATCH_LINE, "c")
+            self.cores.append(processor)
+
+        self.video = self.add(LogicProcessor(
+            self._read("videocore.masm"),
+            {"display1": self.display, "cell1": video_shaders, "cell2": video_commands, **banks},
+            video_ipt
+        ))
+        # Контроллер ядер генерируется под их количество, buildings/threads.masm - для EmuChunk.CORES
+        self.add(LogicProcessor(coregen.threads(cores), {"cell1": self.threads, "switch1": self.reset},
+                                LogicProcessor.MICRO))
+
+        if image is not None:
+            self.load(image, far)
+
+    def _read(self, name: str) -> str:
+        return (self.BUILDINGS / name).read_text()
+
+    def load(self, image: list, far: list[list] = ()):
+        """Записывает образ и образы дополнительных банков в память напрямую, без процессоров-загрузчиков."""
+        for bank, words in zip(self.banks, [image, *far]):
+            if len(words) > LogicMemory.BANK:
+                raise ValueError(f"Image of {len(words)} words does not fit into {LogicMemory.BANK} words")
+            bank.memory[:len(words)] = words
+
+    def press(self, key: int):
+        """Нажатие клавиши клавиатуры."""
+        self.bank.memory[EmuDisplay.ADDRESS - 9 + key] = 1
+
+    @property
+    def seconds(self) -> float:
+        return self.ticks / self.TICKS_PER_SECOND
+
+    @property
+    def fps(self) -> float:
+        """Кадров в секунду игрового времени."""
+        return self.display.frames / self.seconds if self.ticks else 0.0
+
+    def report(self) -> dict:
+        """
+        Стоимость кодов операций VM по всем ядрам.
+
+        Для каждого кода: количество выполнений, инструкций логики на обработчик вместе с общей
+        диспетчеризацией и тиков на одно выполнение при бюджете ядра.
+        """
+        names = {value: name for name, value in vars(EmuChunk).items() if name.startswith("OP_")}
+        costs, hits = {}, {}
+        for core in self.cores:
+            for tag, cost in core.costs.items():
+                costs[tag] = costs.get(tag, 0) + cost
+            for tag, count in core.hits.items():
+                hits[tag] = hits.get(tag, 0) + count
+        opcodes = {}
+        for tag in sorted(tag for tag in costs if tag is not None):
+            count = hits.get(tag, 0)
+            if not count:
+                continue
+            instructions = costs[tag] / count + coregen.PROLOGUE
+            opcodes[names.get(tag, tag)] = {
+                "count": count,
+                "instructions": instructions,
+                "ticks": instructions / self.cores[0].ipt,
+            }
+        return {
+            "ticks": self.ticks,
+            "seconds": self.seconds,
+            "fps": self.fps,
+            "frames": self.display.frames,
+            "processors": {n: processor.executed for n, processor in enumerate(self.processors)},
+            "idle": costs.get(None, 0),
+            "opcodes": opcodes,
+        }
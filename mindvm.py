@@ -1,20 +1,212 @@
+import sys
+from array import array
+from bisect import bisect_left
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from enum import Enum
+from functools import cached_property
+from pathlib import Path
 from typing import Callable
 
+import loader as loaders
+
 Type = Enum("Type", ["static", "var"])
 
+# Виды операндов инструкций:
+# ref - чтение по адресу, out - запись по адресу, inout - чтение и запись, out4 - запись 4 слов подряд,
+# value - непосредственное значение, target - цель перехода, entry - адрес начала кода для другого ядра,
+# base - адрес первого слова массива, по которому читаются и пишутся слова со смещением
+Operand = Enum("Operand", ["ref", "out", "inout", "out4", "value", "target", "entry", "base"])
 
-@dataclass
+# Модули, собирающие код за программу, и contextlib с конструкциями with: место вызова инструкции
+# ищется за их пределами
+LIBRARY_FILES = {__file__, str(Path(__file__).with_name("expression.py")), contextmanager.__code__.co_filename}
+
+
+@dataclass(slots=True)
 class Label:
     # Метка для обозначения позиции в коде
     position: int
     not_reassigned: bool = field(default=False)
 
 
+class Code:
+    """
+    Байт-код: целые слова в типизированном массиве words, слова, не представимые в нем (метки и нецелые числа),
+    в таблице relocations по позициям, в words на их месте 0. При сборке образа разрешается только таблица.
+    """
+
+    __slots__ = ("words", "relocations")
+
+    def __init__(self, values=()):
+        self.words = array("q")
+        self.relocations = {}  # Позиция -> метка или нецелое значение
+        self.extend(values)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        """Слово или список слов среза с метками на своих местах."""
+        if isinstance(index, slice):
+            words = self.words[index].tolist()
+            positions = range(*index.indices(len(self.words)))
+            if len(self.relocations) < len(positions):
+                for position, value in self.relocations.items():
+                    if position in positions:
+                        words[positions.index(position)] = value
+            else:
+                for n, position in enumerate(positions):
+                    if position in self.relocations:
+                        words[n] = self.relocations[position]
+            return words
+        if index < 0:
+            index += len(self.words)
+        return self.relocations.get(index, self.words[index])
+
+    def append(self, value):
+        if isinstance(value, int):
+            try:
+                self.words.append(value)
+                return
+            except OverflowError:
+                pass
+        self.relocations[len(self.words)] = value
+        self.words.append(0)
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+
+@dataclass
+class Artifact:
+    # Результат EmuChunk.compile()
+    words: list  # Образ памяти с разрешенными метками
+    symbols: dict[int, str]  # Адрес -> запись data или место вызова, с которого начинаются инструкции
+    loader: str = "plain"  # Вид загрузчика text (loader.LOADERS)
+    far: list[list] = field(default_factory=list)  # Образы дополнительных банков bank2, bank3...
+    cores: int = 4  # Ядер, на которые рассчитан стек возвратов (EmuChunk(cores=...))
+    # Адреса сопрограмм и очередей, переданных видеоядру SHADER_MAP и QUEUE_START, None - адрес в переменной
+    shaders: tuple[int, ...] | None = ()
+
+    @cached_property
+    def text(self) -> str:
+        """Текст программы-загрузчика bank1, собирается при первом обращении."""
+        return loaders.LOADERS[self.loader](self.words)
+
+    @cached_property
+    def texts(self) -> dict[str, str]:
+        """Загрузчики всех банков по именам блоков памяти, по одному процессору на банк."""
+        texts = {"bank1": self.text}
+        for n, image in enumerate(self.far, start=2):
+            texts[f"bank{n}"] = loaders.LOADERS[self.loader](image, f"bank{n}")
+        return texts
+
+    def patch(self, previous: "Artifact", cores: int | None = None) -> dict[str, str]:
+        """
+        Загрузчики-обновления развернутого ранее previous до этого образа по именам блоков памяти (loader.patch):
+        записываются только изменившиеся слова. Загрузчик bank1 останавливает и возобновляет cores ядер
+        (по умолчанию ядра, для которых собран образ), дополнительные банки обновляются без остановки.
+
+        Видеоядро во время обновления продолжает выполнять сопрограммы по адресам своей таблицы, поэтому
+        если адреса сопрограмм или очередей изменились или неизвестны, возвращаются полные загрузчики texts,
+        после которых схему нужно перезапустить.
+        """
+        if self.shaders is None or self.shaders != previous.shaders:
+            return self.texts
+        threads = range(EmuChunk.MAIN_THREAD, EmuChunk.MAIN_THREAD + (cores or self.cores))
+        texts = {"bank1": loaders.patch(previous.words, self.words, threads)}
+        for n, image in enumerate(self.far, start=2):
+            old = previous.far[n - 2] if n - 2 < len(previous.far) else []
+            texts[f"bank{n}"] = loaders.patch(old, image, bank=f"bank{n}")
+        return texts
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __getitem__(self, index):
+        return self.words[index]
+
+
+@dataclass
+class Barrier:
+    # Барьер EmuChunk.barrier(): у каждого ядра свой счетчик прибытий, который пишет только это ядро,
+    # поэтому одновременные прибытия не теряются
+    counters: dict[int, list[int]]  # Номер ядра -> переменная счетчика
+    temps: dict[int, list[int]]  # Номер ядра -> переменная сравнения при ожидании
+
+
+@dataclass
+class Array:
+    # Массив EmuChunk.array(): подряд идущие переменные data, к словам обращаются OP_LOAD_INDIRECT,
+    # OP_STORE_INDIRECT, OP_MEMCPY и OP_MEMSET по адресу первого слова
+    items: list[list[int]]  # Ссылки на переменные элементов, обновляются при перемещении данных
+
+    @property
+    def base(self) -> int:
+        return self.items[0][0]
+
+    def __getitem__(self, index) -> list[int]:
+        return self.items[index]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+@dataclass
+class Loop:
+    # Цикл EmuChunk.while_() или for_range(): метки проверки условия (continue_) и выхода (break_)
+    next: Label
+    end: Label
+
+
+@dataclass(eq=False)
+class Function:
+    # Функция EmuChunk.function(): тело собирается один раз после основного кода и вызывается OP_CALL
+    body: Callable
+    label: Label  # Метка первой инструкции тела
+    inline: bool = False  # Тело копируется в место каждого вызова вместо OP_CALL
+    calls: int = 0  # Количество мест вызова
+    words: int = 0  # Слов тела до оптимизации, без OP_RET
+    emitted: bool = False
+    callees: list = field(default_factory=list)  # Функции, вызываемые из тела через OP_CALL
+
+    @property
+    def name(self) -> str:
+        return self.body.__name__
+
+
+@dataclass
+class Instruction:
+    # Инструкция или непрерывный участок данных в коде
+    start: int  # Позиция первого слова в коде на момент разбора
+    words: list
+    data: bool = field(default=False)
+    verbatim: bool = field(default=True)  # Слова соответствуют исходным позициям start.. один к одному
+
+    @property
+    def opcode(self):
+        return self.words[0]
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.words)
+
+
 class EmuChunk:
     # Список поддерживаемых выводимых символов
     CHARS = list("ABCDEFGHIJKLMNOPQRSTUVWXYZ\n ,.=")
+    # Упакованные строки OP_PRINT: символ - номер в CHARS + 1 в PRINT_BITS битах, 0 - конец слова,
+    # до PRINT_CHARS символов в слове начиная с младших битов, последнее слово строки записывается со знаком минус
+    PRINT_BITS = 5
+    PRINT_CHARS = 10
 
     # Специальные константы
     NON_ZERO = [0]  # Ссылка на истинное значение
@@ -40,6 +232,74 @@ class EmuChunk:
     OP_CONST_RAND = 16  # Сгенерировать случайное число в пределах константы
     OP_GOTO_THREAD = 17  # Установка счетчика команд для другого ядра
 
+    # Суперинструкции, заменяющие частые последовательности при оптимизации по шаблонам
+    OP_WAIT_EQ = 18  # Ожидать, пока переменная не станет равна константе
+    OP_JUMP_NEQ_SET = 19  # Переход, если переменная не равна константе, иначе записать в нее значение
+    OP_ADD_JUMP_GT = 20  # Добавить константу к переменной и перейти, если она больше константы
+
+    OP_DRAW = 21  # Добавить команду дисплея в очередь видеоядра (EmuDisplay.alloc_queue)
+    OP_CALL = 22  # Вызов функции: адрес возврата записывается в стек возвратов ядра
+    OP_RET = 23  # Возврат из функции по адресу из стека возвратов ядра
+    OP_LOAD_FAR = 24  # Копировать слово дополнительного банка памяти в переменную
+    OP_STORE_FAR = 25  # Копировать переменную в слово дополнительного банка памяти
+    OP_PRINT = 26  # Вывести строку, упакованную по PRINT_CHARS символов в слове
+    OP_LOAD_INDIRECT = 27  # Копировать слово массива по индексу из переменной в переменную
+    OP_STORE_INDIRECT = 28  # Копировать переменную в слово массива по индексу из переменной
+    OP_MEMCPY = 29  # Копировать слова массива в другой массив, области могут перекрываться
+    OP_MEMSET = 30  # Записать значение переменной в слова массива
+
+    # Стек возвратов: для каждого из CORES ядер начиная с MAIN_THREAD глубина и STACK_DEPTH адресов возврата
+    CORES = 4
+    STACK_DEPTH = 4
+
+    # Карта памяти: адрес n * BANK_SIZE + k - слово k банка bank{n + 1}. bank1 - основной банк с кодом, data,
+    # клавиатурой и почтовым ящиком дисплея, обычные инструкции обращаются только к нему.
+    # Дополнительные банки до MAX_BANKS доступны через OP_LOAD_FAR, OP_STORE_FAR и сопрограммы видеоядра
+    BANK_SIZE = 512
+    MAX_BANKS = 4
+
+    # Виды операндов каждого кода операции, операнды OP_CHAR - ссылки на символы до ссылки на -1,
+    # OP_PRINT - упакованные слова строки,
+    # OP_DRAW - адрес очереди, команда, количество аргументов и ссылки на аргументы
+    OPERANDS = {
+        OP_EXIT: (),
+        OP_SET: (Operand.out, Operand.value),
+        OP_COPY: (Operand.out, Operand.ref),
+        OP_ECHO: (Operand.ref,),
+        OP_FLUSH: (),
+        OP_MATH: (Operand.ref, Operand.ref, Operand.ref, Operand.out),
+        OP_JUMP: (Operand.target, Operand.ref),
+        OP_CHAR: None,
+        OP_CONTROL_THREAD: (Operand.ref, Operand.target),
+        OP_ADD_CONST: (Operand.inout, Operand.value),
+        OP_SUB_CONST: (Operand.inout, Operand.value),
+        OP_MUL_CONST: (Operand.inout, Operand.value),
+        OP_JUMP_NEQ_CONST: (Operand.target, Operand.ref, Operand.value),
+        OP_JUMP_GT_CONST: (Operand.target, Operand.ref, Operand.value),
+        OP_SET_4: (Operand.out4, Operand.value, Operand.value, Operand.value, Operand.value),
+        OP_CONST_RAND: (Operand.value, Operand.out),
+        OP_GOTO_THREAD: (Operand.value, Operand.entry),
+        OP_WAIT_EQ: (Operand.ref, Operand.value),
+        OP_JUMP_NEQ_SET: (Operand.target, Operand.inout, Operand.value, Operand.value),
+        OP_ADD_JUMP_GT: (Operand.inout, Operand.value, Operand.target, Operand.value),
+        OP_DRAW: None,
+        OP_CALL: (Operand.value, Operand.target),
+        OP_RET: (Operand.value,),
+        OP_LOAD_FAR: (Operand.out, Operand.value),
+        OP_STORE_FAR: (Operand.value, Operand.ref),
+        OP_PRINT: None,
+        OP_LOAD_INDIRECT: (Operand.out, Operand.base, Operand.ref),
+        OP_STORE_INDIRECT: (Operand.base, Operand.ref, Operand.ref),
+        OP_MEMCPY: (Operand.base, Operand.base, Operand.value),
+        OP_MEMSET: (Operand.base, Operand.ref, Operand.value),
+    }
+
+    # Коды операций, передающих управление внутри ядра
+    BRANCHES = (OP_JUMP, OP_JUMP_NEQ_CONST, OP_JUMP_GT_CONST, OP_JUMP_NEQ_SET, OP_ADD_JUMP_GT, OP_CALL)
+
+    # Виды операндов, являющиеся адресами памяти
+    ADDRESSES = (Operand.ref, Operand.out, Operand.inout, Operand.out4, Operand.base)
+
     # Коды математических операций
     OPERATION_ADD = 0  # Сложение (+)
     OPERATION_SUB = 1  # Вычитание (-)
@@ -52,29 +312,101 @@ class EmuChunk:
     OPERATION_IRAND = 8  # Сгенерировать целое случайное целое число
     OPERATION_MOD = 9  # Остаток от деления (%)
 
-    def __init__(self, perform_math_optimization=True):
+    def __init__(self, perform_math_optimization=True, perform_peephole_optimization=True,
+                 perform_dead_code_elimination=True, perform_slot_allocation=False, use_superinstructions=True,
+                 verbose=False, banks=1, cores=CORES):
         # Словарь для хранения ссылок на числа, оптимизирующий код
         # MATH не работает с константами, поэтому ссылки на неизменяемые значения сокращают их выделение в математических операциях.
         self.static = {}
 
         self.data = []  # Список данных
-        self.code = []  # Список байт(int)-кода
+        self.constants = {}  # Пул констант: значение -> индекс записи в data
+        self.code = Code()  # Байт-код
+        self.instructions = []  # Границы инструкций в коде: (позиция, длина), остальные слова - данные
+        self.handles = []  # Выданные ссылки на data, обновляются при перемещении данных оптимизациями
+        self.buffers = []  # Изменяемые при выполнении участки кода: (метка первого слова, количество слов)
+        self.sites = {}  # Позиция инструкции -> место вызова в исходном коде программы ("файл:строка")
+        self.functions: list[Function] = []  # Объявленные function() функции
+        self.stack = None  # Метка стека возвратов, выделяется при первом вызове функции
+        self.caller = None  # Функция, тело которой сейчас собирается
+        self.temporaries = {}  # Временные переменные выражений (expression.py) по номерам ядер
+        self.loops: list[Loop] = []  # Собираемые циклы while_() и for_range(), внутренний последний
+        self.branch = None  # (метка перехода мимо тела, позиция конца тела) последнего if_() для else_()
+        if not 1 <= banks <= self.MAX_BANKS:
+            raise ValueError(f"Memory map supports 1 to {self.MAX_BANKS} banks")
+        # Слова дополнительных банков по номерам банков и позиции в них отрицательных ссылок на data
+        # (обертки сопрограмм), переводимых вместе с адресами data
+        self.far = {bank: [] for bank in range(2, banks + 1)}
+        self.far_refs = {bank: set() for bank in range(2, banks + 1)}
+        # Позиции слов кода bank1 с отрицательными ссылками на data: аргументы-переменные оберток сопрограмм
+        # и адреса блоков SHADER_WATCH. Остальные отрицательные слова данных в коде - числа
+        self.data_refs = set()
+        if cores < 1:
+            raise ValueError("At least one core is required")
+        # Ядер схемы: стек возвратов OP_CALL выделяется для каждого из них
+        self.cores = cores
+        self.targets = set()  # Номера ядер, запускаемых goto_thread и parallel_for
+        self.video_starts = []  # Метки, адреса или переменные сопрограмм и очередей SHADER_MAP и QUEUE_START
 
         # Заменять ли операции MATH(ссылка, константа) на более быстрые ADD_CONST, SUB_CONST, MUL_CONST
         self.perform_math_optimization = perform_math_optimization
+        # Выполнять ли оптимизацию по шаблонам (optimizer.Peephole) перед разрешением меток
+        self.perform_peephole_optimization = perform_peephole_optimization
+        # Удалять ли недостижимый код и неиспользуемые константы (optimizer.DeadCode)
+        self.perform_dead_code_elimination = perform_dead_code_elimination
+        # Совмещать ли переменные с непересекающимся временем жизни в общих ячейках (optimizer.SlotAllocator)
+        self.perform_slot_allocation = perform_slot_allocation
+        # Заменять ли при оптимизации по шаблонам частые последовательности суперинструкциями OP_WAIT_EQ,
+        # OP_JUMP_NEQ_SET и OP_ADD_JUMP_GT, требующими ядра, сгенерированного coregen.py
+        self.use_superinstructions = use_superinstructions
+        self.optimizations = {}  # Количество примененных при сборке оптимизаций каждого вида
+        # Выводить ли ход сборки: замены MATH, вызовы SET_4, таблицу data и статистику compile()
+        self.verbose = verbose
+
+    def log(self, *args):
+        """Вывод хода сборки при verbose."""
+        if self.verbose:
+            print(*args)
 
     def append(self, *objects: int):
         """Добавление инструкций в байт-код."""
         for value in objects:
             self.code.append(value)
             if isinstance(value, int):
-                # Сохранение ссылки на число для использования в store_int
-                self.static[value] = len(self.code)
+                # Сохранение ссылки на первое вхождение числа для использования в store_int
+                self.static.setdefault(value, len(self.code))
+
+    def reserve(self, *objects: int) -> Label:
+        """Добавление слов, изменяемых при выполнении, возвращает метку первого слова. Они не используются store_int."""
+        label = Label(len(self.code) + 1)
+        self.code.extend(objects)
+        self.buffers.append((label, len(objects)))
+        return label
+
+    @staticmethod
+    def call_site() -> str | None:
+        """Место вызова в программе: первый кадр стека вне mindvm.py, expression.py и contextlib."""
+        frame = sys._getframe(1)
+        while frame is not None and frame.f_code.co_filename in LIBRARY_FILES:
+            frame = frame.f_back
+        return None if frame is None else f"{Path(frame.f_code.co_filename).name}:{frame.f_lineno}"
+
+    def emit(self, *objects):
+        """Добавление одной инструкции в байт-код с сохранением ее границ и места вызова."""
+        self.instructions.append((len(self.code), len(objects)))
+        self.sites[len(self.code)] = self.call_site()
+        self.append(*objects)
 
     def var(self, default=0) -> list[int]:
         """Создает переменную с записью значения по умолчанию."""
         self.data.append((Type.var, default))
-        return [len(self.data) + 2]
+        return self.handle(len(self.data) - 1)
+
+    def handle(self, n: int) -> list[int]:
+        """Ссылка на запись data с индексом n."""
+        handle = [n + 3]
+        self.handles.append(handle)
+        return handle
 
     @staticmethod
     def is_var(value):
@@ -95,12 +427,13 @@ class EmuChunk:
         """Сохраняет целое значение как ссылку в data с возможным кэшированием расположения"""
         if value in self.static:
             return Label(self.static[value])  # Возвращаем ссылку, если значение уже существует в static
-        for n, v in enumerate(self.data):
-            if v[0] is Type.static and v[1] == value:
-                v[2] += 1  # Увеличиваем счетчик ссылок
-                return [n + 3]  # Возвращаем ссылку на место в data
+        n = self.constants.get(value)
+        if n is not None:
+            self.data[n][2] += 1  # Увеличиваем счетчик ссылок
+            return self.handle(n)  # Возвращаем ссылку на место в data
+        self.constants[value] = len(self.data)
         self.data.append([Type.static, value, 1])
-        return [len(self.data) + 2]  # Возвращаем новую ссылку на только что добавленное значение
+        return self.handle(len(self.data) - 1)  # Возвращаем новую ссылку на только что добавленное значение
 
     class RefOperator:
         """Класс для работы с операциями, которые могут применяться к ссылкам."""
@@ -112,16 +445,22 @@ class EmuChunk:
         def __add__(self, other):
             if EmuChunk.is_var(other):
                 return self.chunk.math(self.chunk.store_int(EmuChunk.OPERATION_ADD), self.ref, other, self.ref)
+            if not isinstance(other, (int, float, Label)):
+                return self.chunk.assign(self.ref, self.chunk.expr(self.ref) + other)
             self.chunk.add_const(self.ref, other)
 
         def __sub__(self, other):
             if EmuChunk.is_var(other):
                 return self.chunk.math(self.chunk.store_int(EmuChunk.OPERATION_SUB), self.ref, other, self.ref)
+            if not isinstance(other, (int, float, Label)):
+                return self.chunk.assign(self.ref, self.chunk.expr(self.ref) - other)
             self.chunk.sub_const(self.ref, other)
 
         def __mul__(self, other):
             if EmuChunk.is_var(other):
                 return self.chunk.math(self.chunk.store_int(EmuChunk.OPERATION_MUL), self.ref, other, self.ref)
+            if not isinstance(other, (int, float, Label)):
+                return self.chunk.assign(self.ref, self.chunk.expr(self.ref) * other)
             self.chunk.mul_const(self.ref, other)
 
     def __getitem__(self, item):
@@ -132,16 +471,18 @@ class EmuChunk:
             return
         if self.is_var(value):
             self.copy(key, value)  # Если переменная - копируем значение
+        elif not isinstance(value, (int, float, Label)):
+            self.assign(key, value)  # Выражение expression.Expr
         else:
             self.set(key, value)  # Если значение статичное - устанавливаем его
 
     def exit(self):
         """Завершение выполнения."""
-        self.append(self.OP_EXIT)
+        self.emit(self.OP_EXIT)
 
     def set(self, ref, value):
         """Устанавливает значение переменной по ссылке."""
-        self.append(
+        self.emit(
             self.OP_SET,
             self.resolve_arg(ref),
             self.resolve_arg(value)
@@ -149,7 +490,7 @@ class EmuChunk:
 
     def set_4(self, ref, value, value2, value3, value4):
         """Устанавливает 4 значения для переменных одновременно."""
-        self.append(
+        self.emit(
             self.OP_SET_4,
             self.resolve_arg(ref),
             self.resolve_arg(value),
@@ -160,7 +501,7 @@ class EmuChunk:
 
     def copy(self, ref, ref2):
         """Копирует значение из одной переменной в другую."""
-        self.append(
+        self.emit(
             self.OP_COPY,
             self.resolve_arg(ref),
             self.resolve_arg(ref2)
@@ -168,15 +509,38 @@ class EmuChunk:
 
     def echo(self, ref):
         """Выводит значение переменной."""
-        self.append(self.OP_ECHO, self.resolve_arg(ref))
+        self.emit(self.OP_ECHO, self.resolve_arg(ref))
+
+    @classmethod
+    def pack_text(cls, text: str) -> list[int]:
+        """Слова упакованной строки OP_PRINT."""
+        codes = [cls.CHARS.index(char_) + 1 for char_ in text.upper()]
+        words = []
+        for start in range(0, len(codes), cls.PRINT_CHARS):
+            word = 0
+            for n, code in enumerate(codes[start:start + cls.PRINT_CHARS]):
+                word |= code << n * cls.PRINT_BITS
+            words.append(word)
+        if words:
+            words[-1] = -words[-1]
+        return words
+
+    @classmethod
+    def unpack_text(cls, words) -> str:
+        """Строка из слов OP_PRINT, как ее выводит обработчик ядра: до нулевой группы или конца слова."""
+        text = []
+        for word in words:
+            word = abs(word)
+            while word & (1 << cls.PRINT_BITS) - 1:
+                text.append(cls.CHARS[(word & (1 << cls.PRINT_BITS) - 1) - 1])
+                word >>= cls.PRINT_BITS
+        return "".join(text)
 
     def print(self, text):
-        """Выводит строку символов. Строка символов обязана заканчиваться -1"""
-        self.append(
-            self.OP_CHAR,
-            *[self.resolve_arg(self.store_char(char_)) for char_ in text.upper()],
-            self.resolve_arg(self.store_int(-1))
-        )
+        """Выводит строку символов, упакованную по PRINT_CHARS символов в слове (OP_PRINT)."""
+        words = self.pack_text(text)
+        if words:
+            self.emit(self.OP_PRINT, *words)
 
     def fprint(self, *args):
         """Функция для вывода переменных, чисел и строк."""
@@ -191,7 +555,7 @@ class EmuChunk:
 
     def control_thread(self, key_ref, data):
         """Управление ядрами, в том числе изменение счетчика команд"""
-        self.append(
+        self.emit(
             self.OP_CONTROL_THREAD,
             self.resolve_arg(key_ref),  # Ссылка на индекс в памяти ядер
             self.resolve_arg(data)  # Статичное значение
@@ -199,7 +563,9 @@ class EmuChunk:
 
     def goto_thread(self, thread, label):
         """Установка счетчика команд для другого ядра"""
-        self.append(
+        if isinstance(thread, int):
+            self.targets.add(thread)
+        self.emit(
             self.OP_GOTO_THREAD,
             self.resolve_arg(thread),  # Ссылка на индекс в памяти ядер
             self.resolve_arg(label)  # Метка
@@ -207,7 +573,246 @@ class EmuChunk:
 
     def flush(self):
         """Вывести в блок сообщения текст из буфера и очистить буфер"""
-        self.append(self.OP_FLUSH)
+        self.emit(self.OP_FLUSH)
+
+    def far_data(self, *values, bank: int = 2, refs=()) -> int:
+        """
+        Размещение слов в дополнительном банке bank, возвращает адрес первого слова в карте памяти.
+        refs - индексы values, содержащих отрицательные ссылки на data.
+        """
+        if bank not in self.far:
+            raise ValueError(f"Bank {bank} is not in the memory map of {len(self.far) + 1} banks")
+        segment = self.far[bank]
+        if len(segment) + len(values) > self.BANK_SIZE:
+            raise ValueError(f"bank{bank} overflow: {len(segment) + len(values)} words")
+        self.far_refs[bank].update(len(segment) + n for n in refs)
+        address = (bank - 1) * self.BANK_SIZE + len(segment)
+        segment.extend(values)
+        return address
+
+    def far_references(self) -> "set[int]":
+        """Адреса data, на которые ссылаются слова дополнительных банков."""
+        return {-self.far[bank][n] for bank, refs in self.far_refs.items() for n in refs}
+
+    def load_far(self, ref, address: int):
+        """Копирует слово по адресу карты памяти (far_data) в переменную."""
+        self.emit(self.OP_LOAD_FAR, self.resolve_arg(ref), address)
+
+    def store_far(self, address: int, ref):
+        """Копирует переменную в слово по адресу карты памяти."""
+        self.emit(self.OP_STORE_FAR, address, self.resolve_arg(ref))
+
+    def array(self, size: int, values=()) -> Array:
+        """Массив из size переменных data подряд, values - значения первых элементов по умолчанию."""
+        values = list(values)
+        if size < 1 or len(values) > size:
+            raise ValueError(f"Array of {size} words cannot hold {len(values)} values")
+        values += [0] * (size - len(values))
+        return Array([self.var(value) for value in values])
+
+    def _base(self, array) -> int:
+        """Адрес первого слова массива: Array, переменная или числовой адрес."""
+        if isinstance(array, Array):
+            return array.base
+        return self.resolve_arg(array)
+
+    def _operand_ref(self, value):
+        """Ссылка на переменную или константу пула для операнда-ссылки."""
+        if self.is_var(value) or isinstance(value, Label):
+            return self.resolve_arg(value)
+        return self.resolve_arg(self.store_int(value))
+
+    def load_indirect(self, ref, array, index):
+        """Копирует слово массива с индексом index (переменная или константа) в переменную ref."""
+        self.emit(self.OP_LOAD_INDIRECT, self.resolve_arg(ref), self._base(array), self._operand_ref(index))
+
+    def store_indirect(self, array, index, value):
+        """Копирует value (переменная или константа) в слово массива с индексом index."""
+        self.emit(self.OP_STORE_INDIRECT, self._base(array), self._operand_ref(index), self._operand_ref(value))
+
+    def memcpy(self, target, source, count: int | None = None):
+        """
+        Копирует count слов (по умолчанию длину массива source) одной инструкцией, перекрывающиеся области
+        копируются как через промежуточный буфер.
+        """
+        if count is None:
+            count = len(source)
+        if count > 0:
+            self.emit(self.OP_MEMCPY, self._base(target), self._base(source), count)
+
+    def memset(self, target, value, count: int | None = None):
+        """Записывает value (переменная или константа) в count слов (по умолчанию весь массив) одной инструкцией."""
+        if count is None:
+            count = len(target)
+        if count > 0:
+            self.emit(self.OP_MEMSET, self._base(target), self._operand_ref(value), count)
+
+    def barrier(self, threads) -> Barrier:
+        """Барьер для ядер threads."""
+        threads = list(threads)
+        return Barrier({thread: self.var() for thread in threads}, {thread: self.var() for thread in threads})
+
+    def arrive(self, barrier: Barrier, thread: int):
+        """Прибытие ядра thread к барьеру без ожидания остальных."""
+        self.add_const(barrier.counters[thread], 1)
+
+    def wait_barrier(self, barrier: Barrier, thread: int):
+        """Прибытие ядра thread к барьеру и ожидание, пока к нему не прибудут все ядра барьера."""
+        self.arrive(barrier, thread)
+        mine, temp = barrier.counters[thread], barrier.temps[thread]
+        for other, counter in barrier.counters.items():
+            if other == thread:
+                continue
+            spin = self.label()
+            self.math(self.store_int(self.OPERATION_GT), mine, counter, temp)
+            self.jump(spin, temp)
+
+    def parallel_for(self, count: int, body: Callable, threads=None, thread: int = MAIN_THREAD):
+        """
+        Выполняет body(index, ядро) для index от 0 до count - 1, разделив диапазон на непрерывные части
+        по ядрам threads (по умолчанию все cores ядер). Вызывается из кода ядра thread, которое выполняет
+        свою часть и ждет остальные у барьера, другие ядра запускаются goto_thread и завершаются OP_EXIT.
+        Тело собирается отдельно для каждого ядра со своей переменной index. При count <= 0 код не собирается.
+        """
+        if count <= 0:
+            return
+        threads = list(range(self.MAIN_THREAD, self.MAIN_THREAD + self.cores) if threads is None else threads)
+        if thread not in threads:
+            threads.insert(0, thread)
+        self.targets.add(thread)
+        size = -(-count // len(threads))
+        slices = {t: (n * size, min(count, (n + 1) * size)) for n, t in enumerate(threads) if n * size < count}
+        barrier = self.barrier(slices)
+
+        skip = self.label(reassign=True)
+        self.jump(skip, self.NON_ZERO)
+        entries = {}
+        for worker, (start, end) in slices.items():
+            if worker == thread:
+                continue
+            entries[worker] = self.label(reassign=True)
+            self.label(entries[worker], inc_thread=True)
+            self._loop(body, worker, start, end)
+            self.arrive(barrier, worker)
+            self.exit()
+        self.label(skip)
+        for worker, entry in entries.items():
+            self.goto_thread(worker, entry)
+        if thread in slices:
+            self._loop(body, thread, *slices[thread])
+        self.wait_barrier(barrier, thread)
+
+    def _loop(self, body: Callable, thread: int, start: int, end: int):
+        """Цикл body(index, thread) по index от start до end - 1."""
+        index = self.var()
+        self[index] = start
+        loop = self.label()
+        body(index, thread)
+        self.add_const(index, 1)
+        self.jump_neq_const(loop, index, end)
+
+    def function(self, body: Callable, inline: bool = False) -> Function:
+        """
+        Объявляет функцию: body() собирает ее тело при сборке образа один раз после основного кода,
+        call() вызывает ее из любого ядра. Функция с inline=True копируется в место каждого вызова.
+        """
+        function = Function(body, Label(0, not_reassigned=True), inline)
+        self.functions.append(function)
+        return function
+
+    def call(self, function: Function):
+        """Вызов функции через OP_CALL или копирование ее тела для inline."""
+        function.calls += 1
+        if function.inline:
+            if function.emitted:
+                raise ValueError(f"Recursive inline function {function.name}")
+            start = len(self.code)
+            function.emitted = True
+            try:
+                function.body()
+            finally:
+                function.emitted = False
+            function.words = len(self.code) - start
+            return
+        if self.caller is not None and function not in self.caller.callees:
+            self.caller.callees.append(function)
+        if self.stack is None:
+            self.stack = Label(0, not_reassigned=True)
+        self.emit(self.OP_CALL, self.stack, function.label)
+
+    def ret(self):
+        """Возврат из функции, добавляется в конец тела автоматически."""
+        if self.stack is None:
+            self.stack = Label(0, not_reassigned=True)
+        self.emit(self.OP_RET, self.stack)
+
+    def emit_functions(self):
+        """
+        Собирает тела вызванных функций после основного кода, отделенные OP_EXIT, и стек возвратов за ними.
+        Проверяет, что вложенность вызовов не превышает STACK_DEPTH, а запускаемые ядра помещаются в стек
+        из cores областей.
+        """
+        pending = [function for function in self.functions
+                   if function.calls and not function.inline and not function.emitted]
+        if not pending:
+            return
+        self.exit()  # Основной код, дошедший до конца, не выполняет тела функций
+        while pending:
+            for function in pending:
+                function.emitted = True
+                self.label(function.label)
+                start = len(self.code)
+                self.caller = function
+                try:
+                    function.body()
+                finally:
+                    self.caller = None
+                function.words = len(self.code) - start
+                self.ret()
+                code = function.body.__code__
+                self.sites[len(self.code) - 2] = f"{Path(code.co_filename).name}:{code.co_firstlineno}"
+            pending = [function for function in self.functions
+                       if function.calls and not function.inline and not function.emitted]
+
+        depths = {}
+
+        def depth(function: Function, path: tuple) -> int:
+            if function in path:
+                raise ValueError(f"Recursive call {' -> '.join(f.name for f in path + (function,))}")
+            if function not in depths:
+                depths[function] = 1 + max((depth(callee, path + (function,)) for callee in function.callees),
+                                           default=0)
+            return depths[function]
+
+        deepest = max(depth(function, ()) for function in self.functions if function.emitted)
+        if deepest > self.STACK_DEPTH:
+            raise ValueError(f"Call depth {deepest} exceeds return stack depth {self.STACK_DEPTH}")
+        outside = sorted(thread for thread in self.targets | {self.MAIN_THREAD}
+                         if not self.MAIN_THREAD <= thread < self.MAIN_THREAD + self.cores)
+        if outside:
+            raise ValueError(f"Threads {outside} are started, but the return stack holds {self.cores} cores,"
+                             f" use EmuChunk(cores=...)")
+        stack = self.reserve(*[0] * (self.cores * (self.STACK_DEPTH + 1)))
+        self.stack.position = stack.position
+        self.stack.not_reassigned = False
+
+    def function_report(self) -> str:
+        """
+        Размер и стоимость каждой функции: слов при вызове через OP_CALL и при копировании тела в места вызова,
+        дополнительные инструкции логики ядра на вызов.
+        """
+        import coregen  # coregen импортирует mindvm
+        overhead = coregen.COSTS["OP_CALL"] + coregen.COSTS["OP_RET"] + 2 * coregen.DISPATCH
+        lines = []
+        for function in self.functions:
+            called = function.words + 2 + 3 * function.calls
+            inline = function.words * function.calls
+            mode = "inline" if function.inline else "call"
+            lines.append(f"    function {function.name} ({mode}): {function.words} words, {function.calls} calls,"
+                         f" call {called} words, inline {inline} words, call costs +{overhead} instructions")
+        if self.stack is not None:
+            lines.append(f"    return stack: {self.cores * (self.STACK_DEPTH + 1)} words")
+        return "\n".join(lines)
 
     def label(self,
               label: Label | None = None,
@@ -235,16 +840,16 @@ class EmuChunk:
             if not self.is_var(second):
                 if first == result:
                     if operation == self.OPERATION_ADD:
-                        print(f"Perform ADD_CONST optimization for {first} add {second} = {result}")
+                        self.log(f"Perform ADD_CONST optimization for {first} add {second} = {result}")
                         return self.add_const(first, second)
                     elif operation == self.OPERATION_SUB:
-                        print(f"Perform SUB_CONST optimization for {first} subtract {second} = {result}")
+                        self.log(f"Perform SUB_CONST optimization for {first} subtract {second} = {result}")
                         return self.sub_const(first, second)
                     elif operation == self.OPERATION_MUL:
-                        print(f"Perform MUL_CONST optimization for {first} multiply {second} = {result}")
+                        self.log(f"Perform MUL_CONST optimization for {first} multiply {second} = {result}")
                         return self.mul_const(first, second)
 
-        self.append(
+        self.emit(
             self.OP_MATH,
             self.resolve_arg(operation),
             self.resolve_arg(first),
@@ -254,7 +859,7 @@ class EmuChunk:
 
     def add_const(self, ref, value):
         """Добавляет константу к переменной, ссылке."""
-        self.append(
+        self.emit(
             self.OP_ADD_CONST,
             self.resolve_arg(ref),
             self.resolve_arg(value)
@@ -262,7 +867,7 @@ class EmuChunk:
 
     def sub_const(self, ref, value):
         """Вычитает константу из переменной, ссылке."""
-        self.append(
+        self.emit(
             self.OP_SUB_CONST,
             self.resolve_arg(ref),
             self.resolve_arg(value)
@@ -270,15 +875,171 @@ class EmuChunk:
 
     def mul_const(self, ref, value):
         """Умножает переменную на константу."""
-        self.append(
+        self.emit(
             self.OP_MUL_CONST,
             self.resolve_arg(ref),
             self.resolve_arg(value)
         )
 
+    def expr(self, ref):
+        """Переменная или абсолютный адрес как лист выражения (expression.py)."""
+        from expression import Var  # expression импортирует mindvm
+        return Var(ref if self.is_var(ref) else [ref])
+
+    def assign(self, ref, expr, thread: int = MAIN_THREAD):
+        """
+        Присваивание выражения: свертка констант, общие подвыражения и операции на месте.
+        Временные переменные общие для выражений ядра thread, код, выполняемый другим ядром, указывает его.
+        """
+        self.assign_all([(ref, expr)], thread)
+
+    def assign_all(self, assignments, thread: int = MAIN_THREAD):
+        """
+        Присваивания (ссылка, выражение), выполняемые подряд без переходов между ними:
+        подвыражения, вычисленные раньше, повторно не вычисляются.
+        """
+        from expression import ExpressionCompiler  # expression импортирует mindvm
+        compiler = ExpressionCompiler(self, thread)
+        for ref, expr in assignments:
+            compiler.assign(ref, expr)
+        self._expression_stats(compiler)
+
+    def jump_if(self, label, condition, thread: int = MAIN_THREAD):
+        """Переход, если выражение не равно 0: сравнения с константой - JUMP_NEQ_CONST и JUMP_GT_CONST."""
+        from expression import ExpressionCompiler  # expression импортирует mindvm
+        compiler = ExpressionCompiler(self, thread)
+        compiler.condition(label, condition)
+        self._expression_stats(compiler)
+
+    @contextmanager
+    def if_(self, condition, thread: int = MAIN_THREAD):
+        """
+        Тело with выполняется, если условие не равно 0. Тело следует за проверкой: переход мимо него - одна
+        инструкция сравнения с константой, если она есть для отрицания условия (x == 5, x <= 5), иначе, если
+        она есть для самого условия (x != 5, x > 5, переменная), - переход на тело и безусловный переход мимо него.
+        """
+        from expression import ExpressionCompiler, negate  # expression импортирует mindvm
+        skip = self.label(reassign=True)
+        if ExpressionCompiler.direct(negate(condition)) or not ExpressionCompiler.direct(condition):
+            self.jump_if(skip, negate(condition), thread)
+        else:
+            body = self.label(reassign=True)
+            self.jump_if(body, condition, thread)
+            self.jump(skip, self.NON_ZERO)
+            self.label(body)
+        self.branch = None
+        yield
+        self.label(skip)
+        self.branch = (skip, len(self.code))
+
+    @contextmanager
+    def else_(self):
+        """Тело with выполняется, если условие if_(), после которого оно сразу следует, равно 0."""
+        if self.branch is None or self.branch[1] != len(self.code):
+            raise ValueError("else_ must directly follow an if_ block")
+        skip, _ = self.branch
+        end = self.label(reassign=True)
+        self.jump(end, self.NON_ZERO)
+        self.label(skip)
+        self.branch = None
+        yield
+        self.label(end)
+
+    @contextmanager
+    def while_(self, condition, thread: int = MAIN_THREAD):
+        """
+        Тело with повторяется, пока условие не равно 0, возвращает Loop. Проверка стоит после тела,
+        первый раз на нее переходит безусловный переход, поэтому повторение стоит одной проверки.
+        Условие-константа, не равная 0, - бесконечный цикл без проверки.
+        """
+        from expression import Const, simplify, wrap  # expression импортирует mindvm
+        loop = Loop(self.label(reassign=True), self.label(reassign=True))
+        node = simplify(wrap(condition))
+        forever = isinstance(node, Const) and node.value != 0
+        if not forever:
+            self.jump(loop.next, self.NON_ZERO)
+        top = self.label()
+        self.loops.append(loop)
+        yield loop
+        self.loops.pop()
+        self.label(loop.next)
+        if forever:
+            self.jump(top, self.NON_ZERO)
+        else:
+            self.jump_if(top, condition, thread)
+        self.label(loop.end)
+        self.branch = None
+
+    @contextmanager
+    def for_range(self, start, stop=None, step: int = 1, thread: int = MAIN_THREAD):
+        """
+        Тело with выполняется для значений новой переменной index, как range(start, stop, step), возвращает index.
+        start и stop - константы или переменные, step - константа, тело не должно менять index.
+        С константными границами число повторений известно: проверки перед первым повторением нет,
+        повторение с шагом вниз - ADD_CONST и JUMP_GT_CONST, которые оптимизатор объединяет в ADD_JUMP_GT,
+        с шагом вверх - ADD_CONST и JUMP_NEQ_CONST до последнего значения.
+        """
+        if stop is None:
+            start, stop = 0, start
+        if step == 0:
+            raise ValueError("for_range step must not be zero")
+        index = self.var()
+        self[index] = start
+        loop = Loop(self.label(reassign=True), self.label(reassign=True))
+        constant = isinstance(start, int) and isinstance(stop, int)
+        if constant:
+            count = len(range(start, stop, step))
+            if not count:
+                self.jump(loop.end, self.NON_ZERO)
+        else:
+            test = self.label(reassign=True)
+            self.jump(test, self.NON_ZERO)
+        top = self.label()
+        self.loops.append(loop)
+        yield index
+        self.loops.pop()
+        self.label(loop.next)
+        if not constant:
+            self.add_const(index, step)
+            self.label(test)
+            value = self.expr(index)
+            self.jump_if(top, value < stop if step > 0 else value > stop, thread)
+        elif step < 0:
+            self.add_const(index, step)
+            self.jump_gt_const(top, index, stop)
+        else:
+            self.add_const(index, step)
+            self.jump_neq_const(top, index, start + count * step)
+        self.label(loop.end)
+        self.branch = None
+
+    def break_(self, condition=None, thread: int = MAIN_THREAD):
+        """Выход из внутреннего цикла while_() или for_range(), если условие не равно 0 или не задано."""
+        if not self.loops:
+            raise ValueError("break_ outside of a loop")
+        self._jump_when(self.loops[-1].end, condition, thread)
+
+    def continue_(self, condition=None, thread: int = MAIN_THREAD):
+        """Переход к проверке внутреннего цикла, если условие не равно 0 или не задано."""
+        if not self.loops:
+            raise ValueError("continue_ outside of a loop")
+        self._jump_when(self.loops[-1].next, condition, thread)
+
+    def _jump_when(self, label: Label, condition, thread: int):
+        """Переход по условию, без условия - безусловный."""
+        if condition is None:
+            self.jump(label, self.NON_ZERO)
+        else:
+            self.jump_if(label, condition, thread)
+
+    def _expression_stats(self, compiler):
+        for name in ("folded", "reused", "in_place"):
+            key = f"expression_{name}"
+            self.optimizations[key] = self.optimizations.get(key, 0) + compiler.stats[name]
+
     def const_rand(self, value, ref):
         """Генерирует случайное значение в пределах заданного диапазона."""
-        self.append(
+        self.emit(
             self.OP_CONST_RAND,
             self.resolve_arg(value),
             self.resolve_arg(ref)
@@ -286,7 +1047,7 @@ class EmuChunk:
 
     def jump_neq_const(self, label, ref, value):
         """Условный переход, если значение переменной не равно константе."""
-        self.append(
+        self.emit(
             self.OP_JUMP_NEQ_CONST,
             label,
             self.resolve_arg(ref),
@@ -295,46 +1056,373 @@ class EmuChunk:
 
     def jump_gt_const(self, label, ref, value):
         """Условный переход, если значение переменной больше константы."""
-        self.append(
+        self.emit(
             self.OP_JUMP_GT_CONST,
             label,
             self.resolve_arg(ref),
             self.resolve_arg(value)
         )
 
+    def wait_eq(self, ref, value):
+        """Ожидание, пока значение переменной не станет равно константе."""
+        self.emit(
+            self.OP_WAIT_EQ,
+            self.resolve_arg(ref),
+            self.resolve_arg(value)
+        )
+
+    def jump_neq_set(self, label, ref, value, new):
+        """Условный переход, если значение переменной не равно константе, иначе запись в переменную new."""
+        self.emit(
+            self.OP_JUMP_NEQ_SET,
+            label,
+            self.resolve_arg(ref),
+            self.resolve_arg(value),
+            self.resolve_arg(new)
+        )
+
+    def add_jump_gt(self, ref, value, label, limit):
+        """Добавляет константу к переменной и переходит, если переменная стала больше limit."""
+        self.emit(
+            self.OP_ADD_JUMP_GT,
+            self.resolve_arg(ref),
+            self.resolve_arg(value),
+            label,
+            self.resolve_arg(limit)
+        )
+
     def jump(self, label, ref):
         """Условный переход, если значение по ссылке != 0"""
-        self.append(
+        self.emit(
             self.OP_JUMP,
             label,
             self.resolve_arg(ref)
         )
 
-    def compile(self):
-        """Компиляция кода в последовательность инструкций."""
-        print()
-        print("    val:", "   var:", sep="            ")
+    def draw(self, queue, command, *args):
+        """Добавление команды дисплея в очередь queue, ожидание только при заполненной очереди"""
+        if len(args) > EmuDisplay.QUEUE_SLOT - 1:
+            raise ValueError(f"Display command takes at most {EmuDisplay.QUEUE_SLOT - 1} arguments")
+        self.emit(
+            self.OP_DRAW,
+            queue,
+            command,
+            len(args),
+            *(self.resolve_arg(self.var(arg) if isinstance(arg, Label) else arg if self.is_var(arg)
+                               else self.store_int(arg)) for arg in args)
+        )
+
+    def operand_kinds(self, instruction: Instruction) -> tuple | None:
+        """Виды операндов инструкции, None для данных и неизвестных кодов операций."""
+        if instruction.data:
+            return None
+        if instruction.opcode == self.OP_CHAR:
+            return (Operand.ref,) * (len(instruction.words) - 1)
+        if instruction.opcode == self.OP_DRAW:
+            return (Operand.value,) * 3 + (Operand.ref,) * (len(instruction.words) - 4)
+        if instruction.opcode == self.OP_PRINT:
+            return (Operand.value,) * (len(instruction.words) - 1)
+        return self.OPERANDS.get(instruction.opcode)
+
+    def decode(self) -> list[Instruction]:
+        """Разбирает код на инструкции и участки данных между ними."""
+        items = []
+        code = self.code[:]
+        position = 0
+        for start, length in self.instructions:
+            if start > position:
+                items.append(Instruction(position, code[position:start], data=True))
+            items.append(Instruction(start, code[start:start + length]))
+            position = start + length
+        if position < len(code):
+            items.append(Instruction(position, code[position:], data=True))
+        return items
+
+    def label_uses(self, items: list[Instruction]) -> dict[int, tuple[Label, bool]]:
+        """
+        Метки, встречающиеся в коде и данных.
+
+        Для каждой метки указано, ссылается ли она на слово (position - 1): данные в коде, начало кода
+        для другого ядра, адрес для чтения или записи. Иначе метка - граница инструкций, цель перехода.
+        """
+        uses = {}
+        for item in items:
+            kinds = self.operand_kinds(item)
+            for n, word in enumerate(item.words):
+                if isinstance(word, Label):
+                    pointer = kinds is None or n == 0 or kinds[n - 1] is not Operand.target
+                    uses[id(word)] = (word, pointer or uses.get(id(word), (word, False))[1])
+        for entry in self.data:
+            if isinstance(entry[1], Label):
+                uses[id(entry[1])] = (entry[1], True)
+        for label, _ in self.buffers:
+            uses[id(label)] = (label, True)
+        return uses
+
+    def constant(self, ref):
+        """Значение по ссылке из кода, если оно не меняется при выполнении: константа из data или слово кода."""
+        if isinstance(ref, Label):
+            if ref.not_reassigned or not 0 < ref.position <= len(self.code):
+                return None
+            word = self.code[ref.position - 1]
+            return word if isinstance(word, int) else None
+        if ref == self.NON_ZERO[0]:
+            return 6  # Первое слово заголовка
+        if isinstance(ref, int) and 0 <= ref - 3 < len(self.data) and self.data[ref - 3][0] is Type.static:
+            return self.data[ref - 3][1]
+        return None
+
+    def rebuild(self, items: list[Instruction]):
+        """
+        Собирает код из разобранных инструкций и переносит метки.
+
+        Цели переходов переходят на новую позицию первой сохранившейся инструкции не раньше прежней,
+        метки-указатели на слова требуют, чтобы слово сохранилось без изменений.
+        """
+        code = []
+        instructions = []
+        sites = {}
+        starts, new_starts = [], []
+        words = {}  # Прежняя позиция слова -> новая, для неизмененных инструкций и данных
+        for item in items:
+            starts.append(item.start)
+            new_starts.append(len(code))
+            if item.verbatim:
+                for n in range(len(item.words)):
+                    words[item.start + n] = len(code) + n
+            if not item.data:
+                instructions.append((len(code), len(item.words)))
+                sites[len(code)] = self.sites.get(item.start)
+            code.extend(item.words)
+
+        for label, pointer in self.label_uses(items).values():
+            if label.not_reassigned:
+                continue
+            if pointer:
+                if label.position == 0:
+                    continue  # Указывает на последнее слово перед кодом
+                if label.position - 1 not in words:
+                    raise ValueError(f"{label} points to a word removed by optimization")
+                label.position = words[label.position - 1] + 1
+            else:
+                n = bisect_left(starts, label.position)
+                label.position = new_starts[n] if n < len(starts) else len(code)
+
+        self.code = Code(code)
+        self.instructions = instructions
+        self.sites = sites
+        self.data_refs = {words[n] for n in self.data_refs if n in words}
+        self.index_static()
+
+    def index_static(self):
+        """Пересчитывает первые вхождения чисел в коде для store_int."""
+        self.static = {}
+        buffers = {label.position - 1 + n for label, length in self.buffers for n in range(length)}
+        buffers.update(self.code.relocations)
+        for n, value in enumerate(self.code.words):
+            if n not in buffers:
+                self.static.setdefault(value, n + 1)
+
+    def relocate_data(self, mapping: dict[int, int], data: list) -> bool:
+        """
+        Заменяет сегмент данных на data, переводя адреса mapping (прежний адрес -> новый) в коде,
+        отрицательных ссылках оберток сопрограмм и выданных ссылках.
+
+        Метки store_int, читающие слово кода, значение которого изменилось, переносятся на неизменное слово
+        с тем же значением или на новую константу в data. Возвращает False и ничего не меняет,
+        если программа пишет в изменяемые слова кода.
+        """
+        data = list(data)
+        items = self.decode()
+        changed = set()  # Позиции слов кода, значения которых изменились
+        for item in items:
+            kinds = self.operand_kinds(item)
+            for n, word in enumerate(item.words):
+                if type(word) is not int:
+                    continue
+                if item.data:
+                    if item.start + n in self.data_refs and mapping.get(-word, -word) != -word:
+                        item.words[n] = -mapping[-word]
+                        changed.add(item.start + n)
+                elif n and kinds[n - 1] in self.ADDRESSES and word in mapping and mapping[word] != word:
+                    item.words[n] = mapping[word]
+                    changed.add(item.start + n)
+
+        sources = {}  # Метки, читающие изменившиеся слова
+        for item in items:
+            kinds = self.operand_kinds(item)
+            for n, word in enumerate(item.words):
+                if not isinstance(word, Label) or word.position - 1 not in changed:
+                    continue
+                kind = kinds[n - 1] if kinds and n else None
+                if kind in (Operand.out, Operand.inout, Operand.out4):
+                    return False
+                if kind is Operand.ref:
+                    sources[id(word)] = word
+
+        code = [word for item in items for word in item.words]
+        stable = {}
+        for n, word in enumerate(code):
+            if type(word) is int and n not in changed:
+                stable.setdefault(word, n + 1)
+        constants = {}  # id метки -> адрес новой константы в data
+        for label in sources.values():
+            value = self.code[label.position - 1]
+            if value in stable:
+                label.position = stable[value]
+                continue
+            data.append([Type.static, value, 0])
+            constants[id(label)] = len(data) + 2
+        if constants:
+            for item in items:
+                kinds = self.operand_kinds(item) or ()
+                for n, kind in enumerate(kinds, start=1):
+                    if kind is Operand.ref and id(item.words[n]) in constants:
+                        item.words[n] = constants[id(item.words[n])]
+            code = [word for item in items for word in item.words]
+
+        for handle in self.handles:
+            handle[0] = mapping.get(handle[0], handle[0])
+        for bank, refs in self.far_refs.items():
+            segment = self.far[bank]
+            for n in refs:
+                segment[n] = -mapping.get(-segment[n], -segment[n])
+        self.code = Code(code)
+        self.data = data
+        self.index_static()
+        self.count_references()
+        return True
+
+    def count_references(self):
+        """Пересчитывает счетчики ссылок констант data и пул констант по фактическому коду."""
+        counts = {}
+        for item in self.decode():
+            kinds = self.operand_kinds(item) or ()
+            for kind, word in zip(kinds, item.words[1:]):
+                if kind in self.ADDRESSES and type(word) is int:
+                    counts[word] = counts.get(word, 0) + 1
+        self.constants = {}
+        for n, entry in enumerate(self.data):
+            if entry[0] is Type.static:
+                entry[2] = counts.get(n + 3, 0)
+                self.constants.setdefault(entry[1], n)
+
+    def cfg(self):
+        """Граф потока управления кода (optimizer.ControlFlowGraph)."""
+        from optimizer import ControlFlowGraph  # optimizer импортирует mindvm
+        return ControlFlowGraph(self)
+
+    def estimate(self):
+        """Статическая оценка стоимости кода в инструкциях логики ядра (estimator.CostEstimator)."""
+        from estimator import CostEstimator  # estimator импортирует mindvm
+        return CostEstimator(self)
+
+    def optimize(self) -> dict[str, int]:
+        """
+        Оптимизация по шаблонам, удаление мертвого кода и совмещение переменных в соответствии с флагами,
+        возвращает количество примененных преобразований каждого вида.
+        """
+        from optimizer import DeadCode, Peephole, SlotAllocator  # optimizer импортирует mindvm
+        stats = {}
+        for _ in range(Peephole.MAX_ROUNDS):
+            changes = {}
+            if self.perform_peephole_optimization:
+                changes.update(Peephole(self).run())
+            if self.perform_dead_code_elimination:
+                changes.update(DeadCode(self).run())
+            for name, count in changes.items():
+                stats[name] = stats.get(name, 0) + count
+            if not any(changes.values()):
+                break
+        if self.perform_slot_allocation:
+            for name, count in SlotAllocator(self).run().items():
+                stats[name] = stats.get(name, 0) + count
+        return stats
+
+    def link(self) -> list:
+        """Собирает образ памяти: заголовок, сегмент данных и код с разрешенными метками."""
+        self.emit_functions()
+        if self.perform_peephole_optimization or self.perform_dead_code_elimination or self.perform_slot_allocation:
+            for name, count in self.optimize().items():
+                self.optimizations[name] = self.optimizations.get(name, 0) + count
         result = [6, len(self.data) + 2, self.NON_ZERO[0]]
-        for n, v in enumerate(self.data):
-            print("    ",
-                  ("--                 default " if v[0] == Type.var else ""),
-                  v[1],
-                  " at ",
-                  n, (f" [{v[2]} ref]" if v[0] == Type.static else ""),
-                  sep="")
-            result.append(v[1])
-        print()
-        result.extend(self.code)
-        for n, i in enumerate(result):
-            if isinstance(i, Label):
-                if i.not_reassigned:
-                    raise ValueError(f"{i} marked as need to be reassigned but not reassigned")
-                result[n] = i.position + result[1]
-        print("wait 1")
-        print("\n".join([f"write {c} bank1 {n}"
-                         for n, c in enumerate(result)]))
-        print(f"""wait 10
-jump {len(result) + 1} always 0 0""")
+        result.extend(v[1] for v in self.data)
+        base = len(result)
+        result.extend(self.code.words)
+        # Метки встречаются только в таблице перемещений кода и в записях data
+        fixups = [(base + position, value) for position, value in self.code.relocations.items()]
+        fixups.extend((n + 3, v[1]) for n, v in enumerate(self.data) if isinstance(v[1], Label))
+        for n, value in fixups:
+            if isinstance(value, Label):
+                if value.not_reassigned:
+                    raise ValueError(f"{value} marked as need to be reassigned but not reassigned")
+                value = value.position + result[1]
+            result[n] = value
+        return result
+
+    def link_far(self) -> list[list]:
+        """Образы дополнительных банков с разрешенными метками, вызывается после link()."""
+        images = []
+        for bank, segment in self.far.items():
+            image = []
+            for value in segment:
+                if isinstance(value, Label):
+                    value = value.position + len(self.data) + 2
+                image.append(value)
+            images.append(image)
+        return images
+
+    def video_addresses(self) -> tuple[int, ...] | None:
+        """Адреса в карте памяти сопрограмм и очередей видеоядра, вызывается после link(). None - адрес в переменной."""
+        if any(self.is_var(start) for start in self.video_starts):
+            return None
+        return tuple(sorted({start.position + len(self.data) + 2 if isinstance(start, Label) else start
+                             for start in self.video_starts}))
+
+    def symbols(self) -> dict[int, str]:
+        """Таблица символов образа: записи data и места вызова, с которых начинаются инструкции кода."""
+        symbols = {}
+        for n, entry in enumerate(self.data):
+            symbols[n + 3] = f"var default {entry[1]}" if entry[0] is Type.var else f"const {entry[1]}"
+        base = len(self.data) + 3
+        last = None
+        for start, _ in self.instructions:
+            site = self.sites.get(start)
+            if site != last:
+                symbols[base + start] = site
+                last = site
+        return symbols
+
+    def compile(self, loader: str = "plain", hot_spots: int = 0) -> Artifact:
+        """
+        Компиляция кода в образ памяти. Текст загрузчика (plain или packed) - Artifact.text.
+        При verbose выводятся таблица data, статистика и отчет о hot_spots самых дорогих участках кода.
+        """
+        result = self.link()
+        if self.verbose:
+            print()
+            print("    val:", "   var:", sep="            ")
+            for n, v in enumerate(self.data):
+                print("    ",
+                      ("--                 default " if v[0] == Type.var else ""),
+                      v[1],
+                      " at ",
+                      n, (f" [{v[2]} ref]" if v[0] == Type.static else ""),
+                      sep="")
+            print()
+            for name, count in self.optimizations.items():
+                if count:
+                    print(f"    optimization: {name} x{count}")
+            for mode, info in loaders.stats(result).items():
+                print(f"    {mode} loader: {info['lines']} lines, ~{info['instructions']} boot instructions")
+            for bank, segment in self.far.items():
+                print(f"    bank{bank}: {len(segment)} words")
+            if self.functions:
+                print(self.function_report())
+            if hot_spots:
+                print(self.estimate().report(hot_spots))
+            print()
+        return Artifact(result, self.symbols(), loader, self.link_far(), self.cores, self.video_addresses())
 
 
 def cprint(chunk, text, flush=True):
@@ -372,12 +1460,20 @@ class EmuDisplay:
     POLY = 7  # Рисование многоугольника
     LINE_POLY = 8  # Рисование многоугольника только с обводкой
     TRIANGLE = 9  # Рисование треугольника
+    IMAGE = 10  # Рисование изображения
     FLUSH = 11  # Вывод всех команд на дисплей
     SHADER_MAP = 12  # Разметка сопрограммы
 
     # Команды для работы с видео-сопрограммами
     SHADER_EXEC = 13  # Выполнение сопрограммы
     SHADER_END = 14  # Завершить сопрограмму
+    SHADER_JUMP = 17  # Продолжить сопрограмму с адреса из первого аргумента
+    # Первая команда сопрограммы shader(cached=True): за ней блок (количество переменных, FLUSH в сопрограмме,
+    # ожидаемый счетчик FLUSH видеоядра, пары -адрес переменной и ее значение при прошлом выполнении).
+    # Если значения и счетчик совпали, сопрограмма завершается сразу: дисплей уже показывает ее кадр
+    SHADER_WATCH = 18
+    SHADER_FORCE = 19  # Выполнение сопрограммы без проверки изменений SHADER_WATCH
+    WATCH_HEADER = 3
 
     # Специальные команды
     # Начало обертки сопрограммы, позволяет устанавливать в качестве значений ссылки на память,
@@ -385,6 +1481,13 @@ class EmuDisplay:
     SHADER_WRAP = 15
     SHADER_WRAP_END = -513  # Магическое число для завершения обертки сопрограммы
 
+    # Включение очереди команд по адресу из первого аргумента (alloc_queue)
+    QUEUE_START = 16
+    # Очередь: хвост (пишут ядра), голова (пишет видеоядро), количество мест и места по QUEUE_SLOT слов -
+    # номер команды и 6 аргументов
+    QUEUE_HEADER = 3
+    QUEUE_SLOT = 7
+
     NO_COMMAND = -1  # Нет команд
 
     DISPLAY_SIZE = 176  # Размер дисплея
@@ -404,6 +1507,9 @@ class EmuDisplay:
         self.chunk = chunk  # Объект EmuChunk, представляющий память команд.
         # Использовать ли оптимизированную передачу данных (по 4 параметра за раз).
         self.use_set_4 = use_set_4
+        # Очередь, в которую добавляются команды после start_queue, None - почтовый ящик
+        self.queue = None
+        self.assembler = None  # Сборщик сопрограмм shader(), создается при первом вызове
 
     def __setitem__(self, key, value):
         """Запись значения в память для дисплея по смещению от базового адреса."""
@@ -415,7 +1521,10 @@ class EmuDisplay:
         self.chunk.jump_neq_const(accept_label, self.ADDRESS, -1)
 
     def send_command(self, command, *args, with_accept=True):
-        """Отправка команды на дисплей."""
+        """Отправка команды на дисплей, после start_queue - добавление в очередь без ожидания."""
+        if self.queue is not None:
+            self.chunk.draw(self.queue, command, *args)
+            return
         static_args_count = 0
         for arg in args:
             if EmuChunk.is_var(arg):
@@ -423,7 +1532,7 @@ class EmuDisplay:
             static_args_count += 1
         # Если аргументов больше 3 и включен use_set_4, используем оптимизированную передачу
         if static_args_count > 3 and self.use_set_4:
-            print(f"Call SET_4 with {args}")
+            self.chunk.log(f"Call SET_4 with {args}")
             self.chunk.set_4(
                 self.ADDRESS + 1,
                 args[0],
@@ -481,18 +1590,58 @@ class EmuDisplay:
 
     def shader_map(self, index, start_addr, with_accept=True):
         """Привязка сопрограммы к индексу."""
+        self.chunk.video_starts.append(start_addr)
         self.send_command(self.SHADER_MAP, index, start_addr, with_accept=with_accept)
         return index
 
-    def shader_exec(self, index, with_accept=True):
-        """Выполнение сопрограммы по индексу."""
-        self.send_command(self.SHADER_EXEC, index, with_accept=with_accept)
+    def shader_exec(self, index, force=False, with_accept=True):
+        """
+        Выполнение сопрограммы по индексу. Сопрограмма shader(cached=True) пропускается, если ее переменные
+        не изменились, force - выполнить ее в любом случае.
+        """
+        self.send_command(self.SHADER_FORCE if force else self.SHADER_EXEC, index, with_accept=with_accept)
+
+    def flush_and_wait(self):
+        """Вывод на дисплей через почтовый ящик с ожиданием, после выполнения всех команд очереди."""
+        queue, self.queue = self.queue, None
+        self.flush()
+        self.queue = queue
+
+    def alloc_queue(self, size=8):
+        """
+        Выделение очереди команд на size мест в коде, как alloc_shader: код не должен выполнять эти слова.
+        Очередь заполняет одно ядро, одно место всегда остается свободным.
+        """
+        if size < 2:
+            raise ValueError("Display queue needs at least 2 slots")
+        return self.chunk.reserve(0, 0, size, *[0] * (size * self.QUEUE_SLOT))
+
+    def start_queue(self, queue):
+        """Включение очереди в видеоядре, далее команды этого EmuDisplay добавляются в нее."""
+        self.queue = None
+        self.chunk.video_starts.append(queue)
+        self.send_command(self.QUEUE_START, queue)
+        self.queue = queue
+
+    def shader(self, *calls, bank=1, cached=False):
+        """
+        Сборка сопрограммы из команд вида ("rect", x, y, w, h) с выбором записи каждой команды
+        (shader.ShaderAssembler), SHADER_END добавляется в конце. Как и alloc_shader, размещается в коде,
+        который не выполняется, или в дополнительном банке bank карты памяти.
+        cached - начать сопрограмму командой SHADER_WATCH: повторное выполнение без изменений ее переменных
+        и без других FLUSH между выполнениями завершается сразу.
+        """
+        if self.assembler is None:
+            from shader import ShaderAssembler  # shader импортирует mindvm
+            self.assembler = ShaderAssembler(self)
+        return self.assembler.assemble(*calls, bank=bank, cached=cached)
 
     def alloc_shader(self, *args):
         """Определение сопрограммы в памяти"""
         addr = self.chunk.label()
         for arg in args:
             if EmuChunk.is_var(arg):
+                self.chunk.data_refs.add(len(self.chunk.code))
                 self.chunk.append(-arg[0])
                 continue
             self.chunk.append(arg)
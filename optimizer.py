@@ -0,0 +1,635 @@
+import math
+from dataclasses import dataclass, field
+
+from mindvm import EmuChunk, EmuDisplay, Instruction, Label, Operand, Type
+
+
+@dataclass
+class Block:
+    # Базовый блок: инструкции, выполняемые подряд, или участок данных в коде
+    start: int
+    items: list[Instruction]
+    successors: list[int] = field(default_factory=list)  # Позиции блоков, куда может перейти управление
+    predecessors: list[int] = field(default_factory=list)
+
+    @property
+    def end(self) -> int:
+        return self.items[-1].end
+
+    @property
+    def data(self) -> bool:
+        return self.items[0].data
+
+
+class ControlFlowGraph:
+    """
+    Базовые блоки и переходы между ними по разобранному коду EmuChunk.
+
+    Корни: начало кода для главного ядра, цели CONTROL_THREAD и инструкции, адреса которых передаются
+    как значения (точки входа GOTO_THREAD, непосредственные значения и данные). Если переход ведет по числовому адресу
+    или в середину данных, граф неточен (exact = False) и удалять по нему код нельзя.
+    OP_RET может вернуться после любого OP_CALL, поэтому его последователи - места после всех вызовов.
+    """
+
+    def __init__(self, chunk: EmuChunk):
+        self.chunk = chunk
+        self.items = chunk.decode()
+        self.uses = chunk.label_uses(self.items)
+        self.exact = True
+        self.entries = []  # Точки входа других ядер: позиции из GOTO_THREAD и CONTROL_THREAD
+        self.returns = []  # Позиции после OP_CALL, куда возвращает OP_RET
+        self.roots = [0]
+        self.blocks: dict[int, Block] = {}
+        self._build()
+
+    def _targets(self, item: Instruction) -> list:
+        """Операнды - цели переходов и точки входа."""
+        kinds = self.chunk.operand_kinds(item) or ()
+        return [(kind, word) for kind, word in zip(kinds, item.words[1:]) if kind in (Operand.target, Operand.entry)]
+
+    def _build(self):
+        starts = {item.start for item in self.items if not item.data}
+        # Метки, значение которых может стать счетчиком команд: не только адреса чтения и записи
+        addresses = {id(entry[1]) for entry in self.chunk.data if isinstance(entry[1], Label)}
+        for item in self.items:
+            kinds = self.chunk.operand_kinds(item)
+            for n, word in enumerate(item.words):
+                if isinstance(word, Label) and (kinds is None or n == 0 or kinds[n - 1] not in EmuChunk.ADDRESSES):
+                    addresses.add(id(word))
+        leaders = {0}
+        for label, pointer in self.uses.values():
+            if label.not_reassigned:
+                self.exact = False
+            elif not pointer:
+                leaders.add(label.position)
+            elif label.position - 1 in starts:
+                leaders.add(label.position - 1)
+                if id(label) in addresses:
+                    self.roots.append(label.position - 1)
+
+        for item in self.items:
+            if item.data or item.opcode in EmuChunk.BRANCHES or item.opcode in (EmuChunk.OP_EXIT, EmuChunk.OP_RET):
+                leaders.add(item.end)
+            if not item.data and item.opcode == EmuChunk.OP_CALL:
+                self.returns.append(item.end)
+            if item.data:
+                leaders.add(item.start)
+            for kind, word in self._targets(item):
+                if isinstance(word, Label):
+                    position = word.position if kind is Operand.target else word.position - 1
+                    if item.opcode in (EmuChunk.OP_CONTROL_THREAD, EmuChunk.OP_GOTO_THREAD):
+                        self.entries.append(position)
+                        self.roots.append(position)
+                elif not (kind is Operand.entry and word == EmuChunk.DISABLE_THREAD):
+                    self.exact = False  # Переход по вычисленному адресу
+
+        block = None
+        for item in self.items:
+            if block is None or item.start in leaders:
+                block = Block(item.start, [])
+                self.blocks[item.start] = block
+            block.items.append(item)
+
+        for block in self.blocks.values():
+            for position in self._successors(block):
+                if position >= len(self.chunk.code):
+                    continue  # За концом кода нули, ядро завершается на OP_EXIT
+                if position not in self.blocks:
+                    self.exact = False
+                    continue
+                block.successors.append(position)
+                self.blocks[position].predecessors.append(block.start)
+        for position in self.roots:
+            if position not in self.blocks and position < len(self.chunk.code):
+                self.exact = False
+
+    def _successors(self, block: Block) -> list[int]:
+        last = block.items[-1]
+        if block.data:
+            return [block.end]  # Выполнение данных как кода, учитывается только переход дальше
+        targets = [word.position for kind, word in self._targets(last)
+                   if kind is Operand.target and last.opcode in EmuChunk.BRANCHES and isinstance(word, Label)]
+        if last.opcode == EmuChunk.OP_EXIT:
+            return []
+        if last.opcode == EmuChunk.OP_RET:
+            return list(self.returns)  # Возврат в место любого вызова
+        if last.opcode == EmuChunk.OP_JUMP and last.words[2] == EmuChunk.NON_ZERO[0]:
+            return targets
+        return targets + [block.end]
+
+    def block_at(self, position: int) -> Block | None:
+        """Блок, содержащий позицию кода."""
+        for block in self.blocks.values():
+            if block.start <= position < block.end:
+                return block
+        return None
+
+    def reachable(self, roots: list[int] | None = None) -> set[int]:
+        """Позиции блоков, достижимых из корней (по умолчанию из всех)."""
+        seen = set()
+        stack = [position for position in (self.roots if roots is None else roots) if position in self.blocks]
+        while stack:
+            position = stack.pop()
+            if position in seen:
+                continue
+            seen.add(position)
+            stack.extend(self.blocks[position].successors)
+        return seen
+
+
+def addresses_code(chunk: EmuChunk, items: list[Instruction]) -> bool:
+    """Программа обращается по числовым адресам к словам кода."""
+    start = len(chunk.data) + 3
+    for item in items:
+        kinds = chunk.operand_kinds(item) or ()
+        for kind, word in zip(kinds, item.words[1:]):
+            if kind in EmuChunk.ADDRESSES and type(word) is int and start <= word < start + len(chunk.code):
+                return True
+    return False
+
+
+class DeadCode:
+    """
+    Удаление недостижимых инструкций и участков данных в коде, затем констант data, на которые не осталось ссылок.
+
+    Слова, на которые указывают метки, сохраняются. Если граф потока управления неточен, достижимый участок
+    данных выполняется как код или программа обращается по числовым адресам внутрь кода, ничего не удаляется.
+    """
+
+    def __init__(self, chunk: EmuChunk):
+        self.chunk = chunk
+        self.stats = {"unreachable_words": 0, "unused_constants": 0}
+
+    def run(self) -> dict[str, int]:
+        graph = ControlFlowGraph(self.chunk)
+        if not graph.exact or addresses_code(self.chunk, graph.items):
+            return self.stats
+        live = graph.reachable()
+        if any(graph.blocks[position].data for position in live):
+            return self.stats
+
+        pinned = {label.position - 1 for label, pointer in graph.uses.values() if pointer}
+        items = []
+        for block in graph.blocks.values():
+            for item in block.items:
+                if block.start in live or any(item.start <= n < item.end for n in pinned):
+                    items.append(item)
+                else:
+                    self.stats["unreachable_words"] += len(item.words)
+        if self.stats["unreachable_words"]:
+            self.chunk.rebuild(items)
+        self._drop_constants()
+        return self.stats
+
+    def _drop_constants(self):
+        referenced = self.chunk.far_references()
+        for item in self.chunk.decode():
+            kinds = self.chunk.operand_kinds(item)
+            if kinds is None:
+                # Данные в коде: отрицательные ссылки оберток сопрограмм (EmuChunk.data_refs),
+                # положительные числа учитываются на всякий случай
+                referenced.update(abs(word) for n, word in enumerate(item.words, start=item.start)
+                                  if type(word) is int and (word > 0 or n in self.chunk.data_refs))
+                continue
+            for kind, word in zip(kinds, item.words[1:]):
+                if kind in EmuChunk.ADDRESSES and type(word) is int:
+                    referenced.update(range(word, word + (4 if kind is Operand.out4 else 1)))
+
+        data = []
+        mapping = {}
+        for n, entry in enumerate(self.chunk.data):
+            if entry[0] is Type.static and n + 3 not in referenced:
+                continue
+            mapping[n + 3] = len(data) + 3
+            data.append(entry)
+        unused = len(self.chunk.data) - len(data)
+        if unused and self.chunk.relocate_data(mapping, data):
+            self.stats["unused_constants"] += unused
+
+
+class Peephole:
+    """
+    Оптимизация байт-кода EmuChunk по шаблонам перед разрешением меток.
+
+    Проходы: свертка MATH над константами в SET, удаление повторной записи той же константы
+    в аргументы дисплея, объединение SET по соседним адресам в SET_4, сокращение цепочек переходов
+    и удаление переходов на следующую инструкцию.
+
+    Инструкции со словами, на которые указывают метки (данные и точки входа ядер, самомодифицирующийся код),
+    не изменяются и не удаляются. Если программа пишет по числовому адресу внутрь кода,
+    оптимизация не выполняется. Знания о значениях аргументов дисплея сбрасываются на каждой цели перехода,
+    поэтому команды дисплея из разных ядер должны, как и раньше, разделяться ожиданием подтверждения.
+    """
+
+    MAX_ROUNDS = 16  # Повторять проходы, пока они находят изменения, но не больше
+    MAILBOX_ARGS = range(EmuDisplay.ADDRESS + 1, EmuDisplay.ADDRESS + 7)
+    JUMPS = (EmuChunk.OP_JUMP, EmuChunk.OP_JUMP_NEQ_CONST, EmuChunk.OP_JUMP_GT_CONST)
+    WRITES = (Operand.out, Operand.inout, Operand.out4)
+
+    def __init__(self, chunk: EmuChunk):
+        self.chunk = chunk
+        self.stats = {
+            "fold_math": 0,
+            "mailbox_writes": 0,
+            "set_4": 0,
+            "jump_threading": 0,
+            "jump_to_next": 0,
+            "wait_eq": 0,
+            "jump_neq_set": 0,
+            "add_jump_gt": 0,
+        }
+        self.frozen = set()  # Позиции инструкций, которые нельзя менять
+        self.leaders = set()  # Позиции, на которые может прийти управление не по порядку
+        self.written = set()  # Числовые адреса, в которые пишет программа
+        self.written_words = set()  # Слова кода, в которые пишет программа через метки
+
+    def run(self) -> dict[str, int]:
+        if not self._safe(self.chunk.decode()):
+            return self.stats
+        passes = (self.fold_math, self.drop_mailbox_writes, self.fuse_set, self.thread_jumps,
+                  self.drop_jumps_to_next, self.fuse_superinstructions)
+        for _ in range(self.MAX_ROUNDS):
+            changed = False
+            for optimization in passes:
+                items = self.chunk.decode()
+                self._analyze(items)
+                result = optimization(items)
+                if result is not None:
+                    self.chunk.rebuild(result)
+                    changed = True
+            if not changed:
+                break
+        return self.stats
+
+    def _safe(self, items: list[Instruction]) -> bool:
+        """Программа не пишет по числовым адресам внутри кода, расположение которого изменится."""
+        start = len(self.chunk.data) + 3
+        for item in items:
+            kinds = self.chunk.operand_kinds(item) or ()
+            for kind, word in zip(kinds, item.words[1:]):
+                if kind in self.WRITES + (Operand.base,) and isinstance(word, int) and \
+                        start <= word < start + len(self.chunk.code):
+                    return False
+        return True
+
+    def _analyze(self, items: list[Instruction]):
+        uses = self.chunk.label_uses(items).values()
+        pinned = {label.position - 1 for label, pointer in uses if pointer}
+        sources = {}  # Цель перехода -> позиции инструкций, переходящих на нее
+        self.frozen = set()
+        self.written = set()
+        self.written_words = set()
+        for item in items:
+            kinds = self.chunk.operand_kinds(item)
+            if kinds is None or any(item.start + n in pinned for n in range(len(item.words))):
+                self.frozen.add(item.start)
+            for kind, word in zip(kinds or (), item.words[1:]):
+                if kind is Operand.target and isinstance(word, Label):
+                    sources.setdefault(word.position, set()).add(item.start)
+                if kind not in self.WRITES:
+                    continue
+                span = 4 if kind is Operand.out4 else 1
+                if isinstance(word, Label):
+                    self.written_words.update(range(word.position - 1, word.position - 1 + span))
+                elif isinstance(word, int):
+                    self.written.update(range(word, word + span))
+        # Цикл ожидания из одной инструкции, переходящей на саму себя, не прерывает участок кода
+        self.leaders = pinned | {
+            label.position for label, pointer in uses
+            if not pointer and sources.get(label.position) != {label.position}
+        }
+
+    def _editable(self, item: Instruction) -> bool:
+        return not item.data and item.start not in self.frozen
+
+    def _constant(self, ref):
+        """Значение ссылки, если программа его никогда не меняет."""
+        if isinstance(ref, Label):
+            if ref.position - 1 in self.written_words:
+                return None
+        elif ref in self.written:
+            return None
+        return self.chunk.constant(ref)
+
+    @staticmethod
+    def _fold(operation, a, b):
+        """Вычисление MATH так же, как это делает core.masm, None - если не вычисляется заранее."""
+        if operation == EmuChunk.OPERATION_ADD:
+            return a + b
+        if operation == EmuChunk.OPERATION_SUB:
+            return a - b
+        if operation == EmuChunk.OPERATION_MUL:
+            return a * b
+        if operation == EmuChunk.OPERATION_DIV:
+            return a / b if b != 0 else 0
+        if operation == EmuChunk.OPERATION_EQ:
+            return int(a == b)
+        if operation == EmuChunk.OPERATION_GT:
+            return int(a > b)
+        if operation == EmuChunk.OPERATION_LT:
+            return int(a < b)
+        if operation == EmuChunk.OPERATION_NEQ:
+            return int(a != b)
+        if operation == EmuChunk.OPERATION_MOD and b != 0:
+            result = math.fmod(a, b)
+            return int(result) if isinstance(a, int) and isinstance(b, int) else result
+        return None
+
+    def fold_math(self, items: list[Instruction]) -> list[Instruction] | None:
+        """MATH над константами заменяется на SET результата."""
+        changed = False
+        for n, item in enumerate(items):
+            if not self._editable(item) or item.opcode != EmuChunk.OP_MATH:
+                continue
+            operation, a, b = (self._constant(ref) for ref in item.words[1:4])
+            if operation is None or a is None or b is None:
+                continue
+            value = self._fold(operation, a, b)
+            if value is None:
+                continue
+            items[n] = Instruction(item.start, [EmuChunk.OP_SET, item.words[4], value], verbatim=False)
+            self.stats["fold_math"] += 1
+            changed = True
+        return items if changed else None
+
+    def drop_mailbox_writes(self, items: list[Instruction]) -> list[Instruction] | None:
+        """Удаляет SET и SET_4 аргументов дисплея, если в них уже лежат те же значения на этом участке кода."""
+        result = []
+        known = {}
+        for item in items:
+            if item.data or item.start in self.leaders:
+                known.clear()
+            kinds = self.chunk.operand_kinds(item)
+            if kinds is None or Operand.base in kinds:
+                known.clear()  # Данные или запись в массив по индексу
+                result.append(item)
+                continue
+            if item.opcode in (EmuChunk.OP_SET, EmuChunk.OP_SET_4) and self._editable(item) and \
+                    type(item.words[1]) is int:
+                stores = list(enumerate(item.words[2:], start=item.words[1]))
+                if all(address in self.MAILBOX_ARGS and self._known(known, address, value)
+                       for address, value in stores):
+                    self.stats["mailbox_writes"] += 1
+                    continue
+            for kind, word in zip(kinds, item.words[1:]):
+                if kind not in self.WRITES:
+                    continue
+                if isinstance(word, Label):
+                    continue  # Запись в слово кода
+                for address in range(word, word + (4 if kind is Operand.out4 else 1)):
+                    known.pop(address, None)
+            if item.opcode == EmuChunk.OP_SET and isinstance(item.words[1], int):
+                known[item.words[1]] = item.words[2]
+            elif item.opcode == EmuChunk.OP_SET_4 and isinstance(item.words[1], int):
+                for n, value in enumerate(item.words[2:6]):
+                    known[item.words[1] + n] = value
+            elif item.opcode in (EmuChunk.OP_CALL, EmuChunk.OP_RET):
+                known.clear()  # Вызванная функция или место возврата могут записать другие аргументы дисплея
+            result.append(item)
+        return result if len(result) != len(items) else None
+
+    @staticmethod
+    def _known(known: dict, address: int, value) -> bool:
+        if address not in known:
+            return False
+        if isinstance(value, Label) or isinstance(known[address], Label):
+            return known[address] is value
+        return type(known[address]) is type(value) and known[address] == value
+
+    def _plain_set(self, item: Instruction) -> bool:
+        return self._editable(item) and item.opcode == EmuChunk.OP_SET and type(item.words[1]) is int
+
+    def fuse_set(self, items: list[Instruction]) -> list[Instruction] | None:
+        """Четыре SET подряд по соседним адресам объединяются в SET_4, кроме записи номера команды дисплея."""
+        result = []
+        n = 0
+        while n < len(items):
+            run = items[n:n + 4]
+            if len(run) == 4 and all(self._plain_set(item) for item in run) and \
+                    not any(item.start in self.leaders for item in run[1:]):
+                values = {item.words[1]: item.words[2] for item in run}
+                base = min(values)
+                if sorted(values) == list(range(base, base + 4)) and EmuDisplay.ADDRESS not in values:
+                    result.append(Instruction(
+                        run[0].start,
+                        [EmuChunk.OP_SET_4, base, *(values[address] for address in range(base, base + 4))],
+                        verbatim=False
+                    ))
+                    self.stats["set_4"] += 1
+                    n += 4
+                    continue
+            result.append(items[n])
+            n += 1
+        return result if len(result) != len(items) else None
+
+    def thread_jumps(self, items: list[Instruction]) -> list[Instruction] | None:
+        """Переход на безусловный переход или на переход с тем же условием ведет сразу к его цели."""
+        by_start = {item.start: item for item in items if not item.data}
+        changed = False
+        for n, item in enumerate(items):
+            if not self._editable(item) or item.opcode not in EmuChunk.BRANCHES:
+                continue
+            index = self.chunk.OPERANDS[item.opcode].index(Operand.target) + 1
+            target = item.words[index]
+            if not isinstance(target, Label):
+                continue
+            seen = {id(target)}
+            while True:
+                next_item = by_start.get(target.position)
+                if next_item is None or not self._editable(next_item) or next_item.opcode not in self.JUMPS:
+                    break
+                unconditional = next_item.opcode == EmuChunk.OP_JUMP and next_item.words[2] == EmuChunk.NON_ZERO[0]
+                same = next_item.opcode == item.opcode and item.opcode in self.JUMPS and \
+                    next_item.words[2:] == item.words[2:]
+                following = next_item.words[1]
+                if not (unconditional or same) or not isinstance(following, Label) or \
+                        following.not_reassigned or id(following) in seen:
+                    break
+                seen.add(id(following))
+                target = following
+            if target is not item.words[index]:
+                words = list(item.words)
+                words[index] = target
+                items[n] = Instruction(item.start, words, verbatim=False)
+                self.stats["jump_threading"] += 1
+                changed = True
+        return items if changed else None
+
+    def drop_jumps_to_next(self, items: list[Instruction]) -> list[Instruction] | None:
+        """Удаляет переходы на следующую за ними позицию."""
+        result = []
+        for item in items:
+            if self._editable(item) and item.opcode in self.JUMPS and isinstance(item.words[1], Label) and \
+                    not item.words[1].not_reassigned and item.words[1].position == item.end:
+                self.stats["jump_to_next"] += 1
+                continue
+            result.append(item)
+        return result if len(result) != len(items) else None
+
+    @staticmethod
+    def _same(a, b) -> bool:
+        """Одна и та же ссылка."""
+        return a is b or type(a) is int and type(b) is int and a == b
+
+    def fuse_superinstructions(self, items: list[Instruction]) -> list[Instruction] | None:
+        """
+        Замена частых последовательностей суперинструкциями: цикл ожидания из одного JUMP_NEQ_CONST - WAIT_EQ,
+        JUMP_NEQ_CONST и SET той же переменной - JUMP_NEQ_SET, ADD_CONST или SUB_CONST и JUMP_GT_CONST
+        той же переменной - ADD_JUMP_GT.
+        """
+        if not self.chunk.use_superinstructions:
+            return None
+        result = []
+        changed = False
+        n = 0
+        while n < len(items):
+            item = items[n]
+            following = items[n + 1] if n + 1 < len(items) else None
+            pair = self._editable(item) and following is not None and self._editable(following) and \
+                following.start not in self.leaders
+            if self._editable(item) and item.opcode == EmuChunk.OP_JUMP_NEQ_CONST and \
+                    isinstance(item.words[1], Label) and not item.words[1].not_reassigned and \
+                    item.words[1].position == item.start:
+                result.append(Instruction(item.start, [EmuChunk.OP_WAIT_EQ, *item.words[2:]], verbatim=False))
+                self.stats["wait_eq"] += 1
+                changed = True
+                n += 1
+                continue
+            if pair and item.opcode == EmuChunk.OP_JUMP_NEQ_CONST and following.opcode == EmuChunk.OP_SET and \
+                    self._same(item.words[2], following.words[1]):
+                result.append(Instruction(item.start, [EmuChunk.OP_JUMP_NEQ_SET, *item.words[1:], following.words[2]],
+                                          verbatim=False))
+                self.stats["jump_neq_set"] += 1
+                changed = True
+                n += 2
+                continue
+            if pair and item.opcode in (EmuChunk.OP_ADD_CONST, EmuChunk.OP_SUB_CONST) and \
+                    following.opcode == EmuChunk.OP_JUMP_GT_CONST and self._same(item.words[1], following.words[2]):
+                delta = item.words[2]
+                if item.opcode == EmuChunk.OP_SUB_CONST:
+                    delta = -delta if type(delta) in (int, float) else None
+                if delta is not None:
+                    result.append(Instruction(
+                        item.start,
+                        [EmuChunk.OP_ADD_JUMP_GT, item.words[1], delta, following.words[1], following.words[3]],
+                        verbatim=False
+                    ))
+                    self.stats["add_jump_gt"] += 1
+                    changed = True
+                    n += 2
+                    continue
+            result.append(item)
+            n += 1
+        return result if changed else None
+
+
+class SlotAllocator:
+    """
+    Совмещение переменных data, время жизни которых не пересекается, в общих ячейках.
+
+    Время жизни считается анализом живых переменных по графу потока управления. Переменная, к которой
+    обращается код нескольких ядер (блоки, достижимые из разных корней), обертка сопрограммы (ссылка в данных
+    кода) или SET_4, а также переменная, читаемая до первой записи (важно значение по умолчанию),
+    остается в своей ячейке. Совмещаются только переменные одного ядра. Если программа обращается к массивам
+    (операнды base), ничего не совмещается: слова массива читаются и пишутся по вычисляемым адресам.
+    """
+
+    def __init__(self, chunk: EmuChunk):
+        self.chunk = chunk
+        self.stats = {"shared_slots": 0}
+
+    def _access(self, item: Instruction, variables: set[int]) -> tuple[set[int], set[int]]:
+        """Переменные, которые инструкция читает и записывает."""
+        uses, defs = set(), set()
+        for kind, word in zip(self.chunk.operand_kinds(item) or (), item.words[1:]):
+            if type(word) is not int or word not in variables:
+                continue
+            if kind in (Operand.ref, Operand.inout):
+                uses.add(word)
+            if kind in (Operand.out, Operand.inout):
+                defs.add(word)
+        return uses, defs
+
+    def run(self) -> dict[str, int]:
+        graph = ControlFlowGraph(self.chunk)
+        if not graph.exact or addresses_code(self.chunk, graph.items):
+            return self.stats
+        if any(graph.blocks[position].data for position in graph.reachable()):
+            return self.stats
+        if any(Operand.base in (self.chunk.operand_kinds(item) or ()) for item in graph.items):
+            return self.stats
+
+        variables = {n + 3 for n, entry in enumerate(self.chunk.data) if entry[0] is Type.var}
+        pinned = self.chunk.far_references()  # Ссылки сопрограмм в дополнительных банках
+        owners = {}  # Переменная -> корни, из которых достижимы обращения к ней
+        regions = {root: graph.reachable([root]) for root in set(graph.roots)}
+        for block in graph.blocks.values():
+            roots = {root for root, region in regions.items() if block.start in region}
+            for item in block.items:
+                kinds = self.chunk.operand_kinds(item)
+                if kinds is None:
+                    pinned.update(abs(word) for word in item.words if type(word) is int)
+                    continue
+                for kind, word in zip(kinds, item.words[1:]):
+                    if kind not in EmuChunk.ADDRESSES or type(word) is not int:
+                        continue
+                    if kind is Operand.out4:
+                        pinned.update(range(word, word + 4))
+                    owners.setdefault(word, set()).update(roots)
+                    if not roots:
+                        pinned.add(word)  # Сохраненный, но недостижимый код
+        pinned.update(variable for variable, roots in owners.items() if len(roots) > 1)
+
+        # Живые переменные на входе каждого блока
+        access = {position: [self._access(item, variables) for item in block.items]
+                  for position, block in graph.blocks.items()}
+        live_in = {position: set() for position in graph.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for position in reversed(graph.blocks):
+                live = set().union(*(live_in[successor] for successor in graph.blocks[position].successors))
+                for uses, defs in reversed(access[position]):
+                    live = (live - defs) | uses
+                if live != live_in[position]:
+                    live_in[position] = live
+                    changed = True
+        for root in graph.roots:
+            pinned.update(live_in.get(root, ()))
+
+        interference = {variable: set() for variable in variables}
+        for position, block in graph.blocks.items():
+            live = set().union(*(live_in[successor] for successor in block.successors))
+            for uses, defs in reversed(access[position]):
+                for variable in defs:
+                    interference[variable].update(live - {variable})
+                    for other in live - {variable}:
+                        interference[other].add(variable)
+                live = (live - defs) | uses
+
+        slots = []  # (ядра, переменные в ячейке); первая переменная - представитель ячейки
+        shared = {}
+        for variable in sorted(variables - pinned):
+            roots = frozenset(owners.get(variable, ()))
+            for slot_roots, members in slots:
+                if slot_roots == roots and not interference[variable] & set(members):
+                    members.append(variable)
+                    shared[variable] = members[0]
+                    break
+            else:
+                slots.append((roots, [variable]))
+        if not shared:
+            return self.stats
+
+        data = []
+        mapping = {}
+        for n, entry in enumerate(self.chunk.data):
+            if n + 3 in shared:
+                continue
+            mapping[n + 3] = len(data) + 3
+            data.append(entry)
+        for variable, representative in shared.items():
+            mapping[variable] = mapping[representative]
+        if self.chunk.relocate_data(mapping, data):
+            self.stats["shared_slots"] += len(shared)
+        return self.stats
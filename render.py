@@ -0,0 +1,291 @@
+"""
+Векторизованная растеризация команд draw без игры: просмотр и профилирование того, что рисует видеоядро.
+
+Сопрограммы читаются из образа так же, как их читает видеоядро (emulator.EmuVideo.execute): полные команды
+и обертки SHADER_WRAP с отрицательными ссылками на переменные. Значения переменных задаются привязками,
+массив значений задает по кадру на значение, все кадры рисуются одновременно в буфер NumPy
+(кадры, DISPLAY_SIZE, DISPLAY_SIZE, RGB). Строка 0 буфера - нижняя строка дисплея, как в координатах draw.
+
+Для каждой команды считаются закрашенные пиксели, перерисовка - пиксели, уже закрашенные в этом кадре
+предыдущими фигурами (CLEAR - фон и не считается), и перекрытые - закрашенные командой и затем полностью
+закрашенные непрозрачными командами, то есть нарисованные впустую. Требует numpy.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+from mindvm import EmuChunk, EmuDisplay, Label
+from emulator import EmuVideo
+from shader import ARGS, COMMANDS
+
+# Номера команд по именам методов EmuDisplay и по именам команд draw видеоядра
+NAMES = {name: command for name, (command, _) in COMMANDS.items()}
+NAMES.update({name: command for command, (name, _) in EmuVideo.DRAW.items()})
+
+
+@dataclass(frozen=True)
+class Ref:
+    # Аргумент обертки, читаемый видеоядром из bank1 по адресу
+    address: int
+
+
+@dataclass
+class CommandStats:
+    index: int  # Номер команды в потоке
+    name: str
+    args: tuple  # Аргументы, ссылки в виде Ref
+    pixels: int = 0  # Закрашено пикселей во всех кадрах
+    overdraw: int = 0  # Из них уже закрашенных в кадре предыдущими фигурами
+    hidden: int = 0  # Закрашенных командой и перекрытых затем непрозрачными командами
+    frames: int = 0  # Кадров, в которых выполнена команда
+
+
+def decode(image: list, start: int | Label, far: list[list] = ()) -> list[tuple]:
+    """
+    Команды сопрограммы с адреса start до SHADER_END в виде (номер, аргументы...), как их выполняет видеоядро.
+    Аргументы оберток сохраняются в регистрах между командами, отрицательные значения - ссылки Ref.
+    start - метка из shader/alloc_shader или адрес в карте памяти, far - образы EmuChunk.link_far().
+    """
+    if isinstance(start, Label):
+        start = start.position + image[1]
+    banks = [image, *far]
+    bank, index = divmod(start, EmuChunk.BANK_SIZE)
+    if not 0 <= bank < len(banks):
+        raise ValueError(f"Shader address {start} is outside of {len(banks)} banks")
+    memory = banks[bank]
+    wrap, wrap_end = EmuDisplay.SHADER_WRAP, EmuDisplay.SHADER_WRAP_END
+    args = [0] * 6
+    commands = []
+    while True:
+        if len(commands) > EmuChunk.BANK_SIZE:
+            raise ValueError(f"Shader at {start} does not end with SHADER_END")
+        func = memory[index]
+        if func == wrap:
+            func = memory[index + 1]
+            index += 2
+            for n in range(6):
+                value = memory[index]
+                index += 1
+                if value == wrap_end:
+                    break
+                args[n] = Ref(-value) if value < 0 else value
+        else:
+            args[:] = memory[index + 1:index + 7]
+            index += 7
+        if func == EmuDisplay.SHADER_END:
+            return commands
+        if func == EmuDisplay.SHADER_JUMP:
+            index = int(args[0]) % EmuChunk.BANK_SIZE
+            continue
+        if func == EmuDisplay.SHADER_WATCH:
+            index += EmuDisplay.WATCH_HEADER + 2 * memory[index]
+            continue
+        commands.append((func, *args[:ARGS.get(func, 6)]))
+
+
+class Renderer:
+    """Буферы кадров и состояние дисплея (цвет, толщина линий) для frames кадров, рисуемых одновременно."""
+
+    SIZE = EmuDisplay.DISPLAY_SIZE
+
+    def __init__(self, frames: int = 1, size: int = SIZE):
+        self.frames = frames
+        self.size = size
+        self.pixels = np.zeros((frames, size, size, 3), dtype=np.float32)
+        self.coverage = np.zeros((frames, size, size), dtype=bool)  # Пиксели, закрашенные фигурами в кадре
+        self.owner = np.full((frames, size, size), -1, dtype=np.int32)  # Команда, последней закрасившая пиксель
+        self.color = np.full((frames, 4), 255.0)
+        self.stroke = np.ones(frames)
+        # Центры пикселей
+        y, x = np.mgrid[0:size, 0:size] + 0.5
+        self.x, self.y = x[None], y[None]
+        self.stats = []
+
+    def _value(self, value) -> np.ndarray:
+        """Аргумент в виде массива (frames, 1, 1)."""
+        return np.broadcast_to(np.asarray(value, dtype=np.float64), (self.frames,)).reshape(-1, 1, 1)
+
+    def _segment(self, x1, y1, x2, y2, width) -> np.ndarray:
+        """Пиксели на расстоянии не больше width / 2 от отрезка."""
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = np.clip(((self.x - x1) * dx + (self.y - y1) * dy) / np.where(length, length, 1), 0, 1)
+        px, py = self.x - x1 - t * dx, self.y - y1 - t * dy
+        return px * px + py * py <= width * width / 4
+
+    def _rect(self, x, y, w, h) -> np.ndarray:
+        left, right = np.minimum(x, x + w), np.maximum(x, x + w)
+        bottom, top = np.minimum(y, y + h), np.maximum(y, y + h)
+        return (self.x >= left) & (self.x < right) & (self.y >= bottom) & (self.y < top)
+
+    def _poly(self, x, y, sides, radius, rotation) -> tuple[np.ndarray, np.ndarray]:
+        """Расстояние пикселей от центра правильного многоугольника и радиус его границы в их направлении."""
+        sides = np.maximum(sides, 3)
+        sector = 2 * np.pi / sides
+        dx, dy = self.x - x, self.y - y
+        angle = np.mod(np.arctan2(dy, dx) - np.radians(rotation), sector)
+        boundary = radius * np.cos(np.pi / sides) / np.cos(angle - np.pi / sides)
+        return np.hypot(dx, dy), boundary
+
+    def mask(self, func: int, args: list) -> np.ndarray | None:
+        """Пиксели фигуры команды func, None - команда не рисует."""
+        if func == EmuDisplay.RECT:
+            return self._rect(*args[:4])
+        if func == EmuDisplay.LINE:
+            return self._segment(*args[:4], self.stroke.reshape(-1, 1, 1))
+        if func == EmuDisplay.LINE_RECT:
+            x, y, w, h = args[:4]
+            width = self.stroke.reshape(-1, 1, 1)
+            return (self._segment(x, y, x + w, y, width) | self._segment(x + w, y, x + w, y + h, width)
+                    | self._segment(x + w, y + h, x, y + h, width) | self._segment(x, y + h, x, y, width))
+        if func in (EmuDisplay.POLY, EmuDisplay.LINE_POLY):
+            distance, boundary = self._poly(*args[:5])
+            visible = args[2] >= 3
+            if func == EmuDisplay.POLY:
+                return (distance <= boundary) & visible
+            return (np.abs(distance - boundary) <= self.stroke.reshape(-1, 1, 1) / 2) & visible
+        if func == EmuDisplay.TRIANGLE:
+            x1, y1, x2, y2, x3, y3 = args[:6]
+            edges = [(x2 - x1) * (self.y - y1) - (y2 - y1) * (self.x - x1),
+                     (x3 - x2) * (self.y - y2) - (y3 - y2) * (self.x - x2),
+                     (x1 - x3) * (self.y - y3) - (y1 - y3) * (self.x - x3)]
+            return ((edges[0] >= 0) & (edges[1] >= 0) & (edges[2] >= 0)
+                    | (edges[0] <= 0) & (edges[1] <= 0) & (edges[2] <= 0))
+        return None
+
+    def draw(self, func: int | str, *args, source: tuple = None) -> CommandStats:
+        """
+        Выполняет команду во всех кадрах, аргументы - числа или массивы по кадрам.
+        Возвращает счетчики команды, source - аргументы для отчета, по умолчанию args.
+        """
+        func = NAMES.get(func, func)
+        name = "flush" if func == EmuDisplay.FLUSH else EmuVideo.DRAW.get(func, (str(func), 0))[0]
+        stats = CommandStats(len(self.stats), name, tuple(args) if source is None else source, frames=self.frames)
+        self.stats.append(stats)
+        args = [self._value(arg) for arg in args] + [self._value(0)] * (6 - len(args))
+        if func == EmuDisplay.FLUSH:
+            self.coverage[:] = False
+            self.owner[:] = -1
+            return stats
+        if func == EmuDisplay.CLEAR:
+            self.pixels[:] = np.clip(np.concatenate(args[:3], axis=2), 0, 255)[:, None]
+            self._hide(np.ones_like(self.coverage))
+            self.owner[:] = stats.index
+            stats.pixels = self.frames * self.size * self.size
+            return stats
+        if func == EmuDisplay.COLOR:
+            self.color = np.clip(np.concatenate(args[:4], axis=1)[:, :, 0], 0, 255)
+            return stats
+        if func == EmuDisplay.STROKE:
+            self.stroke = args[0][:, 0, 0].copy()
+            return stats
+        mask = self.mask(func, args)
+        if mask is None:
+            return stats
+        mask = np.broadcast_to(mask, self.coverage.shape)
+        stats.pixels = int(mask.sum())
+        stats.overdraw = int((mask & self.coverage).sum())
+        alpha = (self.color[:, 3] / 255).reshape(-1, 1, 1, 1).astype(np.float32)
+        color = self.color[:, :3].reshape(-1, 1, 1, 3).astype(np.float32)
+        self.pixels = np.where(mask[..., None], self.pixels * (1 - alpha) + color * alpha, self.pixels)
+        self._hide(mask & (self.color[:, 3] >= 255)[:, None, None])
+        self.owner[mask] = stats.index
+        self.coverage |= mask
+        return stats
+
+    def _hide(self, mask: np.ndarray):
+        """Засчитывает перекрытые непрозрачной командой пиксели командам, последними их закрасившим."""
+        owners = self.owner[mask]
+        counts = np.bincount(owners[owners >= 0], minlength=len(self.stats))
+        for index in np.flatnonzero(counts):
+            self.stats[index].hidden += int(counts[index])
+
+    def run(self, commands: list[tuple], bindings: dict = None) -> list[CommandStats]:
+        """
+        Выполняет поток команд (номер или имя, аргументы...) во всех кадрах. Ссылки Ref читаются
+        из bindings по адресу, FLUSH начинает следующий кадр. Возвращает счетчики команд потока.
+        """
+        bindings = bindings or {}
+        stats = []
+        for func, *args in commands:
+            values = []
+            for arg in args:
+                if isinstance(arg, Ref):
+                    if arg.address not in bindings:
+                        raise ValueError(f"No binding for shader reference to address {arg.address}")
+                    arg = bindings[arg.address]
+                values.append(arg)
+            stats.append(self.draw(func, *values, source=tuple(args)))
+        return stats
+
+    def image(self, frame: int = 0) -> np.ndarray:
+        """Кадр в виде uint8 (высота, ширина, RGB) с верхней строкой дисплея в начале."""
+        return np.round(self.pixels[frame, ::-1]).astype(np.uint8)
+
+    def save_ppm(self, path: str, frame: int = 0):
+        """Сохраняет кадр в формате PPM, открываемом большинством просмотрщиков без дополнительных пакетов."""
+        image = self.image(frame)
+        with open(path, "wb") as file:
+            file.write(b"P6 %d %d 255\n" % (image.shape[1], image.shape[0]))
+            file.write(image.tobytes())
+
+
+def bind(image: list, commands: list[tuple], bindings=None) -> tuple[dict, int]:
+    """
+    Значения ссылок команд: из bindings - словаря адрес -> значение или пар (переменная EmuChunk или адрес,
+    значение), иначе из образа. Возвращает (адрес -> число или массив, количество кадров - наибольшая длина массива).
+    """
+    values = {}
+    for key, value in bindings.items() if isinstance(bindings, dict) else bindings or ():
+        values[key[0] if EmuChunk.is_var(key) else key] = value
+    frames = 1
+    for value in values.values():
+        if np.ndim(value):
+            frames = max(frames, len(value))
+    for _, *args in commands:
+        for arg in args:
+            if isinstance(arg, Ref) and arg.address not in values:
+                values[arg.address] = image[arg.address]
+    return values, frames
+
+
+def render(image: list, start: int | Label, bindings=None, far: list[list] = (),
+           batch: int = 64) -> tuple[np.ndarray, list[CommandStats]]:
+    """
+    Рисует сопрограмму с адреса start для всех наборов значений привязок, по batch кадров за раз.
+    Возвращает кадры uint8 (кадры, высота, ширина, RGB) с верхней строкой дисплея в начале
+    и счетчики команд, сложенные по всем кадрам.
+    """
+    commands = decode(image, start, far)
+    values, frames = bind(image, commands, bindings)
+    result = np.zeros((frames, EmuDisplay.DISPLAY_SIZE, EmuDisplay.DISPLAY_SIZE, 3), dtype=np.uint8)
+    total = None
+    for first in range(0, frames, batch):
+        count = min(batch, frames - first)
+        part = {address: value[first:first + count] if np.ndim(value) else value
+                for address, value in values.items()}
+        renderer = Renderer(count)
+        stats = renderer.run(commands, part)
+        result[first:first + count] = np.round(renderer.pixels[:, ::-1])
+        if total is None:
+            total = stats
+        else:
+            for sum_, part_stats in zip(total, stats):
+                sum_.pixels += part_stats.pixels
+                sum_.overdraw += part_stats.overdraw
+                sum_.hidden += part_stats.hidden
+                sum_.frames += part_stats.frames
+    return result, total
+
+
+def report(stats: list[CommandStats]) -> str:
+    """Таблица счетчиков рисующих команд в среднем на кадр, ссылки - @адрес."""
+    lines = [f"{'#':>3} {'command':<10} {'pixels':>8} {'overdraw':>9} {'hidden':>8}  args"]
+    for item in stats:
+        if not item.pixels:
+            continue
+        frames = item.frames or 1
+        args = ", ".join(f"@{arg.address}" if isinstance(arg, Ref) else str(arg) for arg in item.args)
+        lines.append(f"{item.index:>3} {item.name:<10} {item.pixels / frames:>8.0f} {item.overdraw / frames:>9.0f} "
+                     f"{item.hidden / frames:>8.0f}  {args}")
+    return "\n".join(lines)
@@ -0,0 +1,298 @@
+"""
+Генератор схемы Mindustry (.msch) MindVM с заданным количеством ядер и банков карты памяти.
+
+Схема повторяет scheme.msch: видеоядро и ядра - hyper-processor с источниками криофлюида, ячейки таблиц
+переходов с заполняющими их процессорами, ячейка счетчиков команд ядер с контроллером ядер, банки памяти
+bank1..bankN с загрузчиками, дисплей, сообщение, клавиатура из 9 переключателей, кнопка запуска и
+выключатель, управляющий всеми процессорами, и купол ускорения. Программы ядра и видеоядра берутся
+из buildings, контроллер ядер генерируется coregen.threads() под их количество.
+
+Ядра располагаются над основной частью схемы рядами по CORES_PER_ROW, связи каждого процессора
+проверяются по дальности, а программы - по количеству инструкций.
+
+Запуск: python schematic.py [ядер] [банков] [файл] - записывает схему без загрузчиков, по умолчанию
+в mindvm{ядер}.msch и mindvm{ядер}.base64.
+"""
+import base64
+import io
+import struct
+import sys
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import coregen
+from mindvm import Artifact, EmuChunk, EmuDisplay
+
+ROOT = Path(__file__).parent
+TILE = 8  # Размер клетки в единицах мира
+
+# Размер блоков в клетках и дальность связей процессоров в единицах мира
+SIZES = {
+    "hyper-processor": 3,
+    "logic-processor": 2,
+    "micro-processor": 1,
+    "memory-bank": 2,
+    "memory-cell": 1,
+    "large-logic-display": 6,
+    "overdrive-dome": 3,
+}
+RANGES = {
+    "micro-processor": 10 * TILE,
+    "logic-processor": 22 * TILE,
+    "hyper-processor": 42 * TILE,
+}
+MAX_INSTRUCTIONS = 1000  # Инструкций в программе процессора
+
+# Содержимое источников: (тип, номер)
+SILICON = (0, 9)
+PHASE_FABRIC = (0, 11)
+CRYOFLUID = (4, 3)
+
+KEYS = 9
+CORES_PER_ROW = 4
+CORE_COLUMNS = (1, 5, 8, 12)  # Центры ядер в ряду, между парами - источники криофлюида
+COOLANT_COLUMNS = (3, 10)
+CORE_ROWS = 11  # Центр первого ряда ядер
+
+
+@dataclass(eq=False)
+class Block:
+    name: str
+    x: int
+    y: int
+    config: object = None  # None, bool, str, содержимое (тип, номер) или программа Program
+    rotation: int = 0
+
+    @property
+    def size(self) -> int:
+        return SIZES.get(self.name, 1)
+
+    @property
+    def tiles(self) -> set[tuple[int, int]]:
+        low = -((self.size - 1) // 2)
+        return {(self.x + dx, self.y + dy)
+                for dx in range(low, low + self.size) for dy in range(low, low + self.size)}
+
+    @property
+    def center(self) -> tuple[float, float]:
+        offset = (self.size + 1) % 2 * TILE / 2
+        return self.x * TILE + offset, self.y * TILE + offset
+
+
+@dataclass
+class Program:
+    # Конфигурация процессора: текст программы и связи по именам
+    code: str
+    links: dict[str, Block] = field(default_factory=dict)
+
+
+class Schematic:
+    """Блоки схемы и их запись в формате .msch версии 1."""
+
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self.blocks: list[Block] = []
+
+    def add(self, name: str, x: int, y: int, config=None) -> Block:
+        block = Block(name, x, y, config)
+        self.blocks.append(block)
+        return block
+
+    def processor(self, name: str, x: int, y: int, code: str, **links: Block) -> Block:
+        return self.add(name, x, y, Program(code, links))
+
+    def validate(self):
+        """Проверяет пересечения блоков, дальность связей и длину программ процессоров."""
+        occupied = {}
+        for block in self.blocks:
+            for tile in block.tiles:
+                if tile in occupied:
+                    raise ValueError(f"{block.name} at {block.x},{block.y} overlaps {occupied[tile].name}")
+                occupied[tile] = block
+        for block in self.blocks:
+            if not isinstance(block.config, Program):
+                continue
+            lines = [line for line in block.config.code.splitlines() if line.strip()]
+            if len(lines) > MAX_INSTRUCTIONS:
+                raise ValueError(f"{block.name} at {block.x},{block.y} has {len(lines)} instructions,"
+                                 f" at most {MAX_INSTRUCTIONS} allowed")
+            (x, y), limit = block.center, RANGES[block.name]
+            for name, other in block.config.links.items():
+                ox, oy = other.center
+                if ((ox - x) ** 2 + (oy - y) ** 2) ** 0.5 > limit + other.size * TILE / 2:
+                    raise ValueError(f"Link {name} of {block.name} at {block.x},{block.y} is out of range")
+
+    @staticmethod
+    def _utf(stream, text: str):
+        data = text.encode()
+        stream.write(struct.pack(">H", len(data)) + data)
+
+    def _config(self, stream, block: Block):
+        """Конфигурация блока в записи TypeIO.writeObject."""
+        config = block.config
+        if config is None:
+            stream.write(b"\x00")
+        elif isinstance(config, bool):
+            stream.write(struct.pack(">bb", 10, config))
+        elif isinstance(config, str):
+            stream.write(b"\x04\x01")
+            self._utf(stream, config)
+        elif isinstance(config, tuple):
+            stream.write(struct.pack(">bbh", 5, *config))
+        else:
+            data = self._program(block, config)
+            stream.write(struct.pack(">bi", 14, len(data)) + data)
+
+    def _program(self, block: Block, program: Program) -> bytes:
+        """Сжатая конфигурация процессора: версия, текст программы и связи относительно процессора."""
+        stream = io.BytesIO()
+        code = program.code.encode()
+        stream.write(struct.pack(">bi", 1, len(code)) + code)
+        stream.write(struct.pack(">i", len(program.links)))
+        for name, other in program.links.items():
+            self._utf(stream, name)
+            stream.write(struct.pack(">hh", other.x - block.x, other.y - block.y))
+        return zlib.compress(stream.getvalue())
+
+    def encode(self) -> bytes:
+        self.validate()
+        tiles = [tile for block in self.blocks for tile in block.tiles]
+        left, bottom = min(x for x, _ in tiles), min(y for _, y in tiles)
+        width, height = max(x for x, _ in tiles) - left + 1, max(y for _, y in tiles) - bottom + 1
+        names = list(dict.fromkeys(block.name for block in self.blocks))
+
+        stream = io.BytesIO()
+        stream.write(struct.pack(">hh", width, height))
+        tags = {"name": self.name, "description": self.description, "labels": "[]"}
+        stream.write(struct.pack(">b", len(tags)))
+        for key, value in tags.items():
+            self._utf(stream, key)
+            self._utf(stream, value)
+        stream.write(struct.pack(">b", len(names)))
+        for name in names:
+            self._utf(stream, name)
+        stream.write(struct.pack(">i", len(self.blocks)))
+        for block in self.blocks:
+            stream.write(struct.pack(">bi", names.index(block.name), (block.x - left) << 16 | (block.y - bottom)))
+            self._config(stream, block)
+            stream.write(struct.pack(">b", block.rotation))
+        return b"msch\x01" + zlib.compress(stream.getvalue())
+
+    def write(self, path: Path | str):
+        """Записывает схему и ее base64 для вставки из буфера обмена рядом, с расширением .base64."""
+        data = self.encode()
+        Path(path).write_bytes(data)
+        Path(path).with_suffix(".base64").write_text(base64.b64encode(data).decode())
+
+
+def keyboard() -> str:
+    """Клавиатура: нажатый переключатель switch{k + 1} записывает 1 в слово клавиши k и отпускается."""
+    p = coregen.CoreProgram()
+    p.emit(f"set index {EmuDisplay.ADDRESS - KEYS}", "set core bank1", "set i 0")
+    p.label("key")
+    p.emit(
+        "getlink switch i",
+        "sensor result switch @enabled",
+        "jump {next} notEqual result true",
+        "op add j index i",
+        "write 1 core j",
+        "control enabled switch 0 0 0 0",
+    )
+    p.label("next")
+    p.emit("op add i i 1", f"jump {{key}} lessThan i {KEYS}")
+    return p.text()
+
+
+def control(threads: str, loaders: list[str], video: str, cores: list[str]) -> str:
+    """
+    Управление процессорами по именам связей: сначала работают только загрузчики, затем, пока включен
+    выключатель switch2, видеоядро, ядра и контроллер ядер. switch1 - кнопка запуска главного ядра.
+    """
+    p = coregen.CoreProgram()
+    p.emit(f"control enabled {threads} 0 0 0 0")
+    p.emit(*(f"control enabled {name} 1 0 0 0" for name in loaders))
+    p.emit(*(f"control enabled {name} 0 0 0 0" for name in (video, *cores)))
+    p.emit("wait 1", "control enabled switch1 1 0 0 0")
+    p.label("loop")
+    p.emit("sensor result switch2 @enabled", f"control enabled {video} result 0 0 0", "wait 0.5")
+    p.emit(*(f"control enabled {name} result 0 0 0" for name in cores[1:]))
+    p.emit("wait 1", f"control enabled {threads} result 0 0 0", f"control enabled {cores[0]} result 0 0 0")
+    p.emit("jump {loop} always x false")
+    return p.text()
+
+
+def build(cores: int | None = None, banks: int = 1, loaders: dict[str, str] | None = None,
+          name: str | None = None, message: str = "", artifact: Artifact | None = None) -> Schematic:
+    """
+    Схема MindVM с cores ядрами и банками bank1..bank{banks}. loaders - программы загрузчиков
+    по именам банков (Artifact.texts), для банков без загрузчика процессор загрузчика пуст.
+    artifact задает загрузчики и количество ядер, на которое рассчитан его стек возвратов, если они не указаны.
+    """
+    if artifact is not None:
+        loaders = loaders or artifact.texts
+        cores = cores or artifact.cores
+    cores = cores or EmuChunk.CORES
+    loaders = loaders or {}
+    banks = max(banks, len(loaders))
+    if not 1 <= banks <= EmuChunk.MAX_BANKS:
+        raise ValueError(f"Memory map supports 1 to {EmuChunk.MAX_BANKS} banks")
+    threads_code = coregen.threads(cores)
+    buildings = ROOT / "buildings"
+    s = Schematic(name or f"MindVM {cores} cores")
+
+    s.add("item-source", 0, 0, SILICON)
+    s.add("item-source", 0, 1, PHASE_FABRIC)
+    s.add("power-source", 0, 2)
+    shaders = s.add("memory-cell", 0, 3)
+    s.add("liquid-source", 0, 4, CRYOFLUID)
+    video_commands = s.add("memory-cell", 0, 6)
+    s.processor("micro-processor", 0, 5, (buildings / "videocore_commands.masm").read_text(), cell1=video_commands)
+    core_commands = s.add("memory-cell", 0, 8)
+    s.processor("micro-processor", 0, 7, (buildings / "core_commands.masm").read_text(), cell1=core_commands)
+    message_block = s.add("message", 0, 9, message)
+    s.add("overdrive-dome", 2, 1)
+
+    threads = s.add("memory-cell", 1, 6)
+    start = s.add("switch", 3, 6, False)
+    power = s.add("switch", 3, 8, False)
+    threads_processor = s.processor("micro-processor", 2, 6, threads_code, cell1=threads, switch1=start)
+
+    memory = {f"bank{n}": s.add("memory-bank", 4 + 2 * (n - 1), 6) for n in range(1, banks + 1)}
+    loader_processors = [s.processor("micro-processor", bank.x, 8, loaders.get(bank_name, ""), **{bank_name: bank})
+                         for bank_name, bank in memory.items()]
+
+    display = s.add("large-logic-display", 6, 2)
+    video = s.processor("hyper-processor", 2, 4, (buildings / "videocore.masm").read_text(),
+                        **memory, display1=display, cell1=shaders, cell2=video_commands)
+
+    keys = {f"switch{k + 1}": s.add("switch", 10 + k % 3, 4 - k // 3, False) for k in range(KEYS)}
+    s.processor("logic-processor", 10, 0, keyboard(), **keys, bank1=memory["bank1"])
+
+    core = (buildings / "core.masm").read_text()
+    core_processors = []
+    for n, thread in enumerate(range(EmuChunk.MAIN_THREAD, EmuChunk.MAIN_THREAD + cores)):
+        row, column = divmod(n, CORES_PER_ROW)
+        y = CORE_ROWS + 3 * row
+        if column % 2 == 0:
+            s.add("liquid-source", COOLANT_COLUMNS[column // 2], y, CRYOFLUID)
+        core_processors.append(s.processor(
+            "hyper-processor", CORE_COLUMNS[column], y, coregen.for_thread(core, thread),
+            cell1=threads, cell2=core_commands, message1=message_block, **memory
+        ))
+
+    processors = [threads_processor, *loader_processors, video, *core_processors]
+    links = {f"processor{n}": block for n, block in enumerate(processors, start=1)}
+    names = {block: name for name, block in links.items()}
+    s.processor("logic-processor", 1, 8, control(
+        names[threads_processor], [names[block] for block in loader_processors],
+        names[video], [names[block] for block in core_processors]
+    ), **links, switch1=start, switch2=power)
+    return s
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:] + [str(EmuChunk.CORES), "1"][len(sys.argv) - 1:]
+    count, bank_count = int(args[0]), int(args[1])
+    build(count, bank_count).write(args[2] if len(args) > 2 else f"mindvm{count}.msch")
@@ -0,0 +1,233 @@
+"""
+Сборщик сопрограмм видеоядра из команд draw высокого уровня.
+
+Для каждой команды выбирается более дешевая запись: полная (номер команды и 6 аргументов) или обертка
+SHADER_WRAP ... SHADER_WRAP_END. Стоимость - инструкции логики видеоядра на чтение команды (videogen.COST_*)
+плюс WORD_COST за каждое слово памяти. Повторные и перезаписанные до использования COLOR/STROKE удаляются,
+одинаковые окончания сопрограмм одного EmuDisplay в одном банке памяти используются совместно.
+Сопрограммы размещаются в коде или в дополнительном банке карты памяти EmuChunk (bank > 1).
+Сопрограмма с cached=True начинается командой SHADER_WATCH с блоком снимка переменных сопрограммы.
+"""
+from mindvm import EmuChunk, EmuDisplay, Label, Type
+import videogen
+
+# Команды по именам методов EmuDisplay и количество используемых видеоядром аргументов
+COMMANDS = {
+    "clear": (EmuDisplay.CLEAR, 3),
+    "color": (EmuDisplay.COLOR, 4),
+    "stroke": (EmuDisplay.STROKE, 1),
+    "line": (EmuDisplay.LINE, 4),
+    "rect": (EmuDisplay.RECT, 4),
+    "line_rect": (EmuDisplay.LINE_RECT, 4),
+    "poly": (EmuDisplay.POLY, 5),
+    "line_poly": (EmuDisplay.LINE_POLY, 5),
+    "triangle": (EmuDisplay.TRIANGLE, 6),
+    "image": (EmuDisplay.IMAGE, 6),
+    "flush": (EmuDisplay.FLUSH, 0),
+    "shader_map": (EmuDisplay.SHADER_MAP, 2),
+    "shader_exec": (EmuDisplay.SHADER_EXEC, 1),
+    "shader_jump": (EmuDisplay.SHADER_JUMP, 1),
+    "shader_end": (EmuDisplay.SHADER_END, 0),
+    "shader_watch": (EmuDisplay.SHADER_WATCH, 0),
+    "shader_force": (EmuDisplay.SHADER_FORCE, 1),
+}
+ARGS = {command: count for command, count in COMMANDS.values()}
+
+# Команды, рисующие текущим цветом и текущей толщиной линий
+USES_COLOR = (EmuDisplay.LINE, EmuDisplay.RECT, EmuDisplay.LINE_RECT, EmuDisplay.POLY, EmuDisplay.LINE_POLY,
+              EmuDisplay.TRIANGLE, EmuDisplay.IMAGE)
+USES_STROKE = (EmuDisplay.LINE, EmuDisplay.LINE_RECT, EmuDisplay.LINE_POLY)
+# Команды, не меняющие и не использующие цвет и толщину
+NEUTRAL = (EmuDisplay.CLEAR, EmuDisplay.SHADER_MAP)
+
+
+class ShaderAssembler:
+    """Сборка сопрограмм одного EmuDisplay, хранит собранные ранее для совместного использования окончаний."""
+
+    WORD_COST = 2  # Цена слова памяти в инструкциях видеоядра
+    JUMP_HANDLER = 2  # Инструкции обработчика SHADER_JUMP
+
+    def __init__(self, display: EmuDisplay, word_cost: float = WORD_COST):
+        self.display = display
+        self.chunk = display.chunk
+        self.word_cost = word_cost
+        self.shaders = []  # Собранные сопрограммы: (банк, список (команда, метка или адрес ее первого слова))
+        self.stats = {"dropped_state": 0, "full": 0, "wrapped": 0, "shared_words": 0, "watched": 0}
+
+    @staticmethod
+    def normalize(calls) -> list[tuple]:
+        """Команды (имя метода EmuDisplay или номер команды, аргументы...) в виде (номер, аргументы...)."""
+        commands = []
+        for name, *args in calls:
+            command, count = COMMANDS[name] if isinstance(name, str) else (name, ARGS.get(name, 6))
+            if command == EmuDisplay.COLOR and len(args) == 3:
+                args.append(255)
+            if len(args) > count:
+                raise ValueError(f"Display command {name} takes at most {count} arguments")
+            commands.append((command, *args, *[0] * (count - len(args))))
+        return commands
+
+    @staticmethod
+    def _key(command: tuple):
+        """Значение состояния, установленного командой, None - зависит от переменных."""
+        if any(EmuChunk.is_var(arg) or isinstance(arg, Label) for arg in command[1:]):
+            return None
+        return command[1:]
+
+    def drop_redundant(self, commands: list[tuple]) -> list[tuple]:
+        """
+        Удаляет COLOR/STROKE, устанавливающие уже установленное значение или перезаписанные до использования.
+        Состояние в начале сопрограммы неизвестно, после FLUSH и других команд сбрасывается.
+        """
+        result = list(commands)
+        state = {EmuDisplay.COLOR: None, EmuDisplay.STROKE: None}
+        pending = {EmuDisplay.COLOR: None, EmuDisplay.STROKE: None}  # Индекс еще не использованной команды
+        for n, command in enumerate(commands):
+            func = command[0]
+            if func in state:
+                key = self._key(command)
+                if key is not None and key == state[func]:
+                    result[n] = None
+                    continue
+                if pending[func] is not None:
+                    result[pending[func]] = None
+                state[func], pending[func] = key, n
+            elif func in USES_COLOR:
+                pending[EmuDisplay.COLOR] = None
+                if func in USES_STROKE:
+                    pending[EmuDisplay.STROKE] = None
+            elif func not in NEUTRAL:
+                state = dict.fromkeys(state)
+                pending = dict.fromkeys(pending)
+        self.stats["dropped_state"] += result.count(None)
+        return [command for command in result if command is not None]
+
+    def _ref(self, value) -> int:
+        """Отрицательная ссылка обертки на константу data: отрицательные числа в обертке - адреса."""
+        chunk = self.chunk
+        n = chunk.constants.get(value)
+        if n is None:
+            n = chunk.constants[value] = len(chunk.data)
+            chunk.data.append([Type.static, value, 0])
+        chunk.data[n][2] += 1
+        return -chunk.handle(n)[0]
+
+    @staticmethod
+    def _is_ref(arg) -> bool:
+        """Аргумент читается оберткой по ссылке: переменная или отрицательная константа."""
+        return EmuChunk.is_var(arg) or not isinstance(arg, Label) and arg < 0
+
+    def choose(self, command: tuple, last: bool = False) -> tuple[bool, int, float]:
+        """
+        Выбор записи команды: (обертка ли, слов, инструкций видеоядра на чтение).
+        Последняя команда сопрограммы в полной записи занимает только используемые слова,
+        остальные аргументы читаются из следующих слов и не используются.
+        """
+        func, *args = command
+        wrap = (True, 2 + len(args) + (len(args) < 6),
+                videogen.COST_WRAP + videogen.COST_WRAP_ARG * len(args)
+                + videogen.COST_WRAP_REF * sum(map(self._is_ref, args)) + videogen.COST_WRAP_END * (len(args) < 6))
+        if any(EmuChunk.is_var(arg) for arg in args):
+            return wrap
+        full = (False, 1 + len(args) if last else 7, videogen.COST_FULL)
+        return min((full, wrap), key=lambda variant: variant[2] + variant[1] * self.word_cost)
+
+    def encode(self, command: tuple, last: bool = False) -> list:
+        """Слова команды в выбранной записи."""
+        wrap, length, _ = self.choose(command, last)
+        func, *args = command
+        if not wrap:
+            return [func, *args, *[0] * (6 - len(args))][:length]
+        words = [EmuDisplay.SHADER_WRAP, func]
+        for arg in args:
+            if EmuChunk.is_var(arg):
+                words.append(-arg[0])
+            elif self._is_ref(arg):
+                words.append(self._ref(arg))
+            else:
+                words.append(arg)
+        if len(args) < 6:
+            words.append(EmuDisplay.SHADER_WRAP_END)
+        return words
+
+    def _shared(self, commands: list[tuple], bank: int) -> tuple[int, list | None]:
+        """
+        Самое длинное окончание commands, совпадающее с окончанием собранной в том же банке сопрограммы:
+        (длина, сопрограмма).
+        """
+        best = (0, None)
+        for shader_bank, shader in self.shaders:
+            if shader_bank != bank:
+                continue
+            length = 0
+            while (length < min(len(shader), len(commands))
+                   and shader[-1 - length][0] == commands[-1 - length]):
+                length += 1
+            if length > best[0]:
+                best = (length, shader)
+        return best
+
+    @staticmethod
+    def watch_block(commands: list[tuple]) -> list:
+        """
+        Блок SHADER_WATCH: количество переменных команд, количество FLUSH, ожидаемый счетчик FLUSH (-1 -
+        сопрограмма еще не выполнялась) и пары (-адрес переменной, значение при прошлом выполнении).
+        """
+        addresses = list(dict.fromkeys(arg[0] for command in commands for arg in command[1:]
+                                       if EmuChunk.is_var(arg)))
+        flushes = sum(command[0] == EmuDisplay.FLUSH for command in commands)
+        block = [len(addresses), flushes, -1]
+        for address in addresses:
+            block.extend((-address, 0))
+        return block
+
+    def assemble(self, *calls, bank: int = 1, cached: bool = False) -> Label | int:
+        """
+        Собирает сопрограмму, завершенную SHADER_END, и возвращает метку ее начала,
+        а в дополнительном банке - адрес в карте памяти. cached - начать ее командой SHADER_WATCH.
+        """
+        commands = self.drop_redundant(self.normalize(calls))
+        commands.append((EmuDisplay.SHADER_END,))
+        if cached:
+            # Блок строится по всем командам до замены общего окончания переходом
+            block = self.watch_block(commands)
+            commands.insert(0, (EmuDisplay.SHADER_WATCH,))
+        length, other = self._shared(commands, bank)
+        tail = other[-length:] if length else []
+        words = sum(self.choose(command, n == length - 1)[1] for n, command in enumerate(tail and commands[-length:]))
+        if length == len(commands):
+            self.stats["shared_words"] += words
+            return tail[0][1]
+        if length:
+            # Переход на общее окончание выгоден, если его чтение и слова дешевле слов окончания
+            _, jump_words, jump_cost = self.choose((EmuDisplay.SHADER_JUMP, tail[0][1]), last=True)
+            if jump_cost + self.JUMP_HANDLER + jump_words * self.word_cost < words * self.word_cost:
+                self.stats["shared_words"] += words
+                commands = commands[:-length] + [(EmuDisplay.SHADER_JUMP, tail[0][1])]
+            else:
+                tail = []
+
+        shader = []
+        for n, command in enumerate(commands):
+            words = self.encode(command, last=n == len(commands) - 1)
+            self.stats["full" if words[0] == command[0] else "wrapped"] += 1
+            # Блок снимка изменяется видеоядром и следует сразу за командой SHADER_WATCH
+            extra = block if command[0] == EmuDisplay.SHADER_WATCH else []
+            self.stats["watched"] += extra[0] if extra else 0
+            # Отрицательные слова обертки и адреса блока - ссылки на data, переводимые вместе с ее адресами
+            refs = [n for n, word in enumerate(words[2:], start=2) if words[0] == EmuDisplay.SHADER_WRAP
+                    and type(word) is int and word < 0 and word != EmuDisplay.SHADER_WRAP_END]
+            refs.extend(range(len(words) + EmuDisplay.WATCH_HEADER, len(words) + len(extra), 2))
+            if bank == 1:
+                label = Label(len(self.chunk.code) + 1)
+                self.chunk.data_refs.update(len(self.chunk.code) + n for n in refs)
+                self.chunk.append(*words)
+                if extra:
+                    self.chunk.reserve(*extra)
+            else:
+                label = self.chunk.far_data(*words, *extra, bank=bank, refs=refs)
+            shader.append((command, label))
+        if tail:
+            shader = shader[:-1] + tail
+        self.shaders.append((bank, shader))
+        return shader[0][1]
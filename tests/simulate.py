@@ -0,0 +1,57 @@
+"""
+Выполнение образа в эмуляторе (emulator.EmuMachine) и в схеме из процессоров логики с ядрами buildings/*.masm
+(logic.LogicBuild) и сравнение результатов.
+"""
+from emulator import EmuMachine, EmuVideo
+from logic import LogicBuild
+from mindvm import Artifact, EmuChunk
+
+LOGIC_TICKS = 20_000  # Предел тиков схемы для программы, которая должна завершиться
+
+
+def halted(build: LogicBuild, artifact: Artifact) -> bool:
+    """Все ядра схемы отключены или стоят на OP_EXIT: ядро core.masm повторяет OP_EXIT, не отключаясь."""
+    counters = build.threads.memory[EmuChunk.MAIN_THREAD:EmuChunk.MAIN_THREAD + artifact.cores]
+    return all(counter == -1 or build.bank.memory[counter] == EmuChunk.OP_EXIT for counter in counters)
+
+
+def emulate(artifact: Artifact, steps: int = 1_000_000) -> EmuMachine:
+    machine = EmuMachine(artifact, record=True, far=artifact.far)
+    machine.run(steps)
+    assert not machine.faults
+    return machine
+
+
+def logic(artifact: Artifact, ticks: int = LOGIC_TICKS) -> LogicBuild:
+    """
+    Схема, выполнившая программу до завершения всех ядер и вывода видеоядром очереди кадров.
+    До запуска главного ядра контроллером (кнопка запуска отпущена) ядра отключены, но программа не выполнена.
+    """
+    build = LogicBuild(artifact, far=artifact.far)
+    while build.reset.enabled or not halted(build, artifact):
+        assert build.ticks < ticks, "program did not halt"
+        build.run(50)
+    build.run(50)
+    return build
+
+
+def frame(commands: list) -> list:
+    """Кадр схемы в записи эмулятора: без неиспользуемых аргументов команд."""
+    arity = dict(EmuVideo.DRAW.values())
+    return [command[:1 + arity.get(command[0], len(command) - 1)] for command in commands]
+
+
+def compare(artifact: Artifact) -> tuple[EmuMachine, LogicBuild]:
+    """Выполняет завершающуюся программу в обоих исполнителях и сравнивает вывод, данные, банки и кадры."""
+    machine, build = emulate(artifact), logic(artifact)
+    assert machine.halted
+    assert build.message.text == machine.message
+    assert build.message.flushes == len(machine.messages)
+    data = slice(3, artifact[1] + 1)
+    assert build.bank.memory[data] == machine.memory[data]
+    for image, emulated, bank in zip(artifact.far, machine.banks[1:], build.banks[1:]):
+        assert bank.memory[:len(image)] == emulated[:len(image)]
+    assert build.display.frames == machine.video.frames
+    if machine.video.history:
+        assert frame(build.display.frame) == machine.video.history[-1]
+    return machine, build
@@ -0,0 +1,145 @@
+"""
+Управляющие конструкции if_, else_, while_, for_range, break_ и continue_ выполняются как такие же конструкции
+Python, в эмуляторе и в схеме логики.
+"""
+from pathlib import Path
+
+import pytest
+
+from mindvm import EmuChunk
+from tests.simulate import compare
+
+# Условия с переходом одной инструкцией по условию, по его отрицанию и вычисляемые
+CONDITIONS = [
+    lambda x: x == 5,
+    lambda x: x != 5,
+    lambda x: x > 5,
+    lambda x: x <= 5,
+    lambda x: x,
+    lambda x: x * 2 > 9,
+    lambda x: (x < 3) + (x > 7),
+]
+
+
+def run(chunk: EmuChunk, *refs) -> list:
+    """Значения переменных после выполнения программы."""
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    return [machine.memory[ref[0]] for ref in refs]
+
+
+@pytest.mark.parametrize("index", range(len(CONDITIONS)))
+@pytest.mark.parametrize("value", [0, 5, 8])
+def test_if_else(index, value):
+    chunk = EmuChunk()
+    x, then, otherwise = chunk.var(value), chunk.var(), chunk.var()
+    with chunk.if_(CONDITIONS[index](chunk.expr(x))):
+        chunk[then] = 1
+    with chunk.else_():
+        chunk[otherwise] = 1
+    taken = bool(CONDITIONS[index](value))
+    assert run(chunk, then, otherwise) == [int(taken), int(not taken)]
+
+
+def test_else_without_if():
+    chunk = EmuChunk()
+    with pytest.raises(ValueError):
+        with chunk.else_():
+            pass
+    x = chunk.var()
+    with chunk.if_(chunk.expr(x) == 1):
+        chunk.add_const(x, 1)
+    chunk.add_const(x, 2)
+    with pytest.raises(ValueError):
+        with chunk.else_():
+            pass
+
+
+def test_while():
+    chunk = EmuChunk()
+    n, steps, never = chunk.var(27), chunk.var(), chunk.var()
+    N = chunk.expr(n)
+    # Последовательность Коллатца до 1
+    with chunk.while_(N != 1):
+        with chunk.if_(N % 2 == 0):
+            chunk[n] = N / 2
+        with chunk.else_():
+            chunk[n] = N * 3 + 1
+        chunk.add_const(steps, 1)
+    with chunk.while_(N > 1):
+        chunk.add_const(never, 1)
+    assert run(chunk, n, steps, never) == [1, 111, 0]
+
+
+def test_while_forever():
+    chunk = EmuChunk()
+    x = chunk.var()
+    with chunk.while_(1):
+        chunk.add_const(x, 3)
+        chunk.break_(chunk.expr(x) > 10)
+    assert run(chunk, x) == [12]
+
+
+@pytest.mark.parametrize("bounds", [(5,), (2, 7), (7, 2), (10, 0, -3), (0, 10, 4), (3, 3), (-4, 4, 2)])
+def test_for_range(bounds):
+    chunk = EmuChunk()
+    total, count = chunk.var(), chunk.var()
+    with chunk.for_range(*bounds) as index:
+        chunk[total] = chunk.expr(total) * 2 + chunk.expr(index)
+        chunk.add_const(count, 1)
+    expected = 0
+    for index in range(*bounds):
+        expected = expected * 2 + index
+    assert run(chunk, total, count) == [expected, len(range(*bounds))]
+
+
+@pytest.mark.parametrize("start, stop, step", [(1, 9, 1), (9, 1, -2), (4, 4, 1), (4, 2, 1)])
+def test_for_range_variables(start, stop, step):
+    """Границы-переменные проверяются перед каждым повторением, в том числе первым."""
+    chunk = EmuChunk()
+    low, high, total = chunk.var(start), chunk.var(stop), chunk.var()
+    with chunk.for_range(low, high, step) as index:
+        chunk[total] = chunk.expr(total) * 3 + chunk.expr(index)
+    expected = 0
+    for index in range(start, stop, step):
+        expected = expected * 3 + index
+    assert run(chunk, total) == [expected]
+
+
+def test_break_continue():
+    """continue_ и break_ относятся к внутреннему циклу."""
+    chunk = EmuChunk()
+    odd, pairs = chunk.var(), chunk.var()
+    with chunk.for_range(20) as index:
+        chunk.continue_(chunk.expr(index) % 2 == 0)
+        chunk.break_(chunk.expr(index) > 13)
+        chunk[odd] = chunk.expr(odd) + chunk.expr(index)
+    with chunk.for_range(4) as i:
+        with chunk.for_range(10) as j:
+            chunk.break_(chunk.expr(j) > chunk.expr(i))
+            chunk.add_const(pairs, 1)
+    assert run(chunk, odd, pairs) == [1 + 3 + 5 + 7 + 9 + 11 + 13, 1 + 2 + 3 + 4]
+
+
+def test_errors():
+    chunk = EmuChunk()
+    with pytest.raises(ValueError):
+        chunk.break_()
+    with pytest.raises(ValueError):
+        chunk.continue_()
+    with pytest.raises(ValueError):
+        with chunk.for_range(0, 10, 0):
+            pass
+
+
+def test_call_sites():
+    """Переходы конструкций отмечены строками программы, а не mindvm.py и contextlib."""
+    chunk = EmuChunk()
+    x = chunk.var()
+    with chunk.for_range(3):
+        with chunk.if_(chunk.expr(x) > 1):
+            chunk.add_const(x, 1)
+        with chunk.else_():
+            chunk.add_const(x, 2)
+    chunk.compile()
+    assert {site.split(":")[0] for site in chunk.sites.values()} == {Path(__file__).name}
@@ -0,0 +1,112 @@
+"""
+Генератор ядра coregen.py: файлы buildings совпадают с генерацией, ядро выполняет каждый код операции
+так же, как эмулятор, и расходует на него инструкции логики по таблице COSTS.
+"""
+import pytest
+
+import coregen
+from benchmarks.programs import PROGRAMS
+from logic import LogicBuild
+from mindvm import EmuChunk, EmuDisplay
+from tests.simulate import compare
+
+# Коды операций, время которых зависит от ожидания других ядер, и повторяемый ядром OP_EXIT
+WAITING = {"OP_GOTO_THREAD", "OP_WAIT_EQ", "OP_EXIT"}
+
+
+def test_buildings():
+    core, commands = coregen.generate()
+    assert (coregen.BUILDINGS / "core.masm").read_text() == core + "\n"
+    assert (coregen.BUILDINGS / "core_commands.masm").read_text() == commands + "\n"
+    assert (coregen.BUILDINGS / "threads.masm").read_text() == coregen.threads() + "\n"
+
+
+def test_threads_cores():
+    assert coregen.threads(3).splitlines()[:4] == [
+        "write -1 cell1 2", "write -1 cell1 3", "write -1 cell1 4", "sensor switch switch1 @enabled"]
+    with pytest.raises(ValueError):
+        coregen.threads(coregen.CELL_SIZE)
+
+
+def opcodes() -> EmuChunk:
+    """Программа, выполняющая каждый код операции EmuChunk."""
+    c = EmuChunk(banks=2, cores=2, perform_peephole_optimization=False)
+    display = EmuDisplay(c)
+    a, b, r, done, key = c.var(5), c.var(), c.var(), c.var(), c.var(4)
+    w, x, y, z = c.var(), c.var(), c.var(), c.var()
+    items, copy = c.array(4, [1, 2, 3, 4]), c.array(4)
+    far = c.far_data(7, 8, 9)
+    bad = c.label(reassign=True)
+    worker = c.label(reassign=True)
+    double = c.function(lambda: c.mul_const(a, 2))
+    skip = c.label(reassign=True)
+    c.jump(skip, c.NON_ZERO)
+    queue = display.alloc_queue()
+    c.label(skip)
+
+    c.set(b, 3)
+    c.set_4(w, 1, 2, 3, 4)
+    c.copy(r, a)
+    c.math(c.store_int(c.OPERATION_SUB), a, b, r)
+    c.add_const(r, 10)
+    c.sub_const(r, 4)
+    c.mul_const(r, 3)
+    c.call(double)
+    c.const_rand(10, x)
+    c.jump_gt_const(bad, x, 10)
+    c.set(x, 0)
+    c.jump_neq_const(bad, r, 24)
+    c.jump_neq_set(bad, a, 10, 11)
+    c.add_jump_gt(b, 1, bad, 5)
+    c.add_jump_gt(b, 1, bad, 5)
+    c.control_thread(key, -1)
+    c.goto_thread(3, worker)
+    c.wait_eq(done, 1)
+    c.load_far(y, far + 1)
+    c.store_far(far + 2, a)
+    c.load_indirect(z, items, c.store_int(2))
+    c.store_indirect(items, c.store_int(0), z)
+    c.memcpy(copy, items)
+    c.memcpy(items.base + 1, items.base, 3)
+    c.memset(copy.base + 2, b, 2)
+    c.jump(bad, x)
+    display.start_queue(queue)
+    display.rect(a, b, 3, 4)
+    display.flush()
+    c.emit(c.OP_CHAR, *(c.resolve_arg(ref) for ref in (c.store_char("O"), c.store_char("K"), c.store_int(-1))))
+    c.echo(a)
+    c.print(" DONE")
+    c.flush()
+    c.exit()
+    c.label(bad)
+    c.fprint("BAD")
+    c.exit()
+    c.label(worker, inc_thread=True)
+    c.set(done, 1)
+    c.exit()
+    return c
+
+
+def test_opcodes():
+    chunk = opcodes()
+    artifact = chunk.compile()
+    used = {item.opcode for item in chunk.decode()}
+    assert used >= set(coregen.opcodes().values())
+    machine, _ = compare(artifact)
+    assert machine.message == "OK11 DONE"
+    assert machine.video.history == [[("rect", 11, 5, 3, 4)]]
+
+
+@pytest.mark.parametrize("name", ["text", "arithmetic", "threads", "shaders"])
+def test_costs(name):
+    """Измеренные схемой инструкции на выполнение кода операции лежат в пределах cost()."""
+    artifact = PROGRAMS[name]().compile()
+    build = LogicBuild(artifact, far=artifact.far)
+    build.run(3000)
+    for opcode, report in build.report()["opcodes"].items():
+        if opcode not in coregen.COSTS or opcode in WAITING:
+            continue
+        low = high = coregen.COSTS[opcode]
+        if isinstance(low, tuple):
+            low, high = low
+        assert coregen.DISPATCH + low - 1e-9 <= report["instructions"] <= coregen.DISPATCH + high + 1e-9, opcode
@@ -0,0 +1,50 @@
+"""
+Эмулятор выполняет программы так же, как схема из процессоров логики с ядрами buildings/*.masm.
+"""
+import pytest
+
+from benchmarks.programs import PROGRAMS
+from emulator import EmuMachine
+from mindvm import EmuChunk, EmuDisplay
+from tests.simulate import compare, emulate
+
+PROGRAM_NAMES = [name for name in PROGRAMS if not name.startswith("generated")]
+
+
+@pytest.mark.parametrize("name", PROGRAM_NAMES)
+def test_program(name):
+    compare(PROGRAMS[name]().compile())
+
+
+def test_deterministic():
+    """Ядра выполняются по очереди, результат с одинаковым seed не зависит от запуска."""
+    artifact = PROGRAMS["threads"]().compile()
+    first, second = emulate(artifact), emulate(artifact)
+    assert first.memory == second.memory
+    assert first.executed == second.executed
+
+
+def test_unknown_opcode():
+    """Неизвестный код операции останавливает ядро и записывается в faults."""
+    chunk = EmuChunk()
+    chunk.emit(99)
+    machine = EmuMachine(chunk.compile())
+    machine.run(100)
+    assert machine.halted
+    assert machine.faults == [(EmuChunk.MAIN_THREAD, chunk.compile()[1] + 1, 99)]
+
+
+def test_keyboard():
+    """Нажатая клавиша видна программе по адресу EmuMachine.KEYBOARD + номер."""
+    chunk = EmuChunk()
+    key = EmuMachine.KEYBOARD + 3
+    chunk.wait_eq(key, 1)
+    chunk.fprint("KEY")
+    chunk.exit()
+    machine = EmuMachine(chunk.compile())
+    machine.run(1000)
+    assert not machine.halted
+    machine.press(3)
+    machine.run(1000)
+    assert machine.halted and machine.message == "KEY"
+    assert EmuDisplay.ADDRESS - 9 == EmuMachine.KEYBOARD
@@ -0,0 +1,101 @@
+"""
+Выражения expression.py: assign_all и jump_if вычисляют то же, что Python для тех же операторов,
+в эмуляторе и в схеме логики, а места вызова собранных инструкций указывают на программу.
+"""
+from pathlib import Path
+
+import pytest
+
+from mindvm import EmuChunk
+from tests.simulate import compare
+
+VALUES = (7, 3, 12)  # Положительные: остаток от деления % совпадает с fmod ядра
+
+# Выражения над тремя переменными, одинаково вычисляемые над числами и над c.expr()
+EXPRESSIONS = [
+    lambda a, b, c: (a + 4) * 2 - b,
+    lambda a, b, c: (a + 1) + 2 - (b * 2) * 3,
+    lambda a, b, c: a * b + a * b - c,
+    lambda a, b, c: (a > b) + (a < c) * 10 + (b == 3) * 100 + (c != a) * 1000,
+    lambda a, b, c: (a >= b) + (b <= c) * 2 + (a >= c) * 4,
+    lambda a, b, c: a / 4 + c % b,
+    lambda a, b, c: -a + 0 * b + c * 1,
+    lambda a, b, c: 5 - (a - c) * (a - c),
+    lambda a, b, c: (2 + 3) * b,
+]
+
+# Условия перехода: сравнения с константой, переменная и вычисляемые условия
+CONDITIONS = [
+    lambda a, b, c: a == 7,
+    lambda a, b, c: a != 7,
+    lambda a, b, c: b > 2,
+    lambda a, b, c: b <= 2,
+    lambda a, b, c: 5 < c,
+    lambda a, b, c: a,
+    lambda a, b, c: a - 7,
+    lambda a, b, c: a + b > c,
+    lambda a, b, c: a * 2 >= c + 2,
+    lambda a, b, c: (a < b) == 0,
+    lambda a, b, c: (b == 3) * (c == 11),
+]
+
+
+def program() -> tuple[EmuChunk, list]:
+    chunk = EmuChunk()
+    return chunk, [chunk.var(value) for value in VALUES]
+
+
+def test_assign():
+    chunk, refs = program()
+    operands = [chunk.expr(ref) for ref in refs]
+    results = [chunk.var() for _ in EXPRESSIONS]
+    for result, function in zip(results, EXPRESSIONS):
+        chunk.assign(result, function(*operands))
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert [machine.memory[result[0]] for result in results] == [function(*VALUES) for function in EXPRESSIONS]
+
+
+def test_assign_all_order():
+    """Присваивания выполняются по порядку: следующие читают новые значения, общие подвыражения не устаревают."""
+    chunk, (a, b, c) = program()
+    A, B, C = chunk.expr(a), chunk.expr(b), chunk.expr(c)
+    x, y = chunk.var(), chunk.var()
+    chunk.assign_all([
+        (x, A * B + C),
+        (y, A * B - C),
+        (a, A * B),
+        (b, A * B + 1),
+        (x, chunk.expr(x) + 5),
+        (c, C - A * B),
+    ])
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert chunk.optimizations["expression_reused"] > 0
+    assert [machine.memory[ref[0]] for ref in (x, y, a, b, c)] == [38, 9, 21, 64, 12 - 21 * 64]
+
+
+@pytest.mark.parametrize("index", range(len(CONDITIONS)))
+def test_jump_if(index):
+    chunk, refs = program()
+    taken = chunk.var(1)
+    skip = chunk.label(reassign=True)
+    chunk.jump_if(skip, CONDITIONS[index](*(chunk.expr(ref) for ref in refs)))
+    chunk[taken] = 0
+    chunk.label(skip)
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert machine.memory[taken[0]] == int(bool(CONDITIONS[index](*VALUES)))
+
+
+def test_call_sites():
+    """Инструкции выражений отмечены строками программы, а не expression.py."""
+    chunk, refs = program()
+    operands = [chunk.expr(ref) for ref in refs]
+    chunk.assign(refs[0], EXPRESSIONS[2](*operands))
+    chunk.jump_if(chunk.label(), CONDITIONS[7](*operands))
+    chunk.exit()
+    chunk.compile()
+    sites = set(chunk.sites.values())
+    assert {site.split(":")[0] for site in sites} == {Path(__file__).name}
+    assert len(sites) == 3
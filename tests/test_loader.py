@@ -0,0 +1,129 @@
+"""
+Загрузчики loader.py, выполненные процессором логики (logic.LogicProcessor), записывают в банк в точности образ.
+"""
+import pytest
+
+import loader
+from benchmarks.programs import PROGRAMS
+from logic import LogicBuild, LogicMemory, LogicProcessor
+import mindvm
+from mindvm import EmuChunk
+
+PROGRAM_NAMES = [name for name in PROGRAMS if not name.startswith("generated")]
+TICKS = 1000  # Загрузка и ожидание wait 1 в начале загрузчика укладываются с запасом
+
+
+def image(name: str, **flags) -> list:
+    chunk = PROGRAMS[name]()
+    for flag, value in flags.items():
+        setattr(chunk, flag, value)
+    return chunk.link()
+
+
+def deploy(code: str, bank: LogicMemory) -> LogicProcessor:
+    processor = LogicProcessor(code, {"bank1": bank})
+    for _ in range(TICKS):
+        processor.tick()
+    return processor
+
+
+@pytest.mark.parametrize("name", PROGRAM_NAMES)
+@pytest.mark.parametrize("mode", loader.LOADERS)
+def test_loader(name, mode):
+    words = image(name)
+    bank = LogicMemory(LogicMemory.BANK)
+    deploy(loader.LOADERS[mode](words), bank)
+    assert bank.memory[:len(words)] == words
+
+
+def test_packed_signed_and_repeated():
+    """Отрицательные слова, повторы и слова, которые нельзя упаковать."""
+    words = [0] * 80 + [-1, -300, 7, 7, 7, 2 ** 60, 0.5, -2 ** 40] + list(range(-20, 20))
+    bank = LogicMemory(LogicMemory.BANK)
+    deploy(loader.packed(words), bank)
+    assert bank.memory[:len(words)] == words
+
+
+@pytest.mark.parametrize("old_name, new_name", [
+    ("shaders", "shaders"),
+    ("arithmetic", "expressions"),
+    ("threads", "shaders"),
+    ("shaders", "text"),
+])
+def test_patch(old_name, new_name):
+    """Обновление развернутого образа old до new, в том числе того же образа после оптимизаций."""
+    old = image(old_name, perform_peephole_optimization=False, perform_dead_code_elimination=False)
+    new = image(new_name)
+    bank = LogicMemory(LogicMemory.BANK)
+    bank.memory[:len(old)] = old
+    deploy(loader.patch(old, new), bank)
+    assert bank.memory[:len(new)] == new
+
+
+def workers(extra: int = 0) -> tuple[mindvm.Artifact, list]:
+    """Главное ядро в цикле запускает goto_thread ядро, увеличивающее счетчик. extra - сдвиг data."""
+    chunk = EmuChunk(cores=2)
+    for n in range(extra):
+        chunk.var(n)
+    counter = chunk.var()
+    work = chunk.label(reassign=True)
+    loop = chunk.label()
+    chunk.goto_thread(3, work)
+    with chunk.for_range(20):
+        pass
+    chunk.jump(loop, chunk.NON_ZERO)
+    chunk.label(work, inc_thread=True)
+    chunk.add_const(counter, 1)
+    chunk.exit()
+    return chunk.compile(), counter
+
+
+@pytest.mark.parametrize("held", [False, True])
+def test_patch_running(held):
+    """
+    Обновление выполняющейся программы с остановкой ядер: счетчики переводятся в новый образ, ядра продолжают работу.
+    held - ячейку потоков держит рукопожатие goto_thread, загрузчик ждет ее освобождения и не трогает ядра.
+    """
+    (old, _), (new, counter) = workers(), workers(3)
+    build = LogicBuild(old)
+    build.run(200)
+    threads = range(EmuChunk.MAIN_THREAD, EmuChunk.MAIN_THREAD + old.cores)
+    build.add(LogicProcessor(new.patch(old)["bank1"], {"bank1": build.bank, "cell1": build.threads}))
+    if held:
+        build.threads.memory[0] = 3
+        build.run(100)
+        assert all(build.threads.memory[thread] != -1 for thread in threads)
+        build.threads.memory[0] = -1
+    build.run(400)
+    assert all(0 <= build.threads.memory[thread] < len(new) for thread in threads)
+    value = build.bank.memory[counter[0]]
+    build.run(200)
+    assert build.bank.memory[counter[0]] > value
+
+
+def painter(extra: int = 0) -> mindvm.Artifact:
+    """Сопрограмма после extra инструкций, выполняемая в бесконечном цикле."""
+    chunk = EmuChunk()
+    display = mindvm.EmuDisplay(chunk)
+    x = chunk.var()
+    for _ in range(extra):
+        chunk.add_const(x, 1)
+    skip = chunk.label(reassign=True)
+    chunk.jump(skip, chunk.NON_ZERO)
+    shader = display.shader(("clear", 0, 0, 0), ("rect", x, 0, 5, 5), ("flush",))
+    chunk.label(skip)
+    display.shader_map(0, shader)
+    loop = chunk.label()
+    display.shader_exec(0)
+    chunk.jump(loop, chunk.NON_ZERO)
+    return chunk.compile()
+
+
+def test_patch_moved_shaders():
+    """Видеоядро не обновляется загрузчиком, поэтому при перемещении сопрограмм нужны полные загрузчики."""
+    old, moved = painter(), painter(1)
+    assert old.shaders and moved.shaders != old.shaders
+    assert moved.patch(old) == moved.texts
+    same = painter()
+    assert same.shaders == old.shaders
+    assert same.patch(old)["bank1"] == loader.patch(old.words, same.words, range(2, 2 + old.cores))
@@ -0,0 +1,100 @@
+"""
+Интерпретатор логики Mindustry: инструкции, бюджет инструкций за тик, wait и профилирование ядер.
+"""
+import pytest
+
+from benchmarks.programs import PROGRAMS
+from logic import LogicBuild, LogicDisplay, LogicMemory, LogicMessage, LogicProcessor, LogicWorld
+from mindvm import EmuChunk
+
+
+def execute(code: str, count: int = 1000, **links) -> LogicProcessor:
+    processor = LogicProcessor(code, links)
+    processor.run(count)
+    return processor
+
+
+@pytest.mark.parametrize("operation, a, b, result", [
+    ("add", 2, 3, 5),
+    ("sub", 2, 3, -1),
+    ("div", 7, 2, 3.5),
+    ("div", 1, 0, 0),
+    ("idiv", -7, 2, -4),
+    ("mod", -7, 3, -1),
+    ("shl", 3, 4, 48),
+    ("xor", 6, 3, 5),
+    ("equal", 0.1 + 0.2, 0.3, 1),
+    ("strictEqual", 0.1 + 0.2, 0.3, 0),
+    ("max", 2, 9, 9),
+])
+def test_op(operation, a, b, result):
+    processor = execute(f"op {operation} r {a} {b}\nend", 1)
+    assert processor["r"] == result
+
+
+def test_counter_write():
+    """Запись в @counter - переход, адрес за концом программы - переход на начало."""
+    processor = execute("set @counter 3\nset x 1\nset x 2\nop add y y 1\nset @counter 100", 6)
+    assert processor["x"] is None
+    assert processor["y"] == 2
+
+
+def test_memory_and_message():
+    bank, message = LogicMemory(LogicMemory.BANK), LogicMessage()
+    execute("write 42 bank1 7\nread x bank1 7\nread y bank1 600\nprint x\nprint \" \"\nprint y\n"
+            "printflush message1\nend", 8, bank1=bank, message1=message)
+    assert bank.memory[7] == 42
+    assert message.text == "42 0" and message.flushes == 1
+
+
+def test_draw():
+    display = LogicDisplay()
+    execute("draw color 1 2 3 255 0 0\ndraw rect 4 5 6 7 0 0\ndrawflush display1\nend", 4, display1=display)
+    assert display.frames == 1
+    assert display.frame == [("color", 1, 2, 3, 255, 0, 0), ("rect", 4, 5, 6, 7, 0, 0)]
+
+
+def test_budget():
+    """Процессор выполняет ipt инструкций за тик и накапливает не больше двух тиков бюджета."""
+    world = LogicWorld()
+    processor = world.add(LogicProcessor("op add x x 1", ipt=LogicProcessor.LOGIC))
+    world.run(10)
+    assert processor["x"] == 10 * LogicProcessor.LOGIC
+
+
+def test_wait():
+    """wait уступает остаток тика и продолжает выполнение после заданного времени игры."""
+    world = LogicWorld()
+    processor = world.add(LogicProcessor("op add x x 1\nwait 0.5\nend"))
+    world.run(29)
+    assert processor["x"] == 1
+    world.run(3)
+    assert processor["x"] == 2
+
+
+def test_unsupported():
+    with pytest.raises(ValueError):
+        LogicProcessor("ucontrol move 1 2")
+
+
+def test_report():
+    """Профилирование относит инструкции ядер к кодам операций VM."""
+    build = LogicBuild(PROGRAMS["arithmetic"]().compile())
+    build.run(3000)
+    report = build.report()
+    assert build.message.text.startswith("TOTAL ")
+    assert {"OP_MATH", "OP_ADD_CONST", "OP_JUMP_NEQ_CONST"} <= set(report["opcodes"])
+    assert report["opcodes"]["OP_MATH"]["count"] == 4 * 20 * 20
+    assert report["ticks"] == 3000
+
+
+def test_single_core_start():
+    """Единственное ядро запускается сразу после настройки и выполняет коды операций с последними записями таблицы."""
+    chunk = EmuChunk(cores=1)
+    items = chunk.array(4)
+    chunk.memset(items, 7)
+    chunk.exit()
+    artifact = chunk.compile()
+    build = LogicBuild(artifact)
+    build.run(50)
+    assert build.bank.memory[items.base:items.base + 4] == [7] * 4
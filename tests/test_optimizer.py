@@ -0,0 +1,190 @@
+"""
+Проходы оптимизатора (optimizer.Peephole, DeadCode, SlotAllocator) не меняют наблюдаемого поведения программ:
+вывод в блок сообщения и память вне образа совпадают с выполнением без оптимизаций.
+"""
+import contextlib
+import io
+import runpy
+from pathlib import Path
+
+import pytest
+
+import mindvm
+from benchmarks.programs import PROGRAMS
+from emulator import EmuMachine
+from tests.simulate import compare
+
+CARIO = Path(__file__).parent.parent / "examples" / "cario.py"
+CARIO_STEPS = 50_000  # cario не завершается, выполняется заданное количество инструкций
+
+# Синтетические generated не помещаются в bank1 и измеряют только сборку
+PROGRAM_NAMES = [name for name in PROGRAMS if not name.startswith("generated")]
+
+NO_PASSES = {"perform_peephole_optimization": False, "perform_dead_code_elimination": False,
+             "perform_slot_allocation": False}
+PASSES = {
+    "peephole": {"perform_peephole_optimization": True},
+    "dead_code": {"perform_dead_code_elimination": True},
+    "slot_allocation": {"perform_slot_allocation": True},
+}
+
+
+def build_program(name: str, flags: dict) -> mindvm.Artifact:
+    chunk = PROGRAMS[name]()
+    for flag, value in {**NO_PASSES, **flags}.items():
+        setattr(chunk, flag, value)
+    return chunk.compile()
+
+
+def build_cario(flags: dict) -> mindvm.Artifact:
+    """Собирает examples/cario.py с флагами оптимизаций: пример создает EmuChunk через mindvm."""
+    artifacts = []
+
+    class Chunk(mindvm.EmuChunk):
+        def __init__(self, **kwargs):
+            super().__init__(**{**kwargs, **NO_PASSES, **flags, "verbose": False})
+
+        def compile(self, *args, **kwargs):
+            artifacts.append(super().compile(*args, **kwargs))
+            return artifacts[-1]
+
+    original = mindvm.EmuChunk
+    mindvm.EmuChunk = Chunk
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            runpy.run_path(str(CARIO))
+    finally:
+        mindvm.EmuChunk = original
+    return artifacts[-1]
+
+
+def execute(artifact: mindvm.Artifact, steps: int = 1_000_000) -> EmuMachine:
+    machine = EmuMachine(artifact, record=True, far=artifact.far)
+    machine.run(steps)
+    assert not machine.faults
+    return machine
+
+
+@pytest.mark.parametrize("name", PROGRAM_NAMES)
+@pytest.mark.parametrize("optimization", PASSES)
+def test_program(name, optimization):
+    reference = build_program(name, {})
+    artifact = build_program(name, PASSES[optimization])
+    expected, machine = execute(reference), execute(artifact)
+    assert machine.halted and expected.halted
+    assert machine.messages == expected.messages
+    assert machine.video.history == expected.video.history
+    # Образ может измениться, память за обоими образами - почтовый ящик дисплея и клавиатура - нет
+    rest = slice(max(len(reference), len(artifact)), None)
+    assert machine.memory[rest] == expected.memory[rest]
+
+
+@pytest.mark.parametrize("name", PROGRAM_NAMES)
+def test_program_data(name):
+    """Оптимизация по шаблонам меняет только код: сегмент данных после выполнения совпадает."""
+    expected = build_program(name, {})
+    artifact = build_program(name, PASSES["peephole"])
+    data = slice(3, artifact[1] + 1)
+    assert execute(artifact).memory[data] == execute(expected).memory[data]
+
+
+@pytest.mark.parametrize("optimization", PASSES)
+def test_cario(optimization):
+    """Оптимизации меняют скорость ядер, поэтому кадры сравниваются по последовательности команд."""
+    expected = execute(build_cario({}), CARIO_STEPS)
+    machine = execute(build_cario(PASSES[optimization]), CARIO_STEPS)
+    assert machine.messages == expected.messages
+    assert machine.video.frames == expected.video.frames > 0
+    assert ([[command[0] for command in frame] for frame in machine.video.history] ==
+            [[command[0] for command in frame] for frame in expected.video.history])
+
+
+def render_negative(flags: dict) -> EmuMachine:
+    """Сопрограммы с отрицательными числами в полной записи и ссылками оберток после неиспользуемой константы."""
+    chunk = mindvm.EmuChunk(**{**NO_PASSES, **flags})
+    display = mindvm.EmuDisplay(chunk)
+    chunk.store_int(12345)
+    x = chunk.var(3)
+    skip = chunk.label(reassign=True)
+    chunk.jump(skip, chunk.NON_ZERO)
+    first = display.alloc_shader(mindvm.EmuDisplay.RECT, -5, -4, 10, 10, 0, 0,
+                                 mindvm.EmuDisplay.SHADER_WRAP, mindvm.EmuDisplay.RECT, x, 2, 1, 1,
+                                 mindvm.EmuDisplay.SHADER_WRAP_END, mindvm.EmuDisplay.SHADER_END)
+    second = display.shader(("rect", -6, -3, 8, 8), ("rect", x, -9, 2, 2), ("flush",), cached=True)
+    chunk.label(skip)
+    display.shader_map(0, first)
+    display.shader_map(1, second)
+    display.shader_exec(0)
+    display.shader_exec(1)
+    chunk.exit()
+    return execute(chunk.compile())
+
+
+@pytest.mark.parametrize("optimization", PASSES)
+def test_negative_shader_words(optimization):
+    expected = render_negative({})
+    assert expected.video.history[0][:3] == [("rect", -5, -4, 10, 10), ("rect", 3, 2, 1, 1), ("rect", -6, -3, 8, 8)]
+    assert render_negative(PASSES[optimization]).video.history == expected.video.history
+
+
+def render_call(flags: dict) -> EmuMachine:
+    """Команды дисплея до, внутри и после вызова функции с теми же аргументами."""
+    chunk = mindvm.EmuChunk(**{**NO_PASSES, **flags})
+    display = mindvm.EmuDisplay(chunk)
+    wide = chunk.function(lambda: display.stroke(7))
+    display.stroke(5)
+    chunk.call(wide)
+    display.stroke(5)
+    display.flush()
+    chunk.exit()
+    return execute(chunk.compile())
+
+
+@pytest.mark.parametrize("optimization", PASSES)
+def test_call_display_state(optimization):
+    expected = render_call({})
+    assert expected.video.history == [[("stroke", 5), ("stroke", 7), ("stroke", 5)]]
+    assert render_call(PASSES[optimization]).video.history == expected.video.history
+
+
+def patterns(flags: dict) -> mindvm.EmuChunk:
+    """Программа с каждым шаблоном Peephole: SET подряд, свертка MATH, цепочки переходов и аргументы дисплея."""
+    chunk = mindvm.EmuChunk(**{**NO_PASSES, **flags})
+    display = mindvm.EmuDisplay(chunk)
+    a, b, c, d, total = chunk.var(), chunk.var(), chunk.var(), chunk.var(), chunk.var()
+    for ref, value in zip((a, b, c, d), (4, 3, 2, 1)):
+        chunk.set(ref, value)
+    chunk.math(chunk.store_int(chunk.OPERATION_MUL), chunk.store_int(6), chunk.store_int(7), total)
+    end, hop = chunk.label(reassign=True), chunk.label(reassign=True)
+    chunk.jump(hop, chunk.NON_ZERO)
+    chunk.add_const(total, 1000)
+    chunk.label(hop)
+    chunk.jump(end, chunk.NON_ZERO)
+    chunk.label(end)
+    following = chunk.label(reassign=True)
+    chunk.jump(following, chunk.NON_ZERO)
+    chunk.label(following)
+    display.color(10, 20, 30)
+    display.rect(a, 1, 2, 3)
+    display.rect(b, 1, 2, 3)
+    display.flush()
+    count = chunk.var(5)
+    loop = chunk.label()
+    chunk.add_const(total, 1)
+    chunk.sub_const(count, 1)
+    chunk.jump_gt_const(loop, count, 0)
+    chunk.fprint(a, " ", b, " ", c, " ", d, " ", total)
+    chunk.exit()
+    return chunk
+
+
+def test_peephole_patterns():
+    """Каждый шаблон срабатывает, результат в эмуляторе и в схеме логики совпадает с выполнением без оптимизаций."""
+    expected, _ = compare(patterns({}).compile())
+    chunk = patterns(PASSES["peephole"])
+    machine, _ = compare(chunk.compile())
+    for name in ("set_4", "fold_math", "jump_threading", "jump_to_next", "mailbox_writes", "add_jump_gt"):
+        assert chunk.optimizations.get(name), name
+    assert machine.message == expected.message == "4 3 2 1 47"
+    assert machine.video.history == expected.video.history == [
+        [("color", 10, 20, 30, 255), ("rect", 4, 1, 2, 3), ("rect", 3, 1, 2, 3)]]
@@ -0,0 +1,85 @@
+"""
+parallel_for и барьеры: каждый индекс обрабатывается один раз, главное ядро продолжает работу после того,
+как все ядра закончили свои части, в эмуляторе и в схеме логики.
+"""
+import pytest
+
+from mindvm import EmuChunk
+from tests.simulate import compare
+
+
+@pytest.mark.parametrize("cores", [1, 4, 5])
+@pytest.mark.parametrize("count", [1, 3, 10, 37])
+def test_parallel_for(cores, count):
+    chunk = EmuChunk(cores=cores)
+    items = chunk.array(count)
+    sums = {thread: chunk.var() for thread in range(chunk.MAIN_THREAD, chunk.MAIN_THREAD + cores)}
+    seen = chunk.var()
+
+    def body(index, thread):
+        chunk.store_indirect(items, index, index)
+        chunk.math(chunk.store_int(chunk.OPERATION_ADD), sums[thread], index, sums[thread])
+
+    chunk.parallel_for(count, body)
+    # После барьера видны записи всех ядер
+    for thread in sums:
+        chunk.math(chunk.store_int(chunk.OPERATION_ADD), seen, sums[thread], seen)
+    chunk.fprint(seen)
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert machine.message == str(sum(range(count)))
+    assert machine.memory[items.base:items.base + count] == list(range(count))
+
+
+def test_threads():
+    """Часть диапазона главного ядра добавляется к заданным ядрам, остальные ядра не запускаются."""
+    chunk = EmuChunk(cores=4)
+    main, other = chunk.var(), chunk.var()
+
+    def body(index, thread):
+        if thread == chunk.MAIN_THREAD:
+            chunk.math(chunk.store_int(chunk.OPERATION_ADD), main, index, main)
+        else:
+            chunk.add_const(other, 1)
+
+    chunk.parallel_for(8, body, threads=[4])
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert chunk.targets == {2, 4}
+    assert (machine.memory[main[0]], machine.memory[other[0]]) == (sum(range(4)), 4)
+
+
+def test_empty():
+    chunk = EmuChunk()
+    chunk.parallel_for(0, lambda index, thread: chunk.exit())
+    chunk.parallel_for(-3, lambda index, thread: chunk.exit())
+    assert not chunk.code and not chunk.targets
+
+
+def test_outside_cores():
+    """Ядро вне cores не имеет места в стеке возвратов функций."""
+    chunk = EmuChunk(cores=2)
+    step = chunk.function(lambda: chunk.add_const(chunk.var(), 1))
+    chunk.parallel_for(6, lambda index, thread: chunk.call(step), threads=[2, 3, 5])
+    chunk.exit()
+    with pytest.raises(ValueError):
+        chunk.compile()
+
+
+def test_wait_barrier():
+    """Главное ядро ждет у барьера ядро, которое долго считает, и читает его результат."""
+    chunk = EmuChunk(cores=2)
+    barrier = chunk.barrier([2, 3])
+    result, copy = chunk.var(), chunk.var()
+    worker = chunk.label(reassign=True)
+    chunk.goto_thread(3, worker)
+    chunk.wait_barrier(barrier, 2)
+    chunk.copy(copy, result)
+    chunk.exit()
+    chunk.label(worker, inc_thread=True)
+    with chunk.for_range(50, thread=3):
+        chunk.add_const(result, 2)
+    chunk.arrive(barrier, 3)
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert machine.memory[copy[0]] == 100
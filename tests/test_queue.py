@@ -0,0 +1,58 @@
+"""
+Очередь команд видеоядра (EmuDisplay.alloc_queue): команды выполняются в порядке добавления со значениями
+переменных на момент добавления, при заполнении очереди ядро ждет, в эмуляторе и в схеме логики.
+"""
+import pytest
+
+from mindvm import EmuChunk, EmuDisplay
+from tests.simulate import compare
+
+
+def program(size: int) -> tuple[EmuChunk, EmuDisplay, object]:
+    chunk = EmuChunk()
+    display = EmuDisplay(chunk)
+    skip = chunk.label(reassign=True)
+    chunk.jump(skip, chunk.NON_ZERO)
+    queue = display.alloc_queue(size)
+    chunk.label(skip)
+    return chunk, display, queue
+
+
+@pytest.mark.parametrize("size", [2, 3, 8])
+def test_order(size):
+    """Кадров больше, чем мест в очереди: очередь проходит по кругу несколько раз."""
+    chunk, display, queue = program(size)
+    display.start_queue(queue)
+    with chunk.for_range(12) as index:
+        display.color(index, 0, 255)
+        display.rect(index, 1, 2, 3)
+        display.flush()
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert machine.video.history == [[("color", n, 0, 255, 255), ("rect", n, 1, 2, 3)] for n in range(12)]
+
+
+def test_flush_and_wait():
+    """Вывод через почтовый ящик выполняется после всех команд, добавленных в очередь раньше."""
+    chunk, display, queue = program(4)
+    x = chunk.var(1)
+    display.clear(0, 0, 0)
+    display.start_queue(queue)
+    for n in range(6):
+        display.rect(x, n, 1, 1)
+        chunk.add_const(x, 1)
+    display.flush_and_wait()
+    display.stroke(x)
+    display.flush()
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    assert machine.video.history == [
+        [("clear", 0, 0, 0)] + [("rect", n + 1, n, 1, 1) for n in range(6)],
+        [("stroke", 7)],
+    ]
+
+
+def test_size():
+    chunk = EmuChunk()
+    with pytest.raises(ValueError):
+        EmuDisplay(chunk).alloc_queue(1)
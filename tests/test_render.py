@@ -0,0 +1,100 @@
+"""
+Растеризация render.py: decode читает сопрограммы так же, как видеоядро эмулятора, render закрашивает
+пиксели фигур и считает перерисовку и перекрытые пиксели.
+"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import render
+from emulator import EmuVideo
+from mindvm import EmuChunk, EmuDisplay
+from tests.simulate import emulate
+
+SIZE = EmuDisplay.DISPLAY_SIZE
+
+
+def shaders() -> tuple[EmuChunk, list, list]:
+    """Сопрограммы с переменными, общим окончанием, в дополнительном банке и с SHADER_WATCH, и переменная x."""
+    chunk = EmuChunk(banks=2)
+    display = EmuDisplay(chunk)
+    x, y = chunk.var(12), chunk.var(-3)
+    tail = (("color", 255, 0, 0, 255), ("rect", x, y, 30, 40), ("line", 0, 0, x, 9), ("flush",))
+    skip = chunk.label(reassign=True)
+    chunk.jump(skip, chunk.NON_ZERO)
+    starts = [
+        display.shader(("clear", 1, 2, 3), ("stroke", 4), *tail),
+        display.shader(("clear", 4, 5, 6), *tail, bank=2),
+        display.shader(("poly", x, 50, 6, 20, y), ("triangle", 1, 2, x, 4, 5, y), *tail, cached=True),
+    ]
+    chunk.label(skip)
+    for n, start in enumerate(starts):
+        display.shader_map(n, start)
+        display.shader_exec(n)
+    chunk.exit()
+    return chunk, starts, x
+
+
+def test_decode():
+    chunk, starts, _ = shaders()
+    artifact = chunk.compile()
+    machine = emulate(artifact)
+    names = {command: name for command, (name, _) in EmuVideo.DRAW.items()}
+    for start, frame in zip(starts, machine.video.history):
+        commands = render.decode(artifact.words, start, artifact.far)
+        assert commands[-1] == (EmuDisplay.FLUSH,)
+        values = [(names[func], *(machine.memory[arg.address] if isinstance(arg, render.Ref) else arg
+                                  for arg in args)) for func, *args in commands[:-1]]
+        assert values == frame
+
+
+def test_decode_outside():
+    with pytest.raises(ValueError):
+        render.decode([0] * 10, 3 * EmuChunk.BANK_SIZE)
+
+
+def test_rect():
+    """Прямоугольник закрашивает w * h пикселей, строка 0 изображения - верх дисплея."""
+    renderer = render.Renderer()
+    renderer.draw("clear", 0, 0, 40)
+    renderer.draw("color", 255, 0, 0, 255)
+    stats = renderer.draw("rect", 10, 20, 30, 40)
+    image = renderer.image()
+    assert stats.pixels == 30 * 40 and stats.overdraw == 0
+    assert (image[SIZE - 60:SIZE - 20, 10:40] == [255, 0, 0]).all()
+    assert (image[SIZE - 20:, :] == [0, 0, 40]).all()
+    assert (image == [255, 0, 0]).all(axis=2).sum() == 30 * 40
+
+
+def test_overdraw_hidden():
+    renderer = render.Renderer()
+    renderer.draw("color", 0, 255, 0, 255)
+    first = renderer.draw("rect", 0, 0, 10, 10)
+    renderer.draw("color", 0, 0, 255, 128)
+    blended = renderer.draw("rect", 5, 0, 10, 10)
+    renderer.draw("color", 255, 255, 255, 255)
+    cover = renderer.draw("rect", 0, 0, 5, 10)
+    assert blended.overdraw == 5 * 10
+    assert cover.overdraw == 5 * 10
+    assert (first.hidden, blended.hidden) == (5 * 10, 0)
+    renderer.draw("flush")
+    assert renderer.draw("rect", 0, 0, 10, 10).overdraw == 0
+
+
+def test_render_bindings():
+    """Массив значений переменной - по кадру на значение, кадры рисуются пачками batch."""
+    chunk, starts, x = shaders()
+    artifact = chunk.compile()
+    frames, stats = render.render(artifact.words, starts[1], [(x, np.array([0, 50, 100]))], artifact.far, batch=2)
+    assert frames.shape == (3, SIZE, SIZE, 3)
+    red = (frames == [255, 0, 0]).all(axis=3)
+    # Строка дисплея y = 30 выше линии: первый красный пиксель - левый край прямоугольника
+    assert [int(np.flatnonzero(red[n, SIZE - 31])[0]) for n in range(3)] == [0, 50, 100]
+    rect = next(item for item in stats if item.name == "rect")
+    assert rect.frames == 3
+    assert "rect" in render.report(stats)
+
+
+def test_missing_binding():
+    with pytest.raises(ValueError):
+        render.Renderer().run([(EmuDisplay.RECT, render.Ref(40), 0, 1, 1)])
@@ -0,0 +1,152 @@
+"""
+Генератор схемы schematic.py: записанная схема читается обратно с теми же блоками, программами и связями,
+читатель проверяется на схеме scheme.msch, сохраненной игрой.
+"""
+import base64
+import io
+import struct
+import zlib
+
+import pytest
+
+import coregen
+import schematic
+from benchmarks.programs import PROGRAMS
+from mindvm import EmuChunk
+
+
+def read(stream, fmt: str) -> tuple:
+    return struct.unpack(fmt, stream.read(struct.calcsize(fmt)))
+
+
+def utf(stream) -> str:
+    (length,) = read(stream, ">H")
+    return stream.read(length).decode()
+
+
+def config(stream):
+    """Конфигурация блока TypeIO.readObject: программа процессора - (текст, {связь: (dx, dy)})."""
+    (kind,) = read(stream, ">b")
+    if kind == 0:
+        return None
+    if kind == 1:
+        return read(stream, ">i")[0]
+    if kind == 4:
+        return utf(stream) if read(stream, ">b")[0] else None
+    if kind == 5:
+        return read(stream, ">bh")
+    if kind == 8:
+        (count,) = read(stream, ">b")
+        return [read(stream, ">i")[0] for _ in range(count)]
+    if kind == 10:
+        return bool(read(stream, ">b")[0])
+    if kind == 14:
+        (length,) = read(stream, ">i")
+        data = io.BytesIO(zlib.decompress(stream.read(length)))
+        _, size = read(data, ">bi")
+        code = data.read(size).decode()
+        (count,) = read(data, ">i")
+        links = {utf(data): read(data, ">hh") for _ in range(count)}
+        assert not data.read()
+        return code, links
+    raise ValueError(f"Unsupported config type {kind}")
+
+
+def decode(data: bytes) -> tuple[tuple[int, int], dict, list[tuple]]:
+    """Размер, теги и блоки (имя, x, y, конфигурация, поворот) схемы .msch версии 1."""
+    assert data[:5] == b"msch\x01"
+    stream = io.BytesIO(zlib.decompress(data[5:]))
+    size = read(stream, ">hh")
+    (count,) = read(stream, ">b")
+    tags = dict((utf(stream), utf(stream)) for _ in range(count))
+    (count,) = read(stream, ">b")
+    names = [utf(stream) for _ in range(count)]
+    (count,) = read(stream, ">i")
+    blocks = []
+    for _ in range(count):
+        index, position = read(stream, ">bi")
+        value = config(stream)
+        (rotation,) = read(stream, ">b")
+        blocks.append((names[index], position >> 16, position & 0xFFFF, value, rotation))
+    assert not stream.read()
+    return size, tags, blocks
+
+
+def test_game_schematic():
+    size, tags, blocks = decode((schematic.ROOT / "scheme.msch").read_bytes())
+    assert tags["name"] == "GAME"
+    assert all(0 <= x < size[0] and 0 <= y < size[1] for _, x, y, _, _ in blocks)
+
+
+@pytest.mark.parametrize("cores, banks", [(1, 1), (4, 1), (6, 3), (9, 2)])
+def test_round_trip(cores, banks):
+    built = schematic.build(cores, banks, message="HELLO")
+    size, tags, blocks = decode(built.encode())
+    assert tags["name"] == f"MindVM {cores} cores"
+    left = min(x for block in built.blocks for x, _ in block.tiles)
+    bottom = min(y for block in built.blocks for _, y in block.tiles)
+    assert size == (max(x for block in built.blocks for x, _ in block.tiles) - left + 1,
+                    max(y for block in built.blocks for _, y in block.tiles) - bottom + 1)
+    assert len(blocks) == len(built.blocks)
+    for block, (name, x, y, value, rotation) in zip(built.blocks, blocks):
+        assert (name, x + left, y + bottom, rotation) == (block.name, block.x, block.y, block.rotation)
+        if isinstance(block.config, schematic.Program):
+            code, links = value
+            assert code == block.config.code
+            # Связи записаны смещениями от процессора и указывают на те же блоки
+            assert links == {link: (other.x - block.x, other.y - block.y)
+                             for link, other in block.config.links.items()}
+        else:
+            assert value == block.config
+
+
+def processors(built: schematic.Schematic) -> dict[str, list]:
+    programs = {}
+    for block in built.blocks:
+        if isinstance(block.config, schematic.Program):
+            programs.setdefault(block.name, []).append(block.config)
+    return programs
+
+
+@pytest.mark.parametrize("cores", [1, 5, 12])
+def test_cores(cores):
+    programs = processors(schematic.build(cores))
+    core = (schematic.ROOT / "buildings" / "core.masm").read_text()
+    assert [program.code for program in programs["hyper-processor"][1:]] == \
+           [coregen.for_thread(core, thread) for thread in range(EmuChunk.MAIN_THREAD, EmuChunk.MAIN_THREAD + cores)]
+    assert coregen.threads(cores) in [program.code for program in programs["micro-processor"]]
+
+
+def test_artifact():
+    """Загрузчики банков и количество ядер берутся из образа."""
+    artifact = PROGRAMS["shaders"]().compile()
+    built = schematic.build(artifact=artifact)
+    codes = [program.code for program in processors(built)["micro-processor"]]
+    assert all(text in codes for text in artifact.texts.values())
+    assert len(processors(built)["hyper-processor"]) == 1 + artifact.cores
+
+
+def test_write(tmp_path):
+    built = schematic.build(2)
+    built.write(tmp_path / "mindvm.msch")
+    data = (tmp_path / "mindvm.msch").read_bytes()
+    assert base64.b64decode((tmp_path / "mindvm.base64").read_text()) == data == built.encode()
+
+
+def test_validate():
+    s = schematic.Schematic("test")
+    cell = s.add("memory-cell", 0, 0)
+    s.processor("micro-processor", 20, 0, "end", cell1=cell)
+    with pytest.raises(ValueError):
+        s.encode()
+    s = schematic.Schematic("test")
+    s.add("memory-bank", 0, 0)
+    s.add("memory-cell", 1, 1)
+    with pytest.raises(ValueError):
+        s.validate()
+    s = schematic.Schematic("test")
+    s.processor("micro-processor", 0, 0, "end\n" * (schematic.MAX_INSTRUCTIONS + 1))
+    with pytest.raises(ValueError):
+        s.validate()
+    with pytest.raises(ValueError):
+        schematic.build(banks=EmuChunk.MAX_BANKS + 1)
@@ -0,0 +1,41 @@
+"""
+Сопрограммы shader(cached=True): повторное выполнение без изменений пропускается, изменение переменной,
+другой FLUSH или shader_exec(force=True) выводят кадр, в эмуляторе и в схеме логики.
+"""
+from mindvm import EmuChunk, EmuDisplay
+from tests.simulate import compare
+
+
+def test_watch():
+    chunk = EmuChunk()
+    display = EmuDisplay(chunk)
+    x = chunk.var(1)
+    skip = chunk.label(reassign=True)
+    chunk.jump(skip, chunk.NON_ZERO)
+    cached = display.shader(("clear", 0, 0, 0), ("rect", x, 2, 3, 4), ("flush",), cached=True)
+    plain = display.shader(("rect", 5, 6, x, 8), ("flush",))
+    stroke = display.shader(("stroke", 3))
+    chunk.label(skip)
+    display.shader_map(0, cached)
+    display.shader_map(1, plain)
+    display.shader_map(2, stroke)
+    display.shader_exec(0)  # Первое выполнение
+    display.shader_exec(0)  # Пропущено
+    display.shader_exec(0, force=True)
+    display.shader_exec(0)  # Пропущено
+    chunk.add_const(x, 1)
+    display.shader_exec(0)  # Изменилась переменная
+    display.shader_exec(1)  # Другой кадр на дисплее
+    display.shader_exec(0)
+    display.shader_exec(1, force=True)
+    display.shader_exec(0)
+    display.shader_exec(0)  # Пропущено
+    display.shader_exec(2, force=True)  # Без SHADER_WATCH и FLUSH, force не переходит к следующей
+    display.shader_exec(0)  # Пропущено
+    chunk.exit()
+    machine, _ = compare(chunk.compile())
+    first = [("clear", 0, 0, 0), ("rect", 1, 2, 3, 4)]
+    second = [("clear", 0, 0, 0), ("rect", 2, 2, 3, 4)]
+    other = [("rect", 5, 6, 2, 8)]
+    assert machine.video.history == [first, first, second, other, second, other, second]
+    assert machine.video.skipped == 4
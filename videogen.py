@@ -0,0 +1,238 @@
+"""
+Генератор программы видеоядра buildings/videocore.masm и таблицы переходов buildings/videocore_commands.masm
+по командам EmuDisplay.
+
+Видеоядро принимает команды двумя способами:
+- почтовый ящик по адресу EmuDisplay.ADDRESS: одна команда, ядро ждет подтверждения (-1 в ящике);
+- кольцевая очередь команд, включаемая командой QUEUE_START: ядра дописывают команды в хвост
+  инструкцией OP_DRAW и не ждут видеоядро, пока в очереди есть место.
+
+Команды очереди выполняются раньше почтового ящика, поэтому команда из ящика после команд в очереди
+(например, drawflush с ожиданием) выполняется после них.
+
+Команды читаются из банка mem: bank1, а на время сопрограммы, размещенной в дополнительном банке
+(EmuChunk.far_data), - из него. Ссылки оберток всегда читают bank1.
+
+SHADER_WATCH в начале сопрограммы сравнивает переменные из следующего за ней блока с их значениями
+при прошлом выполнении и счетчик FLUSH видеоядра с ожидаемым. Если ничего не изменилось, дисплей уже
+показывает кадр сопрограммы, и она завершается сразу. SHADER_FORCE выполняет сопрограмму без этой проверки.
+
+Запуск: python videogen.py - перезаписывает файлы в buildings.
+"""
+from pathlib import Path
+
+from coregen import CoreProgram
+from mindvm import EmuChunk, EmuDisplay
+
+BUILDINGS = Path(__file__).parent / "buildings"
+
+# Строки логики команд draw
+DRAW = {
+    EmuDisplay.CLEAR: "draw clear arg1 arg2 arg3 255 0 0",
+    EmuDisplay.COLOR: "draw color arg1 arg2 arg3 arg4 0 0",
+    EmuDisplay.STROKE: "draw stroke arg1 arg2 arg3 arg4 0 0",
+    EmuDisplay.LINE: "draw line arg1 arg2 arg3 arg4 0 0",
+    EmuDisplay.RECT: "draw rect arg1 arg2 arg3 arg4 0 0",
+    EmuDisplay.LINE_RECT: "draw lineRect arg1 arg2 arg3 arg4 0 0",
+    EmuDisplay.POLY: "draw poly arg1 arg2 arg3 arg4 arg5 0",
+    EmuDisplay.LINE_POLY: "draw linePoly arg1 arg2 arg3 arg4 arg5 0",
+    EmuDisplay.TRIANGLE: "draw triangle arg1 arg2 arg3 arg4 arg5 arg6",
+    EmuDisplay.IMAGE: "draw image arg1 arg2 arg3 arg4 arg5 arg6",
+    EmuDisplay.FLUSH: "drawflush display1",
+}
+
+TABLE_SIZE = 64  # Размер ячейки с таблицей переходов, все строки заполняются
+
+# Стоимость чтения команды до диспетчеризации в инструкциях логики, должна совпадать с текстом _args() и _wrap()
+COST_FULL = 16  # read func, jump, 6 аргументов по 2 инструкции, шаг, диспетчеризация
+COST_WRAP = 7  # read func, jump, чтение номера команды, переход к диспетчеризации, диспетчеризация
+COST_WRAP_ARG = 4  # Чтение аргумента обертки с проверками конца и знака
+COST_WRAP_REF = 2  # Чтение значения по ссылке
+COST_WRAP_END = 3  # Чтение SHADER_WRAP_END, если аргументов меньше 6
+
+
+def _args(p: CoreProgram):
+    """Чтение номера команды и шести аргументов начиная с index."""
+    p.label("command")
+    p.emit("read func mem index")
+    p.label("decode")
+    p.emit(f"jump {{wrap}} equal func {EmuDisplay.SHADER_WRAP}")
+    for n in range(1, 7):
+        p.emit("op add index index 1", f"read arg{n} mem index")
+    p.emit("op add index index 1")
+    p.label("dispatch")
+    p.emit("read @counter commands func")
+
+
+def _wrap(p: CoreProgram):
+    """Обертка сопрограммы: аргументы до SHADER_WRAP_END, отрицательные - ссылки на память."""
+    p.label("wrap")
+    p.emit("op add index index 1", "read func mem index")
+    for n in range(1, 7):
+        p.emit(
+            "op add index index 1",
+            f"read arg{n} mem index",
+            f"jump {{wrap_end}} equal arg{n} {EmuDisplay.SHADER_WRAP_END}",
+            f"jump {{wrap_{n}}} greaterThanEq arg{n} 0",
+            f"op abs addr arg{n} 1",
+            f"read arg{n} bank1 addr",
+        )
+        p.label(f"wrap_{n}")
+    p.label("wrap_end")
+    p.emit("op add index index 1", "jump {dispatch} always 0 0")
+
+
+def _watch(p: CoreProgram):
+    """
+    SHADER_WATCH: блок (количество переменных, FLUSH в сопрограмме, ожидаемый счетчик FLUSH, пары -адрес и снимок)
+    начинается с index. Снимок обновляется, при отсутствии изменений сопрограмма завершается.
+    """
+    p.label("shader_watch")
+    p.emit(
+        "read count mem index",
+        "op add index index 1",
+        "read flush_count mem index",
+        "op add index index 1",
+        "read frame mem index",
+        "set header index",
+        "op notEqual changed frame flushes",
+        "op or changed changed force",
+        "set force 0",
+        "op mul end count 2",
+        "op add end end index",
+    )
+    p.label("watch_next")
+    p.emit(
+        "jump {watch_done} greaterThanEq index end",
+        "op add index index 1",
+        "read addr mem index",
+        "op abs addr addr 1",
+        "read value bank1 addr",
+        "op add index index 1",
+        "read snap mem index",
+        "jump {watch_next} equal value snap",
+        "write value mem index",
+        "set changed 1",
+        "jump {watch_next} always 0 0",
+    )
+    p.label("watch_done")
+    # Ожидаемый счетчик FLUSH обновляется, только если сопрограмма выполняется и выводит кадры
+    p.emit(
+        "op add index index 1",
+        "jump {shader_end} equal changed 0",
+        "op add frame flushes flush_count",
+        "write frame mem header",
+        "set @counter ret",
+    )
+
+
+def generate() -> tuple[str, str]:
+    """Текст программы видеоядра и программы, заполняющей таблицу переходов."""
+    p = CoreProgram()
+    p.emit("set shaders cell1", "set commands cell2", "set mem bank1")
+    # Подтверждение команды почтового ящика
+    p.label("ack")
+    p.emit(f"write {EmuDisplay.NO_COMMAND} bank1 {EmuDisplay.ADDRESS}")
+    p.label("poll")
+    p.emit(
+        "jump {mailbox} equal queue 0",
+        "read tail bank1 queue",
+        "jump {mailbox} equal tail head",
+        f"op mul index head {EmuDisplay.QUEUE_SLOT}",
+        "op add index index slots",
+        "set ret {queue_next}",
+        "jump {command} always 0 0",
+    )
+    p.label("mailbox")
+    p.emit(
+        f"read func bank1 {EmuDisplay.ADDRESS}",
+        f"jump {{poll}} equal func {EmuDisplay.NO_COMMAND}",
+        f"set index {EmuDisplay.ADDRESS}",
+        "set ret {ack}",
+        "jump {decode} always 0 0",
+    )
+    _args(p)
+
+    handlers = {}
+    for command, line in DRAW.items():
+        handlers[command] = f"draw_{command}"
+        p.label(f"draw_{command}")
+        p.emit(line)
+        if command == EmuDisplay.FLUSH:
+            p.emit("op add flushes flushes 1")  # Счетчик FLUSH для SHADER_WATCH
+        p.emit("set @counter ret")
+
+    handlers[EmuDisplay.SHADER_MAP] = "shader_map"
+    p.label("shader_map")
+    p.emit("write arg2 shaders arg1", "set @counter ret")
+
+    # Команды сопрограммы возвращаются к чтению следующей команды, SHADER_END - к источнику SHADER_EXEC
+    handlers[EmuDisplay.SHADER_FORCE] = "shader_force"
+    p.label("shader_force")
+    p.emit("set force 1")
+    handlers[EmuDisplay.SHADER_EXEC] = "shader_exec"
+    p.label("shader_exec")
+    p.emit(
+        "read index shaders arg1",
+        "set outer ret",
+        "set ret {command}",
+        f"jump {{command}} lessThan index {EmuChunk.BANK_SIZE}",
+        # Сопрограмма в дополнительном банке: выбор банка переходом по таблице
+        f"op idiv mb index {EmuChunk.BANK_SIZE}",
+        f"op mod index index {EmuChunk.BANK_SIZE}",
+        f"jump {{shader_end}} greaterThanEq mb {EmuChunk.MAX_BANKS}",
+        "op mul mb mb 2",
+        "op add @counter mb {shader_banks}",
+    )
+    p.label("shader_banks")
+    for bank in range(1, EmuChunk.MAX_BANKS + 1):
+        p.emit(f"set mem bank{bank}", "jump {command} always 0 0")
+    # Переход внутри банка сопрограммы
+    handlers[EmuDisplay.SHADER_JUMP] = "shader_jump"
+    p.label("shader_jump")
+    p.emit(f"op mod index arg1 {EmuChunk.BANK_SIZE}", "set @counter ret")
+    handlers[EmuDisplay.SHADER_END] = "shader_end"
+    handlers[EmuDisplay.SHADER_WATCH] = "shader_watch"
+    p.label("shader_end")
+    # SHADER_FORCE действует только на выполняемую сопрограмму, даже если она без SHADER_WATCH
+    p.emit("set mem bank1", "set force 0", "set @counter outer")
+    _watch(p)
+
+    # Очередь: хвост, голова, количество мест, места по QUEUE_SLOT слов
+    handlers[EmuDisplay.QUEUE_START] = "queue_start"
+    p.label("queue_start")
+    p.emit(
+        "set queue arg1",
+        "op add queue_head queue 1",
+        "read head bank1 queue_head",
+        "op add slots queue 2",
+        "read size bank1 slots",
+        "op add slots queue 3",
+        "set @counter ret",
+    )
+    p.label("queue_next")
+    p.emit(
+        "op add head head 1",
+        "op mod head head size",
+        "write head bank1 queue_head",
+        "jump {poll} always 0 0",
+    )
+    _wrap(p)
+
+    # Неизвестные команды пропускаются
+    p.label("skip")
+    p.emit("set @counter ret")
+
+    commands = [f"write {p.labels[handlers.get(n, 'skip')]} cell1 {n}" for n in range(TABLE_SIZE)]
+    commands.append("wait 5")
+    return p.text(), "\n".join(commands)
+
+
+def write(directory: Path = BUILDINGS):
+    video, commands = generate()
+    (directory / "videocore.masm").write_text(video + "\n")
+    (directory / "videocore_commands.masm").write_text(commands + "\n")
+
+
+if __name__ == "__main__":
+    write()